@@ -1,28 +1,177 @@
+import datetime as dt
+import hashlib
 from pathlib import Path
-from typing import cast
+from typing import Any
 
-from django.http import HttpRequest
-from django.shortcuts import get_object_or_404
-from ninja import Router
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
+from ninja import Query, Router
+from ninja.errors import HttpError
 
-from backend.activity.dto import ActivitySchema, OffloadActivityForm
-from backend.activity.models import Activity
-from backend.activity.service import copy_data
-from backend.activity.tasks import copy_task, preprocess_task, remove_task
+from backend.activity.changes import (
+    clear_activities,
+    deleted_since,
+    get_version,
+    remove_activities,
+)
+from backend.activity.dto import (
+    ActivityChangesSchema,
+    ActivitySchema,
+    CopyThrottleSchema,
+    OffloadActivityForm,
+    OffloadProgressSchema,
+    OffloadSchema,
+    RetryActivitiesForm,
+    RetryActivitiesSchema,
+)
+from backend.activity.events import stream_events
+from backend.activity.models import Activity, ActivityVersion, CopyThrottle, Offload
+from backend.activity.service import (
+    MAX_PAGE_SIZE,
+    copy_data,
+    list_activity_page,
+    retry_activities,
+)
 from backend.project.models import Project
-from celery.canvas import chain
 
 router = Router()
 
 
+def check_version(
+    request: HttpRequest, response: HttpResponse, project_id: str
+) -> tuple[ActivityVersion, HttpResponse | None]:
+    """Set the ETag/Last-Modified headers of an activity listing from the project change counter.
+
+    The ETag covers the normalised query string too, as each filter and page of the listing
+    is a different representation; only it is used to answer with a 304, since an
+    If-Modified-Since check cannot tell the pages of a listing apart.
+
+    Raises:
+        Http404: the project id is not a number
+
+    Returns:
+        tuple[ActivityVersion, HttpResponse | None]: (change counter, 304 response if the
+        client's copy is current)
+    """
+    if not project_id.isdigit():
+        raise Http404(f"No project {project_id}")
+    state = get_version(int(project_id))
+    query = urlencode(
+        sorted((key, value) for key, values in request.GET.lists() for value in values)
+    )
+    digest = hashlib.blake2b(query.encode(), digest_size=8).hexdigest()
+    etag = quote_etag(f"{project_id}-{state.version}-{digest}")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(state.modified.timestamp())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+    return state, not_modified
+
+
 @router.get(
     "/{project_id}",
     response=list[ActivitySchema],
-    summary="List all activities associated with a project",
+    summary="List the activities associated with a project, newest first",
 )
-def list_activities(request: HttpRequest, project_id: str) -> list[Activity]:
+def list_activities(
+    request: HttpRequest,
+    response: HttpResponse,
+    project_id: str,
+    status: Activity.StatusChoices | None = None,
+    activity: Activity.ActivityChoices | None = None,
+    filename_prefix: str | None = None,
+    updated_since: dt.datetime | None = None,
+    cursor: str | None = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    include_error_log: bool = False,
+) -> list[dict[str, Any]] | HttpResponse:
+    _, not_modified = check_version(request, response, project_id)
+    if not_modified is not None:
+        return not_modified
     project = get_object_or_404(Project, pk=project_id)
-    return cast("list[Activity]", project.activity_set.all())  # pyright: ignore[reportAttributeAccessIssue]
+    page, next_cursor = list_activity_page(
+        project,
+        status=status,
+        activity=activity,
+        filename_prefix=filename_prefix,
+        updated_since=updated_since,
+        cursor=cursor,
+        limit=limit,
+        include_error_log=include_error_log,
+    )
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return page
+
+
+@router.get(
+    "/{project_id}/changes",
+    response=ActivityChangesSchema,
+    summary="List the activities of a project written or deleted since the previous poll",
+)
+def list_activity_changes(
+    request: HttpRequest,
+    response: HttpResponse,
+    project_id: str,
+    updated_since: dt.datetime,
+    cursor: str | None = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    include_error_log: bool = False,
+) -> dict[str, Any] | HttpResponse:
+    state, not_modified = check_version(request, response, project_id)
+    if not_modified is not None:
+        return not_modified
+    project = get_object_or_404(Project, pk=project_id)
+    deleted, reset = deleted_since(state, updated_since)
+    page, next_cursor = [], None
+    if not reset:
+        page, next_cursor = list_activity_page(
+            project,
+            updated_since=updated_since,
+            cursor=cursor,
+            limit=limit,
+            include_error_log=include_error_log,
+        )
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return {
+        "activities": page,
+        "deleted": deleted,
+        "reset": reset,
+        "version": state.version,
+        "modified": state.modified,
+    }
+
+
+@router.get(
+    "/{project_id}/events",
+    summary="Stream the activity state transitions of a project as Server-Sent Events",
+)
+async def stream_activity_events(
+    request: HttpRequest,
+    project_id: int,
+    last_event_id: int | None = Query(None, description="Resume token (Last-Event-ID header)"),
+) -> StreamingHttpResponse:
+    await aget_object_or_404(Project, pk=project_id)
+    if last_event_id is None and request.headers.get("Last-Event-ID", "").isdigit():
+        last_event_id = int(request.headers["Last-Event-ID"])
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(
+            stream_events(project_id, last_event_id), content_type="text/event-stream"
+        )
+    else:
+        # Only an ASGI server can keep the stream open without holding a worker thread:
+        # send the pending events and let the client reconnect
+        events = [message async for message in stream_events(project_id, last_event_id, 0)]
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @router.get(
@@ -36,31 +185,89 @@ def get_activity(request: HttpRequest, activity_id: str) -> Activity:
 
 @router.post(
     "/offload/{project_id}",
+    response=OffloadSchema,
     summary="Perform data offloading",
 )
-def offload_data(request: HttpRequest, project_id: str, form_data: OffloadActivityForm) -> None:
+def offload_data(request: HttpRequest, project_id: str, form_data: OffloadActivityForm) -> Offload:
     project = get_object_or_404(Project, pk=project_id)
-    copy_data(
+    return copy_data(
         src=[Path(p) for p in form_data.src_files],
         project=project,
     )
 
 
+@router.get(
+    "/offload/job/{offload_id}",
+    response=OffloadSchema,
+    summary="Get the discovery status of an offload",
+)
+def get_offload(request: HttpRequest, offload_id: int) -> Offload:
+    return get_object_or_404(Offload, pk=offload_id)
+
+
+@router.get(
+    "/offload/job/{offload_id}/progress",
+    response=OffloadProgressSchema,
+    summary="Get the file, byte and stage counters of an offload, with throughput and ETA",
+)
+def get_offload_progress(request: HttpRequest, offload_id: int) -> Offload:
+    return get_object_or_404(Offload, pk=offload_id)
+
+
+@router.get(
+    "/copy/throttle",
+    response=CopyThrottleSchema,
+    summary="Get the copy bandwidth limit of each copy worker process",
+)
+def get_copy_throttle(request: HttpRequest) -> dict[str, int]:
+    row = CopyThrottle.objects.filter(pk=1).first()
+    rate = row.bytes_per_second if row is not None else settings.PHENOMATE_COPY_MAX_RATE
+    return {"bytes_per_second": rate}
+
+
+@router.put(
+    "/copy/throttle",
+    response=CopyThrottleSchema,
+    summary="Set the copy bandwidth limit of each copy worker process (0: no limit)",
+)
+def set_copy_throttle(request: HttpRequest, form_data: CopyThrottleSchema) -> CopyThrottle:
+    # Workers pick the new limit up within PHENOMATE_COPY_THROTTLE_REFRESH seconds
+    row, _ = CopyThrottle.objects.update_or_create(
+        pk=1, defaults={"bytes_per_second": form_data.bytes_per_second}
+    )
+    return row
+
+
 @router.post(
     "/retry/{activity_id}",
     summary="Restart FAILED/QUEUED job",
 )
 def restart_activity(request: HttpRequest, activity_id: int) -> None:
-    log = get_object_or_404(Activity, pk=activity_id)
-    if log.activity == Activity.ActivityChoices.COPIED:
-        task = chain(copy_task.si(log.pk), preprocess_task.s(), remove_task.s())
-    elif log.activity == Activity.ActivityChoices.PREPROCESSED:
-        task = chain(preprocess_task.s(log.pk), remove_task.s())
-    elif log.activity == Activity.ActivityChoices.REMOVED:
-        task = chain(remove_task.s(log.pk))
-    else:
-        raise ValueError(f"Invalid activity: {log.activity}")
-    task.delay()
+    get_object_or_404(Activity, pk=activity_id)
+    # An explicit retry of a queued job does not wait for it to go stale
+    if not retry_activities(Activity.objects.filter(pk=activity_id), stale_after=0):
+        raise HttpError(409, f"Activity {activity_id} is not FAILED/QUEUED")
+
+
+@router.post(
+    "/project/{project_id}/retry",
+    response=RetryActivitiesSchema,
+    summary="Restart the FAILED/QUEUED jobs of a project matching a filter",
+)
+def retry_project_activities(
+    request: HttpRequest, project_id: int, form_data: RetryActivitiesForm
+) -> dict[str, int]:
+    project = get_object_or_404(Project, pk=project_id)
+    queryset = Activity.objects.filter(project=project, status__in=form_data.status)
+    if form_data.activity:
+        queryset = queryset.filter(activity=form_data.activity)
+    if form_data.filename_prefix:
+        queryset = queryset.filter(filename__startswith=form_data.filename_prefix)
+    if form_data.offload_id is not None:
+        queryset = queryset.filter(offload_id=form_data.offload_id)
+    if form_data.ids is not None:
+        queryset = queryset.filter(pk__in=form_data.ids)
+    return {"retried": retry_activities(queryset)}
 
 
 @router.delete(
@@ -68,14 +275,14 @@ def restart_activity(request: HttpRequest, activity_id: int) -> None:
     summary="Remove an activity log",
 )
 def cancel_activity(request: HttpRequest, activity_id: int) -> None:
-    log = get_object_or_404(Activity, pk=activity_id)
-    log.delete()
+    get_object_or_404(Activity, pk=activity_id)
+    remove_activities(Activity.objects.filter(pk=activity_id))
 
 
 @router.delete("/", summary="Remove multiple activity logs")
 def delete_activities(request: HttpRequest, activity_ids: list[int]) -> None:
     to_remove = set(activity_ids)
-    Activity.objects.filter(pk__in=to_remove).delete()
+    remove_activities(Activity.objects.filter(pk__in=to_remove))
 
 
 @router.delete(
@@ -83,4 +290,4 @@ def delete_activities(request: HttpRequest, activity_ids: list[int]) -> None:
 )
 def delete_project_activities(request: HttpRequest, project_id: int) -> None:
     project = get_object_or_404(Project, pk=project_id)
-    project.activity_set.all().delete()  # pyright: ignore[reportAttributeAccessIssue]
+    clear_activities(project)
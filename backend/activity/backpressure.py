@@ -0,0 +1,111 @@
+"""Disk space admission control and copy bandwidth throttling.
+
+Offloads are admitted against the free space of the project volume: discovery only queues
+files while the bytes already waiting to be copied into the project, plus the new files,
+plus ``PHENOMATE_DISK_FREE_MARGIN`` bytes fit in the free space, and the copy stage checks
+the space again before each file. Files that do not fit fail with a clear error before any
+byte is written instead of with ``ENOSPC`` half way through.
+
+Copies can be limited to a number of bytes per second per worker process with
+:data:`copy_throttle`. The limit is read from the :class:`CopyThrottle` row, so that it can
+be changed from the API while offloads run, and falls back to ``PHENOMATE_COPY_MAX_RATE``.
+"""
+
+from __future__ import annotations
+
+import errno
+import shutil
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db.models import Sum
+
+from backend.activity.models import CopyThrottle, Offload
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from backend.project.models import Project
+
+
+class InsufficientSpace(OSError):
+    """Raised when a file does not fit in the free space of the project volume."""
+
+    def __init__(self, path: Path | str, needed: int, free: int) -> None:
+        super().__init__(
+            errno.ENOSPC,
+            f"Not enough free space in {path}: {needed} bytes needed, {free} bytes free",
+        )
+
+
+def free_space(path: Path | str) -> int:
+    """Free bytes on the volume holding ``path``, less ``PHENOMATE_DISK_FREE_MARGIN``."""
+    margin = getattr(settings, "PHENOMATE_DISK_FREE_MARGIN", 1024 * 1024 * 1024)
+    return shutil.disk_usage(path).free - margin
+
+
+def queued_bytes(project: Project) -> int:
+    """Bytes waiting to be copied into ``project`` by all its offloads."""
+    total = Offload.objects.filter(project=project).aggregate(total=Sum("copy_queued_bytes"))
+    return max(total["total"] or 0, 0)
+
+
+def check_free_space(path: Path | str, needed: int) -> None:
+    """Make sure ``needed`` bytes can be written under ``path``.
+
+    Raises:
+        InsufficientSpace: the volume does not have enough free space
+    """
+    free = free_space(path)
+    if needed > free:
+        raise InsufficientSpace(path, needed, max(free, 0))
+
+
+class Throttle:
+    """Token bucket shared by the copy threads of a worker process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._checked: float | None = None
+        self._tokens = 0.0
+        self._last = time.monotonic()
+
+    @property
+    def rate(self) -> int:
+        """Current limit in bytes per second (0: unlimited), refreshed every few seconds."""
+        interval = getattr(settings, "PHENOMATE_COPY_THROTTLE_REFRESH", 5.0)
+        now = time.monotonic()
+        if self._checked is None or now - self._checked >= interval:
+            self._checked = now
+            row = CopyThrottle.objects.filter(pk=1).first()
+            self._rate = (
+                row.bytes_per_second
+                if row is not None
+                else getattr(settings, "PHENOMATE_COPY_MAX_RATE", 0)
+            )
+        return self._rate
+
+    def reset(self) -> None:
+        """Re-read the limit on the next copied chunk."""
+        self._checked = None
+
+    def consume(self, nbytes: int) -> None:
+        """Account for ``nbytes`` copied, sleeping as long as needed to keep to the limit."""
+        rate = self.rate
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow bursts of up to one second of transfer
+            self._tokens = min(float(rate), self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= nbytes
+            delay = -self._tokens / rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+copy_throttle = Throttle()
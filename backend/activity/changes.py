@@ -0,0 +1,177 @@
+"""Change tracking of the activity log of each project.
+
+Every write to the activities of a project bumps its :class:`ActivityVersion`, which backs
+the ETag and Last-Modified headers of the activity listing, and every deletion leaves a
+:class:`DeletedActivity` tombstone, so that pollers can ask for the rows changed or deleted
+since their last poll instead of reloading the whole log. Writes and deletions are also
+appended to the :class:`ActivityEvent` log streamed to clients.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import time
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.activity.models import Activity, ActivityEvent, ActivityVersion, DeletedActivity
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from django.db.models import QuerySet
+
+    from backend.project.models import Project
+
+# Keep IN (...) queries and bulk inserts below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+# Seconds between two prunes of expired events and tombstones by the same process
+PRUNE_INTERVAL = 60.0
+
+_last_prune = 0.0
+
+
+def tombstone_ttl() -> dt.timedelta:
+    return dt.timedelta(seconds=getattr(settings, "PHENOMATE_ACTIVITY_TOMBSTONE_TTL", 24 * 60 * 60))
+
+
+def changes_after(since: dt.datetime) -> dt.datetime:
+    """Lower bound of the rows to return to a client that polled at ``since``.
+
+    Rows are stamped before their transaction commits, so a row stamped just before a poll
+    may only become visible after it; polls overlap by a few seconds to catch those rows.
+    """
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    overlap = getattr(settings, "PHENOMATE_ACTIVITY_CHANGES_OVERLAP", 2.0)
+    return since - dt.timedelta(seconds=overlap)
+
+
+def bump_version(project_ids: Iterable[int], cleared: bool = False) -> None:
+    """Record a change to the activities of the given projects.
+
+    Args:
+        project_ids (Iterable[int]): projects whose activities were written
+        cleared (bool, optional): all the activities of the projects were deleted
+    """
+    now = timezone.now()
+    changes = {"version": F("version") + 1, "modified": now}
+    if cleared:
+        changes["cleared"] = now
+    for project_id in set(project_ids):
+        if ActivityVersion.objects.filter(project_id=project_id).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                ActivityVersion.objects.create(
+                    project_id=project_id, version=1, modified=now, cleared=now if cleared else None
+                )
+        except IntegrityError:
+            # Created concurrently
+            ActivityVersion.objects.filter(project_id=project_id).update(**changes)
+
+
+def record_writes(logs: Iterable[Activity]) -> None:
+    """Append the current state of freshly written activities to the event log.
+
+    Args:
+        logs (Iterable[Activity]): activities just inserted or updated
+    """
+    logs = list(logs)
+    if not logs:
+        return
+    ActivityEvent.objects.bulk_create(
+        ActivityEvent(
+            project_id=log.project_id,
+            activity_pk=log.pk,
+            activity=log.activity,
+            status=log.status,
+        )
+        for log in logs
+    )
+    bump_version(log.project_id for log in logs)
+    prune()
+
+
+def prune() -> None:
+    """Drop events and tombstones older than ``PHENOMATE_ACTIVITY_TOMBSTONE_TTL`` seconds."""
+    global _last_prune  # noqa: PLW0603
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    expired = timezone.now() - tombstone_ttl()
+    ActivityEvent.objects.filter(created__lt=expired).delete()
+    DeletedActivity.objects.filter(deleted__lt=expired).delete()
+
+
+def get_version(project_id: int) -> ActivityVersion:
+    """Current change counter of a project (version 0 if its activities were never written)."""
+    try:
+        return ActivityVersion.objects.get(project_id=project_id)
+    except ActivityVersion.DoesNotExist:
+        return ActivityVersion(project_id=project_id)
+
+
+def remove_activities(queryset: QuerySet[Activity]) -> int:
+    """Delete activities and leave a tombstone for each of them.
+
+    Returns:
+        int: number of activities deleted
+    """
+    rows = list(queryset.values_list("pk", "project_id"))
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start : start + CHUNK_SIZE]
+        Activity.objects.filter(pk__in=[pk for pk, _ in chunk]).delete()
+        DeletedActivity.objects.bulk_create(
+            DeletedActivity(project_id=project_id, activity_pk=pk) for pk, project_id in chunk
+        )
+        ActivityEvent.objects.bulk_create(
+            ActivityEvent(
+                project_id=project_id, activity_pk=pk, kind=ActivityEvent.KindChoices.DELETED
+            )
+            for pk, project_id in chunk
+        )
+    if rows:
+        bump_version(project_id for _, project_id in rows)
+    prune()
+    return len(rows)
+
+
+def clear_activities(project: Project) -> None:
+    """Delete all the activities of a project.
+
+    No tombstones are written: pollers asking for changes since before the removal are
+    told to reload instead.
+    """
+    Activity.objects.filter(project=project).delete()
+    DeletedActivity.objects.filter(project=project).delete()
+    ActivityEvent.objects.create(project=project, kind=ActivityEvent.KindChoices.CLEARED)
+    bump_version([project.pk], cleared=True)
+
+
+def deleted_since(state: ActivityVersion, since: dt.datetime) -> tuple[list[int], bool]:
+    """Activities of a project deleted after ``since``.
+
+    Args:
+        state (ActivityVersion): change counter of the project
+        since (dt.datetime): ``modified`` time returned by the previous poll
+
+    Returns:
+        tuple[list[int], bool]: (deleted activity ids, whether the client must reload
+        because the tombstones it needs were pruned or the whole log was cleared)
+    """
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    if since < timezone.now() - tombstone_ttl():
+        return [], True
+    # Times are sent to clients with millisecond precision
+    if state.cleared and state.cleared - since >= dt.timedelta(milliseconds=1):
+        return [], True
+    deleted = DeletedActivity.objects.filter(
+        project_id=state.project_id, deleted__gte=changes_after(since)
+    )
+    return list(deleted.values_list("activity_pk", flat=True)), False
@@ -0,0 +1,437 @@
+"""Copy engines used by the offload pipeline.
+
+An engine copies a single source file to a destination file path and reports how many
+bytes were moved and how long it took. The engine in use is selected with the
+``PHENOMATE_COPY_ENGINE`` setting, which accepts one of the names registered in
+:data:`ENGINES` or a dotted path to a :class:`CopyEngine` subclass. An optional throttle
+callback is called with the size of every chunk transferred and may sleep to limit the
+copy rate. A digest passed to :meth:`CopyEngine.copy` is fed the content of the file as it
+is copied, so that the copy can be verified without reading the source again.
+
+Copies are written to a temporary file next to the destination and renamed over it once
+complete, so that the destination path never holds a partial copy.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+DEFAULT_CHECKPOINT_BYTES = 256 * 1024 * 1024
+PARTIAL_SUFFIX = ".partial"
+TEMP_SUFFIX = ".tmp"
+
+# Errors raised by copy_file_range/sendfile when the kernel (or the file system pair,
+# e.g. a WSL/9p bind mount) does not support an in-kernel copy.
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+
+class CopyNotSupported(OSError):
+    """Raised by an engine when its copy primitive cannot be used for a file pair."""
+
+
+class CopyInProgress(OSError):
+    """Raised when the partial file of a resumable copy is being written by another task."""
+
+
+class IncompleteCopy(OSError):
+    """Raised when fewer bytes than the size of the source file were copied."""
+
+    def __init__(self, src: Path, copied: int, size: int) -> None:
+        super().__init__(errno.EIO, f"Copied {copied} of the {size} bytes of {src}")
+
+
+@dataclass
+class CopyResult:
+    bytes_copied: int
+    seconds: float
+    engine: str
+    resumed_from: int = 0
+    # Hex digest of the source content, when one was requested
+    digest: str = ""
+
+    @property
+    def size(self) -> int:
+        """Size of the destination file, including bytes copied by an earlier attempt."""
+        return self.resumed_from + self.bytes_copied
+
+    @property
+    def throughput(self) -> float:
+        """Average copy rate in bytes per second."""
+        if self.seconds <= 0:
+            return float(self.bytes_copied)
+        return self.bytes_copied / self.seconds
+
+
+class CopyEngine:
+    """Base copy engine.
+
+    Subclasses implement :meth:`transfer`, which moves ``count`` bytes between two open
+    file descriptors starting at ``offset``. :meth:`copy` takes care of opening the files,
+    timing the copy and preserving file metadata the same way ``shutil.copy2`` does.
+    A transfer that cannot copy a single byte raises :class:`CopyNotSupported`; a copy
+    that stops short of the source size raises :class:`IncompleteCopy`.
+    """
+
+    name = "base"
+
+    def __init__(
+        self, buffer_size: int | None = None, throttle: Callable[[int], None] | None = None
+    ) -> None:
+        self.buffer_size = buffer_size or getattr(
+            settings, "PHENOMATE_COPY_BUFFER_SIZE", DEFAULT_BUFFER_SIZE
+        )
+        self.throttle = throttle
+        # Digest fed by engines that see the data in user space while copying
+        self.digest: hashlib.blake2b | None = None
+
+    def transfer(self, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+        raise NotImplementedError
+
+    def copy(self, src: Path, dst: Path, digest: hashlib.blake2b | None = None) -> CopyResult:
+        """Copy ``src`` to the file path ``dst`` and preserve its metadata.
+
+        Args:
+            src (Path): source file
+            dst (Path): destination file path (not directory)
+            digest (hashlib.blake2b | None, optional): hash to feed the copied content to.
+            Engines that copy in the kernel hash the source once the copy is done, while
+            it is still in the page cache.
+
+        Raises:
+            IncompleteCopy: the copy stopped before the end of the source
+
+        Returns:
+            CopyResult: bytes copied, elapsed time, the engine that did the copy and the
+            hex digest of the content if requested
+        """
+        start = time.perf_counter()
+        self.digest = digest
+        fd, name = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=TEMP_SUFFIX, dir=dst.parent)
+        tmp = Path(name)
+        try:
+            with src.open("rb") as fsrc, os.fdopen(fd, "wb") as fdst:
+                size = os.fstat(fsrc.fileno()).st_size
+                copied = self.transfer(fsrc.fileno(), fdst.fileno(), 0, size)
+                if copied != size:
+                    raise IncompleteCopy(src, copied, size)
+                if digest is not None and not self.hashes_inline:
+                    self._hash_range(fsrc.fileno(), digest, 0, copied)
+            shutil.copystat(src, tmp)
+            tmp.replace(dst)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                tmp.unlink(missing_ok=True)
+            raise
+        finally:
+            self.digest = None
+        return CopyResult(
+            bytes_copied=copied,
+            seconds=time.perf_counter() - start,
+            engine=self.engine_name,
+            digest=digest.hexdigest() if digest is not None else "",
+        )
+
+    @property
+    def hashes_inline(self) -> bool:
+        """Whether the last transfer fed :attr:`digest` with the data it copied."""
+        return False
+
+    @property
+    def engine_name(self) -> str:
+        """Name of the engine that performed the last transfer."""
+        return self.name
+
+    def copy_resumable(
+        self,
+        src: Path,
+        dst: Path,
+        offset: int = 0,
+        checkpoint_hash: str = "",
+        on_checkpoint: Callable[[int, str], None] | None = None,
+    ) -> CopyResult:
+        """Copy ``src`` to ``dst`` through a ``.partial`` file, checkpointing as it goes.
+
+        Data is transferred in segments of ``PHENOMATE_COPY_CHECKPOINT_BYTES``. After each
+        segment the partial file is flushed to disk and ``on_checkpoint`` receives the
+        offset reached and a running hash of the destination bytes (seeded with the
+        source size and mtime). Passing a previous checkpoint back resumes from its offset
+        once the partial file's prefix is verified against the hash; a missing partial
+        file, a changed source or a hash mismatch restarts the copy from byte zero. The
+        partial file is locked while it is written, so that two tasks copying the same file
+        never write it at the same time.
+
+        Args:
+            src (Path): source file
+            dst (Path): destination file path (not directory)
+            offset (int, optional): offset of the last checkpoint. Defaults to 0.
+            checkpoint_hash (str, optional): hash recorded with that checkpoint.
+            on_checkpoint (Callable[[int, str], None] | None, optional): checkpoint callback
+
+        Raises:
+            CopyInProgress: another task is copying to the same partial file
+            IncompleteCopy: the copy stopped before the end of the source
+
+        Returns:
+            CopyResult: bytes copied by this call, elapsed time, engine and resume offset
+        """
+        segment = getattr(settings, "PHENOMATE_COPY_CHECKPOINT_BYTES", DEFAULT_CHECKPOINT_BYTES)
+        partial = dst.with_name(dst.name + PARTIAL_SUFFIX)
+        start = time.perf_counter()
+        st = src.stat()
+        seed = f"{st.st_size}:{st.st_mtime_ns}".encode()
+        digest = hashlib.blake2b(seed, digest_size=32)
+        if not (0 < offset <= st.st_size and partial.exists() and checkpoint_hash):
+            offset = 0
+        partial.touch()
+        with src.open("rb") as fsrc, partial.open("r+b") as fdst:
+            src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+            try:
+                fcntl.flock(dst_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError as exc:
+                raise CopyInProgress(errno.EBUSY, f"{partial} is being written") from exc
+            if offset and not self._verify_prefix(dst_fd, offset, digest, checkpoint_hash):
+                digest = hashlib.blake2b(seed, digest_size=32)
+                offset = 0
+            os.ftruncate(dst_fd, offset)
+            resumed_from = position = offset
+            while position < st.st_size:
+                count = min(segment, st.st_size - position)
+                copied = self.transfer(src_fd, dst_fd, position, count)
+                if copied == 0:
+                    # The partial file is kept for the next attempt to resume
+                    raise IncompleteCopy(src, position, st.st_size)
+                os.fsync(dst_fd)
+                self._hash_range(dst_fd, digest, position, position + copied)
+                position += copied
+                if on_checkpoint is not None:
+                    on_checkpoint(position, digest.hexdigest())
+            # Still locked: a concurrent attempt cannot truncate the finished copy
+            shutil.copystat(src, partial)
+            partial.replace(dst)
+        return CopyResult(
+            bytes_copied=position - resumed_from,
+            seconds=time.perf_counter() - start,
+            engine=self.engine_name,
+            resumed_from=resumed_from,
+        )
+
+    def _hash_range(self, fd: int, digest: hashlib.blake2b, start: int, end: int) -> None:
+        position = start
+        while position < end:
+            chunk = os.pread(fd, min(self.buffer_size, end - position), position)
+            if not chunk:
+                break
+            digest.update(chunk)
+            position += len(chunk)
+
+    def _verify_prefix(self, fd: int, offset: int, digest: hashlib.blake2b, expected: str) -> bool:
+        if os.fstat(fd).st_size < offset:
+            return False
+        self._hash_range(fd, digest, 0, offset)
+        return digest.hexdigest() == expected
+
+
+class BufferedEngine(CopyEngine):
+    """Portable user-space copy using a large, reusable buffer."""
+
+    name = "buffered"
+
+    def __init__(
+        self, buffer_size: int | None = None, throttle: Callable[[int], None] | None = None
+    ) -> None:
+        super().__init__(buffer_size, throttle)
+        self._buffer: bytearray | None = None
+
+    def transfer(self, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+        if self._buffer is None:
+            self._buffer = bytearray(self.buffer_size)
+        view = memoryview(self._buffer)
+        os.lseek(src_fd, offset, os.SEEK_SET)
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        copied = 0
+        while copied < count:
+            read = os.readv(src_fd, [view[: min(self.buffer_size, count - copied)]])
+            if not read:
+                break
+            written = 0
+            while written < read:
+                written += os.write(dst_fd, view[written:read])
+            if self.digest is not None:
+                self.digest.update(view[:read])
+            copied += read
+            if self.throttle is not None:
+                self.throttle(read)
+        return copied
+
+    @property
+    def hashes_inline(self) -> bool:
+        return True
+
+
+class CopyFileRangeEngine(CopyEngine):
+    """In-kernel copy with ``os.copy_file_range`` (Linux >= 4.5, same-FS reflinks)."""
+
+    name = "copy_file_range"
+
+    def transfer(self, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+        if not hasattr(os, "copy_file_range"):
+            raise CopyNotSupported(errno.ENOSYS, "copy_file_range is not available")
+        copied = 0
+        while copied < count:
+            try:
+                sent = os.copy_file_range(
+                    src_fd,
+                    dst_fd,
+                    min(self.buffer_size, count - copied),
+                    offset + copied,
+                    offset + copied,
+                )
+            except OSError as exc:
+                if copied == 0 and exc.errno in UNSUPPORTED_ERRNOS:
+                    raise CopyNotSupported(exc.errno, str(exc)) from exc
+                raise
+            if sent == 0:
+                if copied == 0:
+                    # Some file systems (e.g. procfs, FUSE) report 0 bytes instead of
+                    # failing: copy the data another way
+                    raise CopyNotSupported(errno.EINVAL, f"{self.name} copied no data")
+                break
+            copied += sent
+            if self.throttle is not None:
+                self.throttle(sent)
+        return copied
+
+
+class SendfileEngine(CopyEngine):
+    """In-kernel copy with ``os.sendfile`` (Linux allows any regular file as output)."""
+
+    name = "sendfile"
+
+    def transfer(self, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+        if not hasattr(os, "sendfile"):
+            raise CopyNotSupported(errno.ENOSYS, "sendfile is not available")
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        copied = 0
+        while copied < count:
+            try:
+                sent = os.sendfile(
+                    dst_fd, src_fd, offset + copied, min(self.buffer_size, count - copied)
+                )
+            except OSError as exc:
+                if copied == 0 and exc.errno in UNSUPPORTED_ERRNOS:
+                    raise CopyNotSupported(exc.errno, str(exc)) from exc
+                raise
+            if sent == 0:
+                if copied == 0:
+                    raise CopyNotSupported(errno.EINVAL, f"{self.name} copied no data")
+                break
+            copied += sent
+            if self.throttle is not None:
+                self.throttle(sent)
+        return copied
+
+
+class AutoEngine(CopyEngine):
+    """Try the in-kernel engines in order and fall back to the buffered copy."""
+
+    name = "auto"
+    candidates: tuple[type[CopyEngine], ...] = (
+        CopyFileRangeEngine,
+        SendfileEngine,
+        BufferedEngine,
+    )
+
+    def __init__(
+        self, buffer_size: int | None = None, throttle: Callable[[int], None] | None = None
+    ) -> None:
+        super().__init__(buffer_size, throttle)
+        self.engines = [engine(self.buffer_size, throttle) for engine in self.candidates]
+        self.last_engine = self.engines[-1].name
+
+    def transfer(self, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+        buffered = self.engines[-1]
+        if self.digest is not None:
+            # Reading through user space hashes the source in the same pass as the copy
+            buffered.digest = self.digest
+            try:
+                self.last_engine = buffered.name
+                return buffered.transfer(src_fd, dst_fd, offset, count)
+            finally:
+                buffered.digest = None
+        for engine in self.engines[:-1]:
+            try:
+                copied = engine.transfer(src_fd, dst_fd, offset, count)
+            except CopyNotSupported:
+                continue
+            self.last_engine = engine.name
+            return copied
+        self.last_engine = self.engines[-1].name
+        return self.engines[-1].transfer(src_fd, dst_fd, offset, count)
+
+    @property
+    def engine_name(self) -> str:
+        return self.last_engine
+
+    @property
+    def hashes_inline(self) -> bool:
+        return self.last_engine == self.engines[-1].name
+
+
+ENGINES: dict[str, type[CopyEngine]] = {
+    AutoEngine.name: AutoEngine,
+    CopyFileRangeEngine.name: CopyFileRangeEngine,
+    SendfileEngine.name: SendfileEngine,
+    BufferedEngine.name: BufferedEngine,
+}
+
+
+def get_copy_engine(
+    name: str | None = None, throttle: Callable[[int], None] | None = None
+) -> CopyEngine:
+    """Instantiate the configured copy engine.
+
+    Args:
+        name (str | None, optional): engine name or dotted path. Defaults to the
+        ``PHENOMATE_COPY_ENGINE`` setting.
+        throttle (Callable[[int], None] | None, optional): called with the size of each
+        chunk copied
+
+    Raises:
+        ValueError: the name is neither a registered engine nor an importable class
+
+    Returns:
+        CopyEngine: engine instance
+    """
+    name = name or getattr(settings, "PHENOMATE_COPY_ENGINE", AutoEngine.name)
+    if name in ENGINES:
+        return ENGINES[name](throttle=throttle)
+    try:
+        engine_class = import_string(name)
+    except ImportError as exc:
+        raise ValueError(f"Unknown copy engine: {name}") from exc
+    return engine_class(throttle=throttle)  # type: ignore[no-any-return]
@@ -1,8 +1,8 @@
 import datetime
 
-from ninja import Schema
+from ninja import Field, Schema
 
-from backend.activity.models import Activity
+from backend.activity.models import Activity, Offload
 
 
 class ActivitySchema(Schema):
@@ -11,10 +11,82 @@ class ActivitySchema(Schema):
     filename: str
     target: str | None
     status: Activity.StatusChoices
-    error_log: str | None
+    error_log: str | None = None
+    size: int
+    throughput: float | None
+    checksum: str = ""
+    destination: str
+    copy_status: Activity.StatusChoices
+    copied_at: datetime.datetime | None
+    preprocess_status: str
+    preprocessed_at: datetime.datetime | None
+    remove_status: str
+    removed_at: datetime.datetime | None
     created: datetime.datetime
     updated: datetime.datetime
 
 
+class ActivityChangesSchema(Schema):
+    activities: list[ActivitySchema]
+    deleted: list[int]
+    # The client must reload the whole listing
+    reset: bool
+    version: int
+    # Pass as updated_since of the next poll
+    modified: datetime.datetime
+
+
 class OffloadActivityForm(Schema):
     src_files: list[str]
+
+
+class OffloadSchema(Schema):
+    id: int
+    project_id: int
+    sources: list[str]
+    status: Offload.StatusChoices
+    files_found: int
+    error_log: str | None
+    created: datetime.datetime
+    updated: datetime.datetime
+
+
+class OffloadProgressSchema(Schema):
+    id: int
+    status: Offload.StatusChoices
+    total_files: int = Field(..., alias="files_found")
+    total_bytes: int
+    files_skipped: int
+    bytes_copied: int
+    copy_queued: int
+    copy_completed: int
+    copy_errors: int
+    preprocess_queued: int
+    preprocess_completed: int
+    preprocess_errors: int
+    remove_queued: int
+    remove_completed: int
+    remove_errors: int
+    # Bytes per second
+    throughput: float | None
+    # Seconds
+    eta: float | None
+    created: datetime.datetime
+    updated: datetime.datetime
+
+
+class CopyThrottleSchema(Schema):
+    # Per copy worker process, 0 for no limit
+    bytes_per_second: int = Field(..., ge=0)
+
+
+class RetryActivitiesForm(Schema):
+    status: list[Activity.StatusChoices] = [Activity.StatusChoices.ERROR]
+    activity: Activity.ActivityChoices | None = None
+    filename_prefix: str | None = None
+    offload_id: int | None = None
+    ids: list[int] | None = None
+
+
+class RetryActivitiesSchema(Schema):
+    retried: int
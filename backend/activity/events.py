@@ -0,0 +1,106 @@
+"""Server-Sent Events stream of the activity event log of a project.
+
+The stream tails the :class:`ActivityEvent` table, which works the same on SQLite and
+Postgres without a message broker for the web server. Each event carries its primary key
+as SSE ``id``; browsers send it back in the ``Last-Event-ID`` header when they reconnect, so
+the stream resumes where it stopped. A ``reset`` event tells the client that the events it
+missed were pruned (or that the activity log was cleared) and that it must reload the
+activity listing.
+
+Streams end after ``PHENOMATE_ACTIVITY_STREAM_MAX_SECONDS`` and the client reconnects. When
+served over WSGI, where a response cannot be streamed from a coroutine, the stream returns
+the pending events straight away instead, which turns ``EventSource`` into a long poll.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from backend.activity.models import ActivityEvent
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+# Events sent per query
+BATCH_SIZE = 500
+# Seconds between two keep-alive comments on an idle stream
+KEEP_ALIVE_INTERVAL = 15.0
+
+
+def format_event(event: str, data: dict[str, object], event_id: int | None = None) -> str:
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n{message}"
+    return message
+
+
+async def stream_events(
+    project_id: int, last_event_id: int | None, max_seconds: float | None = None
+) -> AsyncIterator[str]:
+    """Yield the events of a project as SSE messages.
+
+    Args:
+        project_id (int): project to follow
+        last_event_id (int | None): resume token sent by the client, None to only follow
+        new events
+        max_seconds (float | None, optional): stream duration. Defaults to the
+        ``PHENOMATE_ACTIVITY_STREAM_MAX_SECONDS`` setting; 0 returns after the first batch.
+
+    Yields:
+        str: SSE messages
+    """
+    if max_seconds is None:
+        max_seconds = getattr(settings, "PHENOMATE_ACTIVITY_STREAM_MAX_SECONDS", 300.0)
+    poll_interval = getattr(settings, "PHENOMATE_ACTIVITY_STREAM_POLL_INTERVAL", 0.5)
+    # Reconnect quickly at the end of a stream, at the old polling rate in long-poll mode
+    yield f"retry: {1000 if max_seconds else 3000}\n\n"
+
+    bounds = await ActivityEvent.objects.aaggregate(first=Min("pk"), last=Max("pk"))
+    latest = bounds["last"] or 0
+    if last_event_id is None or last_event_id > latest:
+        # New client (or a token from a reset database): start from the current end of the log
+        last_event_id = latest
+        yield format_event("ready", {}, last_event_id)
+    elif bounds["first"] is not None and last_event_id < bounds["first"] - 1:
+        last_event_id = latest
+        yield format_event("reset", {}, last_event_id)
+
+    deadline = time.monotonic() + max_seconds
+    idle_since = time.monotonic()
+    while True:
+        events = [
+            event
+            async for event in ActivityEvent.objects.filter(
+                project_id=project_id, pk__gt=last_event_id
+            ).order_by("pk")[:BATCH_SIZE]
+        ]
+        for event in events:
+            last_event_id = event.pk
+            if event.kind == ActivityEvent.KindChoices.CLEARED:
+                yield format_event("reset", {}, event.pk)
+                continue
+            data = {
+                "id": event.activity_pk,
+                "kind": event.kind,
+                "activity": event.activity,
+                "status": event.status,
+                "time": event.created.isoformat(),
+            }
+            yield format_event("activity", data, event.pk)
+        if len(events) == BATCH_SIZE:
+            continue
+        now = time.monotonic()
+        if now >= deadline:
+            return
+        if events:
+            idle_since = now
+        elif now - idle_since >= KEEP_ALIVE_INTERVAL:
+            idle_since = now
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(poll_interval)
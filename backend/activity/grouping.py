@@ -0,0 +1,100 @@
+"""Grouping of sensor files with the companion files phenomate-core reads with them.
+
+Some sensors write a primary data file next to companion files that its preprocessing
+reads as well: 3D lidar ``.pcap`` files come with a ``.json`` file, RS3 ``.25b`` files with
+``.25o``/``.25p`` files and IMU ``.bin`` files (whose stem contains ``imu``) with ``.csv``
+files (``<stem>.csv``, ``<stem>_GNSS.csv``). A companion belongs to the primary file in the
+same directory whose stem is its own stem or a ``_``-separated prefix of it.
+
+Companions that are offloaded themselves are scheduled in one task with their primary file,
+so that the files are read on one worker and the primary file is only preprocessed once all
+of them are in the project. Companions that are never copied (see ``DISALLOWED``) are read
+from the source drive and need no grouping. Offload discovery keeps the files of a group in
+the same batch (see :func:`companion_runs`).
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from backend.activity.models import Activity
+
+# Primary file suffix -> suffixes of its companion files
+COMPANIONS: dict[str, tuple[str, ...]] = {
+    ".pcap": (".json",),
+    ".25b": (".25o", ".25p"),
+    ".bin": (".csv",),
+}
+
+
+def stem_prefixes(stem: str) -> list[str]:
+    """``stem`` and its ``_``-separated prefixes, longest first."""
+    parts = stem.split("_")
+    return ["_".join(parts[:end]) for end in range(len(parts), 0, -1)]
+
+
+def companion_suffixes(path: Path) -> tuple[str, ...]:
+    """Suffixes of the companion files of ``path``, empty if it is not a primary file."""
+    suffix = path.suffix.lower()
+    # Other sensors (e.g. JAI cameras) write .bin files without companions
+    if suffix == ".bin" and "imu" not in path.stem.lower():
+        return ()
+    return COMPANIONS.get(suffix, ())
+
+
+def find_groups(paths: list[Path]) -> list[list[int]]:
+    """Match primary files with their companions.
+
+    Returns:
+        list[list[int]]: indexes in ``paths`` of the files of each group, primary file
+        first, for the primary files with companions among ``paths``
+    """
+    primaries: dict[tuple[Path, str], list[int]] = {}
+    for index, path in enumerate(paths):
+        if companion_suffixes(path):
+            primaries[(path.parent, path.stem.lower())] = [index]
+    for index, path in enumerate(paths):
+        if companion_suffixes(path):
+            continue
+        suffix = path.suffix.lower()
+        for stem in stem_prefixes(path.stem.lower()):
+            group = primaries.get((path.parent, stem))
+            if group is not None and suffix in companion_suffixes(paths[group[0]]):
+                group.append(index)
+                break
+    return [group for group in primaries.values() if len(group) > 1]
+
+
+def companion_runs(paths: list[Path]) -> list[list[int]]:
+    """Split files into runs that can be scheduled apart.
+
+    Returns:
+        list[list[int]]: indexes in ``paths``, each group of a primary file and its
+        companions in one run (at the position of the primary file) and every other file
+        in a run of its own
+    """
+    groups = {group[0]: group for group in find_groups(paths)}
+    grouped = {index for group in groups.values() for index in group}
+    return [
+        groups.get(index, [index])
+        for index in range(len(paths))
+        if index in groups or index not in grouped
+    ]
+
+
+def plan_groups(jobs: list[Activity]) -> tuple[list[list[Activity]], list[Activity]]:
+    """Gather primary files and their companions.
+
+    Returns:
+        tuple[list[list[Activity]], list[Activity]]: (groups, primary file first, of the
+        files with companions among ``jobs``; the other jobs, in order)
+    """
+    groups = find_groups([Path(job.filename) for job in jobs])
+    # Primary files without companions are scheduled like any other file
+    grouped = {index for group in groups for index in group}
+    return (
+        [[jobs[index] for index in group] for group in groups],
+        [job for index, job in enumerate(jobs) if index not in grouped],
+    )
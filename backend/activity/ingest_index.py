@@ -0,0 +1,158 @@
+"""Index of source files already offloaded into a project.
+
+A source file is fingerprinted by ``(size, mtime, partial hash)``, where the partial hash
+covers the file size and its first and last ``PHENOMATE_INDEX_PARTIAL_BYTES`` bytes. Files
+are looked up by fingerprint rather than by path, so a drive mounted elsewhere or a file
+moved on it is still recognised. A full content hash can be stored and compared as well by
+enabling ``PHENOMATE_INDEX_FULL_HASH``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from backend.activity.models import IngestedFile
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from pathlib import Path
+
+    from backend.project.models import Project
+
+DEFAULT_PARTIAL_BYTES = 64 * 1024
+HASH_READ_SIZE = 8 * 1024 * 1024
+# Keep IN (...) queries below SQLite's bound parameter limit
+QUERY_CHUNK_SIZE = 500
+
+
+def partial_hash(path: Path, size: int | None = None) -> str:
+    """Hash the size, head and tail of a file.
+
+    Args:
+        path (Path): file to fingerprint
+        size (int | None, optional): file size if already known from a stat call
+
+    Returns:
+        str: hex digest
+    """
+    block = getattr(settings, "PHENOMATE_INDEX_PARTIAL_BYTES", DEFAULT_PARTIAL_BYTES)
+    size = path.stat().st_size if size is None else size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with path.open("rb") as f:
+        digest.update(f.read(block))
+        if size > block:
+            f.seek(max(size - block, block))
+            digest.update(f.read(block))
+    return digest.hexdigest()
+
+
+def full_hash(path: Path) -> str:
+    """Hash the whole content of a file."""
+    digest = hashlib.blake2b(digest_size=32)
+    with path.open("rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while chunk := f.read(HASH_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingested_entry(project: Project, src: Path, content_hash: str = "") -> IngestedFile:
+    """Fingerprint a source file that was copied into ``project``.
+
+    Args:
+        project (Project): destination project
+        src (Path): source file
+        content_hash (str, optional): full hash computed during the copy, if any
+
+    Returns:
+        IngestedFile: unsaved index entry
+    """
+    st = src.stat()
+    if not content_hash and getattr(settings, "PHENOMATE_INDEX_FULL_HASH", False):
+        content_hash = full_hash(src)
+    return IngestedFile(
+        project=project,
+        filename=str(src.absolute()),
+        size=st.st_size,
+        mtime_ns=st.st_mtime_ns,
+        partial_hash=partial_hash(src, st.st_size),
+        full_hash=content_hash,
+    )
+
+
+def record_ingested(entries: Iterable[IngestedFile]) -> None:
+    """Add or refresh index entries (see :func:`ingested_entry`) in one upsert."""
+    IngestedFile.objects.bulk_create(
+        list(entries),
+        batch_size=QUERY_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=["project", "filename"],
+        update_fields=["size", "mtime_ns", "partial_hash", "full_hash", "updated"],
+    )
+
+
+def split_ingested(project: Project, sizes: Mapping[Path, int]) -> tuple[list[Path], list[Path]]:
+    """Separate files that still need offloading from files already ingested unchanged.
+
+    A file is ingested when the project has an entry with its size, mtime and partial hash
+    (and full hash, with ``PHENOMATE_INDEX_FULL_HASH``), whatever path it was copied from.
+    Entries are fetched in bulk and only files whose size has an entry are partially hashed.
+
+    Args:
+        project (Project): destination project
+        sizes (Mapping[Path, int]): candidate source files and their sizes
+
+    Returns:
+        tuple[list[Path], list[Path]]: (files to offload, files to skip)
+    """
+    pending: list[Path] = []
+    skipped: list[Path] = []
+    check_full = getattr(settings, "PHENOMATE_INDEX_FULL_HASH", False)
+    candidates = list(sizes)
+    for start in range(0, len(candidates), QUERY_CHUNK_SIZE):
+        chunk = candidates[start : start + QUERY_CHUNK_SIZE]
+        known_sizes = set(
+            IngestedFile.objects.filter(
+                project=project, size__in={sizes[file] for file in chunk}
+            ).values_list("size", flat=True)
+        )
+        fingerprints: dict[Path, tuple[int, int, str]] = {}
+        for file in chunk:
+            if sizes[file] not in known_sizes:
+                continue
+            try:
+                st = file.stat()
+                fingerprints[file] = (st.st_size, st.st_mtime_ns, partial_hash(file, st.st_size))
+            except OSError:
+                continue
+        entries: dict[tuple[int, int, str], list[str]] = {}
+        if fingerprints:
+            for size, mtime_ns, digest, content_hash in IngestedFile.objects.filter(
+                project=project,
+                size__in={size for size, _, _ in fingerprints.values()},
+                partial_hash__in={digest for _, _, digest in fingerprints.values()},
+            ).values_list("size", "mtime_ns", "partial_hash", "full_hash"):
+                entries.setdefault((size, mtime_ns, digest), []).append(content_hash)
+        for file in chunk:
+            fingerprint = fingerprints.get(file)
+            hashes = entries.get(fingerprint) if fingerprint is not None else None
+            if hashes is not None and (not check_full or full_hash_matches(file, hashes)):
+                skipped.append(file)
+            else:
+                pending.append(file)
+    return pending, skipped
+
+
+def full_hash_matches(file: Path, hashes: list[str]) -> bool:
+    """Whether ``file`` has one of the stored full hashes; entries without one match."""
+    if not all(hashes):
+        return True
+    try:
+        return full_hash(file) in hashes
+    except OSError:
+        return False
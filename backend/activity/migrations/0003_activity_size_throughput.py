@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0002_alter_activity_error_log_alter_activity_filename_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="size",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="throughput",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0003_activity_size_throughput"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="activity",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("QUEUED", "Queued"),
+                    ("ERROR", "Error"),
+                    ("COMPLETED", "Completed"),
+                    ("SKIPPED", "Skipped"),
+                ],
+                default="QUEUED",
+            ),
+        ),
+        migrations.CreateModel(
+            name="IngestedFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("filename", models.CharField(max_length=2048)),
+                ("size", models.BigIntegerField()),
+                ("mtime_ns", models.BigIntegerField()),
+                ("partial_hash", models.CharField(max_length=64)),
+                ("full_hash", models.CharField(blank=True, default="", max_length=64)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="project.project"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("project", "filename"), name="unique_ingested_file_per_project"
+                    )
+                ],
+            },
+        ),
+    ]
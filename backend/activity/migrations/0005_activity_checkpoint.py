@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0004_ingestedfile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="checkpoint_hash",
+            field=models.CharField(blank=True, default="", max_length=128),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="checkpoint_offset",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0005_activity_checkpoint"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Offload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("sources", models.JSONField(default=list)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("DISCOVERING", "Discovering"),
+                            ("DISCOVERED", "Discovered"),
+                            ("ERROR", "Error"),
+                        ],
+                        default="DISCOVERING",
+                    ),
+                ),
+                ("files_found", models.IntegerField(default=0)),
+                ("error_log", models.CharField(default="", max_length=2048)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="project.project"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="offload",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="activity.offload",
+            ),
+        ),
+    ]
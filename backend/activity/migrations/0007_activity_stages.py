@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+STATUS_CHOICES = [
+    ("QUEUED", "Queued"),
+    ("ERROR", "Error"),
+    ("COMPLETED", "Completed"),
+    ("SKIPPED", "Skipped"),
+]
+STAGES = ["COPY", "PREPROC", "REMOVE"]
+STAGE_FIELDS = {
+    "COPY": ("copy_status", "copied_at"),
+    "PREPROC": ("preprocess_status", "preprocessed_at"),
+    "REMOVE": ("remove_status", "removed_at"),
+}
+# Keeps IN (...) queries below SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+
+CHAIN_FIELDS = (
+    "id",
+    "parent_id",
+    "activity",
+    "status",
+    "filename",
+    "target",
+    "error_log",
+    "updated",
+)
+
+
+def fold_chain(root, children):
+    """Set the stage fields of ``root`` from the rows of its chain (``children`` by parent)."""
+    stage = STAGES.index(root.activity) if root.activity in STAGES else 0
+    # A root whose own parent was deleted: its earlier stages did complete. It keeps
+    # its own filename (its source is not known) and its file is the copy.
+    for earlier in STAGES[:stage]:
+        setattr(root, STAGE_FIELDS[earlier][0], "COMPLETED")
+    if stage > 0:
+        root.destination = root.filename
+    setattr(root, STAGE_FIELDS[STAGES[stage]][0], root.status)
+    if root.status == "COMPLETED":
+        setattr(root, STAGE_FIELDS[STAGES[stage]][1], root.updated)
+
+    node = children.get(root.pk)
+    while node is not None:
+        status_field, time_field = STAGE_FIELDS[node["activity"]]
+        setattr(root, status_field, node["status"])
+        if node["status"] == "COMPLETED":
+            setattr(root, time_field, node["updated"])
+        if node["activity"] == "PREPROC":
+            root.destination = node["filename"]
+            root.target = node["target"] or root.target
+        if node["error_log"]:
+            root.error_log = node["error_log"]
+        root.activity = node["activity"]
+        root.status = node["status"]
+        node = children.get(node["id"])
+
+
+def collapse_chains(apps, schema_editor):
+    """Fold each COPY -> PREPROC -> REMOVE chain of rows into its first row.
+
+    Chains are read and folded ``BATCH_SIZE`` first rows at a time, in primary key order.
+    """
+    Activity = apps.get_model("activity", "Activity")
+    fields = {"activity", "status", "target", "error_log", "destination"}
+    for status_field, time_field in STAGE_FIELDS.values():
+        fields.update((status_field, time_field))
+
+    last_pk = 0
+    while True:
+        roots = list(
+            Activity.objects.filter(parent__isnull=True, pk__gt=last_pk).order_by("pk")[:BATCH_SIZE]
+        )
+        if not roots:
+            break
+        last_pk = roots[-1].pk
+        # Later stages of the chains of these roots, by parent
+        children = {}
+        chain_pks = []
+        parents = [root.pk for root in roots]
+        while parents:
+            rows = list(Activity.objects.filter(parent_id__in=parents).values(*CHAIN_FIELDS))
+            children.update((child["parent_id"], child) for child in rows)
+            parents = [child["id"] for child in rows]
+            chain_pks += parents
+
+        for root in roots:
+            fold_chain(root, children)
+        Activity.objects.bulk_update(roots, sorted(fields))
+        for start in range(0, len(chain_pks), BATCH_SIZE):
+            Activity.objects.filter(pk__in=chain_pks[start : start + BATCH_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0006_offload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="destination",
+            field=models.CharField(blank=True, default="", max_length=2048),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="copy_status",
+            field=models.CharField(choices=STATUS_CHOICES, default="QUEUED"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="copied_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="preprocess_status",
+            field=models.CharField(blank=True, choices=STATUS_CHOICES, default=""),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="preprocessed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="remove_status",
+            field=models.CharField(blank=True, choices=STATUS_CHOICES, default=""),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="removed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(collapse_chains, migrations.RunPython.noop),
+    ]
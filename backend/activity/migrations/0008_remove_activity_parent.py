@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0007_activity_stages"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="activity",
+            name="parent",
+        ),
+    ]
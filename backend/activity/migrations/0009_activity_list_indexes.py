@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0008_remove_activity_parent"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(
+                fields=["project", "status", "updated"], name="activity_project_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["project", "created"], name="activity_project_created_idx"),
+        ),
+    ]
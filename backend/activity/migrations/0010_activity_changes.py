@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0009_activity_list_indexes"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActivityVersion",
+            fields=[
+                (
+                    "project",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="project.project",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+                ("modified", models.DateTimeField(default=django.utils.timezone.now)),
+                ("cleared", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DeletedActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("activity_pk", models.BigIntegerField()),
+                ("deleted", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["project", "updated"], name="activity_project_updated_idx"),
+        ),
+        migrations.AddField(
+            model_name="deletedactivity",
+            name="project",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="project.project"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deletedactivity",
+            index=models.Index(fields=["project", "deleted"], name="deleted_activity_project_idx"),
+        ),
+    ]
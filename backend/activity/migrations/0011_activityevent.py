@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0010_activity_changes"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActivityEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("activity_pk", models.BigIntegerField(default=0)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("WRITTEN", "Written"),
+                            ("DELETED", "Deleted"),
+                            ("CLEARED", "Cleared"),
+                        ],
+                        default="WRITTEN",
+                    ),
+                ),
+                (
+                    "activity",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("COPY", "Copied"),
+                            ("PREPROC", "Preprocessed"),
+                            ("REMOVE", "Removed"),
+                        ],
+                        default="",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("ERROR", "Error"),
+                            ("COMPLETED", "Completed"),
+                            ("SKIPPED", "Skipped"),
+                        ],
+                        default="",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="project.project"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["project", "id"], name="activity_event_project_idx"),
+                    models.Index(fields=["created"], name="activity_event_created_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0011_activityevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offload",
+            name="bytes_copied",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="copy_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="copy_errors",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="copy_queued",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="files_skipped",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="preprocess_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="preprocess_errors",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="preprocess_queued",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="remove_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="remove_errors",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="remove_queued",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="total_bytes",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
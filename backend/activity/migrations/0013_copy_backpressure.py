@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0012_offload_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CopyThrottle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("bytes_per_second", models.BigIntegerField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="offload",
+            name="copy_queued_bytes",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
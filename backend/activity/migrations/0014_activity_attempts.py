@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0013_copy_backpressure"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+    ]
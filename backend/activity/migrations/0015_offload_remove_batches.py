@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0014_activity_attempts"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offload",
+            name="remove_scheduled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(
+                fields=["offload", "activity", "status"], name="activity_offload_stage_idx"
+            ),
+        ),
+    ]
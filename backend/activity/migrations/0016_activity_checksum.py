@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0015_offload_remove_batches"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="checksum",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
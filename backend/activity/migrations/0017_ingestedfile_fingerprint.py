@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("activity", "0016_activity_checksum"),
+        ("project", "0002_project_platform_project_project_project_site"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ingestedfile",
+            index=models.Index(
+                fields=["project", "size", "partial_hash"], name="ingested_fingerprint_idx"
+            ),
+        ),
+    ]
@@ -1,11 +1,85 @@
 from __future__ import annotations
 
+from collections import Counter
+
 from django.db import models
+from django.utils import timezone
 
 from backend.project.models import Project
 
 
 # Create your models here.
+class Offload(models.Model):
+    """A request to offload a set of source paths into a project."""
+
+    class StatusChoices(models.TextChoices):
+        DISCOVERING = "DISCOVERING"
+        DISCOVERED = "DISCOVERED"
+        ERROR = "ERROR"
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    sources = models.JSONField(default=list)
+    status = models.CharField(choices=StatusChoices, default=StatusChoices.DISCOVERING)
+    files_found = models.IntegerField(default=0)
+    error_log = models.CharField(max_length=2048, default="")
+    # Progress counters, maintained with F() updates as files are queued and go through
+    # the stages. <stage>_queued counts the files waiting for (or running) that stage.
+    total_bytes = models.BigIntegerField(default=0)
+    files_skipped = models.IntegerField(default=0)
+    bytes_copied = models.BigIntegerField(default=0)
+    copy_queued = models.IntegerField(default=0)
+    # Bytes of the files waiting to be copied
+    copy_queued_bytes = models.BigIntegerField(default=0)
+    copy_completed = models.IntegerField(default=0)
+    copy_errors = models.IntegerField(default=0)
+    preprocess_queued = models.IntegerField(default=0)
+    preprocess_completed = models.IntegerField(default=0)
+    preprocess_errors = models.IntegerField(default=0)
+    remove_queued = models.IntegerField(default=0)
+    remove_completed = models.IntegerField(default=0)
+    remove_errors = models.IntegerField(default=0)
+    # A remove_batch_task is waiting to remove the files of the offload
+    remove_scheduled = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    # Stage -> counter name prefix
+    STAGE_COUNTERS = {"COPY": "copy", "PREPROC": "preprocess", "REMOVE": "remove"}
+    # Stage status -> counter name suffix
+    STATUS_COUNTERS = {"QUEUED": "queued", "COMPLETED": "completed", "ERROR": "errors"}
+
+    def __str__(self) -> str:
+        return f"{self.project}_offload_{self.pk}_{self.status}"
+
+    @classmethod
+    def counter(cls, stage: str, status: str) -> str | None:
+        """Name of the counter of files at ``stage`` in ``status``, if there is one."""
+        if status not in cls.STATUS_COUNTERS:
+            return None
+        return f"{cls.STAGE_COUNTERS[stage]}_{cls.STATUS_COUNTERS[status]}"
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds between the offload request and the last progress update."""
+        return max((self.updated - self.created).total_seconds(), 0.0)
+
+    @property
+    def throughput(self) -> float | None:
+        """Average copy rate of the offload in bytes per second."""
+        if not self.bytes_copied or not self.elapsed:
+            return None
+        return self.bytes_copied / self.elapsed
+
+    @property
+    def eta(self) -> float | None:
+        """Estimated seconds until every queued byte is copied."""
+        remaining = max(self.total_bytes - self.bytes_copied, 0)
+        if not remaining and not self.copy_queued:
+            return 0.0
+        throughput = self.throughput
+        return remaining / throughput if throughput else None
+
+
 class Activity(models.Model):
     class ActivityChoices(models.TextChoices):
         COPIED = "COPY"
@@ -16,20 +90,59 @@ class Activity(models.Model):
         QUEUED = "QUEUED"
         ERROR = "ERROR"
         COMPLETED = "COMPLETED"
+        SKIPPED = "SKIPPED"
+
+    # Stage -> (stage status field, stage completion time field)
+    STAGE_FIELDS = {
+        ActivityChoices.COPIED: ("copy_status", "copied_at"),
+        ActivityChoices.PREPROCESSED: ("preprocess_status", "preprocessed_at"),
+        ActivityChoices.REMOVED: ("remove_status", "removed_at"),
+    }
+    NEXT_STAGE = {
+        ActivityChoices.COPIED: ActivityChoices.PREPROCESSED,
+        ActivityChoices.PREPROCESSED: ActivityChoices.REMOVED,
+    }
 
     # Model Fields
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
-    parent = models.ForeignKey(
-        "self", on_delete=models.SET_NULL, blank=True, null=True, related_name="children"
-    )
+    offload = models.ForeignKey(Offload, on_delete=models.SET_NULL, blank=True, null=True)
     activity = models.CharField(choices=ActivityChoices, default=ActivityChoices.COPIED)
     filename = models.CharField(max_length=2048)
     target = models.CharField(max_length=2048, default="")
     status = models.CharField(choices=StatusChoices, default=StatusChoices.QUEUED)
     error_log = models.CharField(max_length=2048, default="")
+    size = models.BigIntegerField(default=0)
+    throughput = models.FloatField(null=True, blank=True)
+    checkpoint_offset = models.BigIntegerField(default=0)
+    checkpoint_hash = models.CharField(max_length=128, default="", blank=True)
+    # Content digest of the copied file, set when copies are verified
+    checksum = models.CharField(max_length=64, default="", blank=True)
+    # Number of retries requested, drives the retry backoff
+    attempts = models.IntegerField(default=0)
+    # One row per file: `activity`/`status` describe the current stage, the columns below
+    # keep the outcome of every stage
+    destination = models.CharField(max_length=2048, default="", blank=True)
+    copy_status = models.CharField(choices=StatusChoices, default=StatusChoices.QUEUED)
+    copied_at = models.DateTimeField(null=True, blank=True)
+    preprocess_status = models.CharField(choices=StatusChoices, default="", blank=True)
+    preprocessed_at = models.DateTimeField(null=True, blank=True)
+    remove_status = models.CharField(choices=StatusChoices, default="", blank=True)
+    removed_at = models.DateTimeField(null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project", "status", "updated"], name="activity_project_status_idx"
+            ),
+            models.Index(fields=["project", "created"], name="activity_project_created_idx"),
+            models.Index(fields=["project", "updated"], name="activity_project_updated_idx"),
+            models.Index(
+                fields=["offload", "activity", "status"], name="activity_offload_stage_idx"
+            ),
+        ]
+
     def __str__(self) -> str:
         name = ""
         if self.project:
@@ -39,3 +152,167 @@ class Activity(models.Model):
             name += f"_{self.target}"
         name += f"_{self.status}"
         return name
+
+    def set_stage_status(self, status: str) -> list[str]:
+        """Set the status of the current stage.
+
+        Returns:
+            list[str]: names of the fields that changed
+        """
+        status_field, time_field = self.STAGE_FIELDS[self.ActivityChoices(self.activity)]
+        self.count_transition(getattr(self, status_field), status)
+        self.status = status
+        setattr(self, status_field, status)
+        fields = ["status", status_field]
+        if status == self.StatusChoices.COMPLETED:
+            setattr(self, time_field, timezone.now())
+            fields.append(time_field)
+        return fields
+
+    def stage_pending(self, stage: str) -> bool:
+        """Whether ``stage`` is the current stage and has not completed yet.
+
+        Stage tasks skip files for which this is False, so that re-running a pipeline only
+        redoes the stages that did not finish.
+        """
+        status_field, _ = self.STAGE_FIELDS[self.ActivityChoices(stage)]
+        return (
+            self.activity == stage and getattr(self, status_field) != self.StatusChoices.COMPLETED
+        )
+
+    def count_transition(self, previous: str, status: str) -> None:
+        """Record the Offload progress counter changes of a stage status change.
+
+        The changes are collected on the instance until :meth:`pop_progress` is called.
+        """
+        if self.offload_id is None or previous == status:
+            return
+        progress: Counter[str] = self.__dict__.setdefault("_progress", Counter())
+        if counter := Offload.counter(self.activity, previous):
+            progress[counter] -= 1
+        if counter := Offload.counter(self.activity, status):
+            progress[counter] += 1
+        if self.activity == self.ActivityChoices.COPIED:
+            if previous == self.StatusChoices.QUEUED:
+                progress["copy_queued_bytes"] -= self.size
+            if status == self.StatusChoices.QUEUED:
+                progress["copy_queued_bytes"] += self.size
+            if status == self.StatusChoices.COMPLETED:
+                progress["bytes_copied"] += self.size
+
+    def pop_progress(self) -> Counter[str]:
+        """Offload progress counter changes recorded since the last call."""
+        return self.__dict__.pop("_progress", None) or Counter()
+
+    def complete_stage(self) -> list[str]:
+        """Mark the current stage completed and queue the next one, if any.
+
+        Returns:
+            list[str]: names of the fields that changed
+        """
+        fields = self.set_stage_status(self.StatusChoices.COMPLETED)
+        next_stage = self.NEXT_STAGE.get(self.ActivityChoices(self.activity))
+        if next_stage is not None:
+            self.activity = next_stage
+            fields += ["activity", *self.set_stage_status(self.StatusChoices.QUEUED)]
+        return fields
+
+
+class IngestedFile(models.Model):
+    """Fingerprint of a source file that has already been copied into a project."""
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=2048)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    partial_hash = models.CharField(max_length=64)
+    full_hash = models.CharField(max_length=64, default="", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project", "filename"], name="unique_ingested_file_per_project"
+            )
+        ]
+        indexes = [
+            # Content fingerprint lookups of files seen through another path
+            models.Index(
+                fields=["project", "size", "partial_hash"], name="ingested_fingerprint_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.project}_{self.filename}"
+
+
+class ActivityVersion(models.Model):
+    """Change counter of the activity log of a project, bumped by every write to it."""
+
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+    # Time of the last removal of all the activities of the project
+    cleared = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.project}_{self.version}"
+
+
+class DeletedActivity(models.Model):
+    """Tombstone of a deleted Activity, kept for ``PHENOMATE_ACTIVITY_TOMBSTONE_TTL`` seconds."""
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    activity_pk = models.BigIntegerField()
+    deleted = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "deleted"], name="deleted_activity_project_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.project}_{self.activity_pk}"
+
+
+class ActivityEvent(models.Model):
+    """Entry of the event log of activity writes, streamed to clients by the activity router.
+
+    The primary key is the resume token of the stream.
+    """
+
+    class KindChoices(models.TextChoices):
+        WRITTEN = "WRITTEN"
+        DELETED = "DELETED"
+        # All the activities of the project were deleted
+        CLEARED = "CLEARED"
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    activity_pk = models.BigIntegerField(default=0)
+    kind = models.CharField(choices=KindChoices, default=KindChoices.WRITTEN)
+    activity = models.CharField(choices=Activity.ActivityChoices, default="", blank=True)
+    status = models.CharField(choices=Activity.StatusChoices, default="", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "id"], name="activity_event_project_idx"),
+            models.Index(fields=["created"], name="activity_event_created_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.project}_{self.kind}_{self.activity_pk}_{self.status}"
+
+
+class CopyThrottle(models.Model):
+    """Copy bandwidth limit applied by every copy worker process, adjustable at runtime.
+
+    A single row (pk 1) is used; without it the ``PHENOMATE_COPY_MAX_RATE`` setting applies.
+    """
+
+    bytes_per_second = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"copy_throttle_{self.bytes_per_second}"
@@ -0,0 +1,136 @@
+"""Batched removal of the raw copies left in a project after preprocessing.
+
+Preprocessed files no longer need the raw copy made by the copy stage, except for the
+sensors whose companion files phenomate-core reads later (see :func:`keep_raw_copy`).
+Instead of one task per file, files that complete preprocessing are collected per offload
+and removed together by one ``remove_batch_task`` every ``PHENOMATE_REMOVE_BATCH_DELAY``
+seconds.
+
+A raw copy is only deleted once it is checked against its source file: its size must match
+the size recorded when it was copied and, while the source is still reachable, the source
+size and mtime (copies keep the mtime of their source). The copy is then hashed and
+compared with the digest recorded when it was verified at copy time (see
+``PHENOMATE_VERIFY_COPIES``), or else with a hash of the source. A copy that does not match,
+or that cannot be compared because the source is gone and no digest was recorded, is kept
+and its remove stage fails, so that a truncated or corrupted copy is never silently
+discarded.
+"""
+
+from __future__ import annotations
+
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+from backend.activity.ingest_index import full_hash
+from backend.activity.models import Activity
+from backend.activity.verify import file_digests
+from backend.activity.writer import activity_writer
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+shared_logger = get_task_logger(__name__)
+
+
+def keep_raw_copy(path: Path) -> bool:
+    """Whether the raw copy of a file must stay in the project after preprocessing."""
+    # CANBUS files are csv files
+    canbus = "canbus" in path.stem.lower()
+    # Specialised processing in phenomate-core for .25o and .25p
+    rs3 = path.suffix.lower() == ".25b"
+    # Specialised processing in phenomate-core for .json
+    lidar3d = path.suffix.lower() == ".pcap"
+    # The .bin file has a corresponding .csv file and a _GNSS.csv file that has
+    # specialised processing
+    imu = "imu1" in path.stem.lower()
+    return canbus or rs3 or lidar3d or imu
+
+
+def copy_mismatch(log: Activity) -> str | None:
+    """Check the raw copy of ``log`` against its source file.
+
+    Returns:
+        str | None: why the copy does not match, None if it does (or is already gone)
+    """
+    dst = Path(log.destination)
+    src = Path(log.filename)
+    try:
+        copied = dst.stat()
+    except FileNotFoundError:
+        # Already removed by an earlier attempt
+        return None
+    if copied.st_size != log.size:
+        return f"Copy {dst} has {copied.st_size} bytes, {log.size} bytes were copied"
+    try:
+        source = src.stat()
+    except OSError:
+        # Source drive detached: the recorded size is all there is to compare
+        source = None
+    if source is not None:
+        if source.st_size != copied.st_size:
+            return f"Copy {dst} has {copied.st_size} bytes, source {src} has {source.st_size} bytes"
+        if source.st_mtime_ns != copied.st_mtime_ns:
+            return f"Copy {dst} and source {src} have different modification times"
+    if log.checksum:
+        matches = full_hash(dst) == log.checksum
+    elif source is not None:
+        copy_digest, source_digest = file_digests([dst, src])
+        matches = copy_digest == source_digest
+    else:
+        return f"Copy {dst} cannot be verified: source {src} is unreachable and has no digest"
+    if not matches:
+        return f"Copy {dst} differs from the source {src} it was copied from"
+    return None
+
+
+def remove_files(logs: Iterable[Activity]) -> list[Activity]:
+    """Verify and remove the raw copies of files at the remove stage.
+
+    Files whose remove stage is not pending are skipped. Copies are verified concurrently,
+    then the verified ones are deleted and their stage completed.
+
+    Returns:
+        list[Activity]: the files whose remove stage was processed
+    """
+    pending = [log for log in logs if log.stage_pending(Activity.ActivityChoices.REMOVED)]
+    removable = [log for log in pending if not keep_raw_copy(Path(log.destination))]
+    workers = getattr(settings, "PHENOMATE_REMOVE_WORKERS", 4)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        mismatches = dict(
+            zip((log.pk for log in removable), pool.map(_check, removable), strict=True)
+        )
+    for log in pending:
+        if mismatch := mismatches.get(log.pk):
+            shared_logger.info(f"Phenomate: remove_files(): Kept {log.destination}: {mismatch}")
+            log.error_log = mismatch
+            activity_writer.update(
+                log, *log.set_stage_status(Activity.StatusChoices.ERROR), "error_log"
+            )
+            continue
+        try:
+            if log.pk in mismatches:
+                # Already gone if an earlier attempt stopped after the unlink
+                Path(log.destination).unlink(missing_ok=True)
+        except OSError:
+            log.error_log = traceback.format_exc()[-2048:]
+            activity_writer.update(
+                log, *log.set_stage_status(Activity.StatusChoices.ERROR), "error_log"
+            )
+            continue
+        activity_writer.update(log, *log.complete_stage())
+    shared_logger.info(
+        f"Phenomate: remove_files(): {len(pending)} files, {len(removable)} raw copies checked"
+    )
+    return pending
+
+
+def _check(log: Activity) -> str:
+    try:
+        return copy_mismatch(log) or ""
+    except OSError:
+        return traceback.format_exc()[-2048:]
@@ -0,0 +1,139 @@
+"""Admission control for preprocessing jobs.
+
+Decoding some sensors (3D lidar ``.pcap``, hyperspectral cubes) needs many times the file
+size in RAM, while CSV based sensors (CANBUS, IMU) need next to nothing. Before a
+preprocessing job starts it must obtain:
+
+- a slot of its sensor: at most ``concurrency`` jobs of a sensor run at once on a host,
+- a memory admission: the job's expected peak memory (``memory_factor`` times the file
+  size) must fit in the memory psutil reports available, less
+  ``PHENOMATE_PREPROCESS_MEMORY_RESERVE`` bytes and the estimates of jobs admitted in the
+  last ``PHENOMATE_PREPROCESS_MEMORY_SETTLE`` seconds, which may not have allocated yet.
+
+Sensor profiles come from ``PHENOMATE_PREPROCESS_SENSORS`` (sensor keyword ->
+``(concurrency, memory_factor)``, matched like ``phenomate_core.get_preprocessor`` does).
+Slots are ``flock``-ed files in ``PHENOMATE_SCHEDULER_DIR``, shared by every worker process
+on the host and released by the kernel if a worker dies. A job that is not admitted is
+retried later by its task, leaving the worker free for jobs that fit.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import psutil
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from typing import IO
+
+shared_logger = get_task_logger(__name__)
+
+ADMISSION_LOCK = "admission.lock"
+
+
+def scheduler_dir() -> Path:
+    path = Path(
+        getattr(settings, "PHENOMATE_SCHEDULER_DIR", "")
+        or Path(tempfile.gettempdir()) / "phenomate-scheduler"
+    )
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def sensor_profile(sensor: str) -> tuple[str, int, float]:
+    """Slot name, concurrency limit and memory factor of a sensor."""
+    sensors: dict[str, tuple[int, float]] = getattr(settings, "PHENOMATE_PREPROCESS_SENSORS", {})
+    for keyword, (concurrency, memory_factor) in sensors.items():
+        if keyword in sensor.lower():
+            return keyword, concurrency, memory_factor
+    default_concurrency = getattr(settings, "PHENOMATE_PREPROCESS_DEFAULT_CONCURRENCY", 4)
+    return "default", default_concurrency, 1.0
+
+
+def _try_lock(path: Path) -> IO[str] | None:
+    f = path.open("a+", encoding="utf-8")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def _settling_reservations(directory: Path, settle: float) -> int:
+    """Estimated bytes of the jobs admitted in the last ``settle`` seconds."""
+    reserved = 0
+    now = time.time()
+    for path in directory.glob("*.slot"):
+        free = _try_lock(path)
+        if free is not None:
+            free.close()
+            continue
+        with contextlib.suppress(OSError, ValueError):
+            estimate, admitted = path.read_text(encoding="utf-8").split()
+            if now - float(admitted) < settle:
+                reserved += int(estimate)
+    return reserved
+
+
+def _admit_memory(directory: Path, estimate: int) -> bool:
+    reserve = getattr(settings, "PHENOMATE_PREPROCESS_MEMORY_RESERVE", 1024 * 1024 * 1024)
+    settle = getattr(settings, "PHENOMATE_PREPROCESS_MEMORY_SETTLE", 30.0)
+    memory = psutil.virtual_memory()
+    # A job larger than the host's memory runs once (nearly) everything else is done
+    estimate = min(estimate, memory.total - reserve)
+    return estimate <= memory.available - reserve - _settling_reservations(directory, settle)
+
+
+@contextlib.contextmanager
+def preprocess_admission(sensor: str, size: int) -> Iterator[bool]:
+    """Hold a slot and a memory admission for preprocessing a file while the block runs.
+
+    Args:
+        sensor (str): sensor of the file, as matched by appm
+        size (int): file size in bytes
+
+    Yields:
+        bool: whether the job was admitted; when False the job must not run now
+    """
+    name, concurrency, memory_factor = sensor_profile(sensor)
+    estimate = int(size * memory_factor)
+    directory = scheduler_dir()
+    slot = None
+    with (directory / ADMISSION_LOCK).open("a", encoding="utf-8") as admission:
+        # Admissions are serialised so that two jobs cannot both claim the same free memory
+        fcntl.flock(admission, fcntl.LOCK_EX)
+        for index in range(concurrency):
+            slot = _try_lock(directory / f"{name}.{index}.slot")
+            if slot is not None:
+                break
+        if slot is not None and not _admit_memory(directory, estimate):
+            slot.close()
+            slot = None
+            shared_logger.info(
+                f"Phenomate: preprocess_admission(): Not enough free memory for a {sensor} job "
+                f"of ~{estimate / 1e6:.0f} MB"
+            )
+        if slot is not None:
+            slot.seek(0)
+            slot.truncate()
+            slot.write(f"{estimate} {time.time()}")
+            slot.flush()
+    if slot is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        with contextlib.suppress(OSError):
+            os.ftruncate(slot.fileno(), 0)
+        slot.close()
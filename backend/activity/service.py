@@ -1,66 +1,435 @@
+import base64
+import datetime as dt
+import stat
+from collections.abc import Iterator
+from itertools import groupby
 from pathlib import Path
+from typing import Any
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Case, F, Q, QuerySet, Value, When
+from django.utils import timezone
 
-from backend.activity.models import Activity
-from backend.activity.tasks import copy_task, preprocess_task, remove_task
+from backend.activity.backpressure import InsufficientSpace, free_space, queued_bytes
+from backend.activity.changes import changes_after, record_writes
+from backend.activity.grouping import companion_runs, plan_groups
+from backend.activity.ingest_index import split_ingested
+from backend.activity.models import Activity, Offload
+from backend.activity.walker import SourceFile, walk_files
+from backend.activity.writer import activity_writer
 from backend.project.models import Project
-from celery import chain, group
+from celery import Signature, chain, group, signature
 
 from celery.utils.log import get_task_logger
+
 shared_logger = get_task_logger(__name__)
 
 
-# The DISALLOWED list will remove the copy error stating these files do not 
-# have an entry in the appm library template.yaml file being used. 
+# The DISALLOWED list will remove the copy error stating these files do not
+# have an entry in the appm library template.yaml file being used.
 # N.B. .json files are processed as a 'matching file' in the phenomate_core code
-# as associated files to .pcap or .bin (JAI protobuf) files. 
+# as associated files to .pcap or .bin (JAI protobuf) files.
 # The .25o and .25p files are 'matching files' for a .25b RS3 base station data.
-DISALLOWED = {'.json', '.25o', '.25p'}
+DISALLOWED = {".json", ".25o", ".25p"}
 
-def copy_data(src: list[Path], project: Project) -> None:
-    all_items: set[Path] = set()
-    failed_jobs: list[Activity] = []
-    queued_jobs: list[Activity] = []
-    for item in src:
-        if not item.exists():
-            log = Activity(
-                project=project,
+MAX_PAGE_SIZE = 10000
+# Columns returned when listing activities. error_log holds tracebacks and is only
+# returned on request.
+LIST_FIELDS = (
+    "id",
+    "activity",
+    "filename",
+    "target",
+    "status",
+    "size",
+    "throughput",
+    "checksum",
+    "destination",
+    "copy_status",
+    "copied_at",
+    "preprocess_status",
+    "preprocessed_at",
+    "remove_status",
+    "removed_at",
+    "created",
+    "updated",
+)
+
+
+def stage_task(name: str, *args: Any) -> Signature:
+    """Signature of a task of ``backend.activity.tasks``, referenced by name.
+
+    The tasks module imports this one (``discover_task`` runs :func:`discover_files`), so
+    the tasks are not imported here.
+    """
+    return signature(f"backend.activity.tasks.{name}", args=args)
+
+
+def copy_data(src: list[Path], project: Project) -> Offload:
+    """Register an offload of ``src`` into ``project`` and start discovering its files.
+
+    Walking the source trees happens in ``discover_task`` so that the request returns
+    straight away; the returned Offload is the handle to follow its progress.
+    """
+    offload = Offload.objects.create(
+        project=project, sources=[str(item.absolute()) for item in src]
+    )
+    transaction.on_commit(lambda: stage_task("discover_task", offload.pk).delay())
+    return offload
+
+
+def top_level_sources(src: list[Path]) -> list[Path]:
+    """Drop duplicate sources and sources nested inside another selected directory."""
+    roots = sorted({item.absolute() for item in src}, key=lambda item: len(item.parts))
+    kept: list[Path] = []
+    for item in roots:
+        if not any(item.is_relative_to(root) for root in kept):
+            kept.append(item)
+    return kept
+
+
+def iter_source_files(offload: Offload) -> Iterator[SourceFile]:
+    """Lazily yield the files to offload, recording missing sources as failed activities."""
+    for item in top_level_sources([Path(p) for p in offload.sources]):
+        try:
+            st = item.stat()
+        except FileNotFoundError:
+            log = Activity.objects.create(
+                project=offload.project,
+                offload=offload,
                 filename=str(item.absolute()),
-                target=project.location,
+                target=offload.project.location,
                 status=Activity.StatusChoices.ERROR,
+                copy_status=Activity.StatusChoices.ERROR,
                 error_log=f"Does not exist: {item.absolute()}",
             )
-            failed_jobs.append(log)
-        elif item.is_file():
-            all_items.add(item)
-        elif item.is_dir():
-            all_items.update(set(item.rglob("*")))
-    for file in all_items:
-        if file.is_dir():
-            shared_logger.info(f'Phenomate: copy_data(): Path is a directory, nothing to process: {file}')
-            continue
-            
-        if file.suffix.lower() in DISALLOWED:
-            shared_logger.info(f'Phenomate: copy_data(): Skipping {file.suffix.lower()} file: {file}')
+            record_writes([log])
+            Offload.objects.filter(pk=offload.pk).update(
+                copy_errors=F("copy_errors") + 1, updated=timezone.now()
+            )
             continue
-        
+        if stat.S_ISDIR(st.st_mode):
+            yield from walk_files([item], skip_suffixes=DISALLOWED)
+        elif item.suffix.lower() in DISALLOWED:
+            shared_logger.info(
+                f"Phenomate: copy_data(): Skipping {item.suffix.lower()} file: {item}"
+            )
+        else:
+            yield SourceFile(item, st.st_size)
+
+
+def discover_files(offload: Offload) -> None:
+    """Walk the offload sources and queue their files in batches as they are found.
+
+    Every ``PHENOMATE_DISCOVERY_BATCH_SIZE`` files the Activity rows are created and the
+    pipeline for them is dispatched, so copying starts before the walk has finished. A
+    batch is only cut between a primary sensor file and its companion files once the group
+    is complete, so a batch holds at most one group more than the batch size.
+    """
+    batch_size = getattr(settings, "PHENOMATE_DISCOVERY_BATCH_SIZE", 500)
+    candidates: list[SourceFile] = []
+    # The walker yields the files of a directory together
+    for _, listed in groupby(iter_source_files(offload), key=lambda file: file.path.parent):
+        files = list(listed)
+        for run in companion_runs([file.path for file in files]):
+            if len(candidates) >= batch_size:
+                queue_files(offload, candidates)
+                candidates = []
+            candidates.extend(files[index] for index in run)
+    if candidates:
+        queue_files(offload, candidates)
+
+
+def queue_files(offload: Offload, candidates: list[SourceFile]) -> None:
+    project = offload.project
+    queued_jobs: list[Activity] = []
+    skipped_jobs: list[Activity] = []
+    sizes = {file.path: file.size for file in candidates}
+    # Files already offloaded unchanged (same size, mtime and partial hash) are not copied again
+    pending, skipped = split_ingested(project, sizes)
+    for file in skipped:
+        log = Activity(
+            project=project,
+            offload=offload,
+            filename=str(file.absolute()),
+            target=project.location,
+            status=Activity.StatusChoices.SKIPPED,
+            copy_status=Activity.StatusChoices.SKIPPED,
+            error_log="Already offloaded to this project",
+        )
+        skipped_jobs.append(log)
+        shared_logger.info(f"Phenomate: copy_data(): File was already offloaded, skipping: {file}")
+    # Only queue what fits in the project volume next to the bytes already waiting for it
+    space = free_space(project.location) - queued_bytes(project)
+    rejected_jobs: list[Activity] = []
+    for file in pending:
         log = Activity(
             project=project,
+            offload=offload,
             filename=str(file.absolute()),
             target=project.location,
+            size=sizes[file],
         )
+        if log.size > space:
+            log.status = log.copy_status = Activity.StatusChoices.ERROR
+            log.error_log = str(InsufficientSpace(project.location, log.size, max(space, 0)))
+            rejected_jobs.append(log)
+            shared_logger.warning(f"Phenomate: copy_data(): Not enough free space for: {file}")
+            continue
+        space -= log.size
         queued_jobs.append(log)
-        shared_logger.info(f'Phenomate: copy_data(): File was added to the queue: {file}')
+        shared_logger.info(f"Phenomate: copy_data(): File was added to the queue: {file}")
 
-    Activity.objects.bulk_create(failed_jobs)
+    Activity.objects.bulk_create(skipped_jobs)
+    Activity.objects.bulk_create(rejected_jobs)
     Activity.objects.bulk_create(queued_jobs)
-    pipeline = group(
-        chain(
-            copy_task.s(job.pk),
-            preprocess_task.s(),
-            remove_task.s(),
-        )
-        for job in queued_jobs
+    record_writes([*skipped_jobs, *rejected_jobs, *queued_jobs])
+    queued_size = sum(job.size for job in queued_jobs)
+    Offload.objects.filter(pk=offload.pk).update(
+        files_found=F("files_found") + len(candidates),
+        files_skipped=F("files_skipped") + len(skipped_jobs),
+        copy_queued=F("copy_queued") + len(queued_jobs),
+        copy_queued_bytes=F("copy_queued_bytes") + queued_size,
+        copy_errors=F("copy_errors") + len(rejected_jobs),
+        total_bytes=F("total_bytes") + queued_size,
+        updated=timezone.now(),
     )
-    transaction.on_commit(lambda: pipeline.delay())
+    build_pipeline(queued_jobs).delay()
+
+
+def plan_batches(jobs: list[Activity]) -> tuple[list[list[Activity]], list[Activity]]:
+    """Pack small files into size-bounded batches.
+
+    Files of at most ``PHENOMATE_BATCH_SMALL_FILE_BYTES`` are grouped (in order) into batches
+    holding at most ``PHENOMATE_BATCH_MAX_FILES`` files and ``PHENOMATE_BATCH_MAX_BYTES``
+    bytes. Batching is disabled with ``PHENOMATE_BATCH_ENABLED = False``.
+
+    Returns:
+        tuple[list[list[Activity]], list[Activity]]: (batches, jobs to run on their own)
+    """
+    if not getattr(settings, "PHENOMATE_BATCH_ENABLED", True):
+        return [], jobs
+    small_file_bytes = getattr(settings, "PHENOMATE_BATCH_SMALL_FILE_BYTES", 4 * 1024 * 1024)
+    max_files = getattr(settings, "PHENOMATE_BATCH_MAX_FILES", 200)
+    max_bytes = getattr(settings, "PHENOMATE_BATCH_MAX_BYTES", 256 * 1024 * 1024)
+    batches: list[list[Activity]] = []
+    singles: list[Activity] = []
+    batch: list[Activity] = []
+    batch_bytes = 0
+    for job in jobs:
+        if job.size > small_file_bytes:
+            singles.append(job)
+            continue
+        if batch and (len(batch) >= max_files or batch_bytes + job.size > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(job)
+        batch_bytes += job.size
+    if batch:
+        batches.append(batch)
+    # A batch of one gains nothing over the per-file chain
+    singles.extend(job for batch in batches if len(batch) == 1 for job in batch)
+    return [batch for batch in batches if len(batch) > 1], singles
+
+
+def build_pipeline(jobs: list[Activity]) -> group:
+    """Schedule queued files as companion groups, small-file batches and stage chains.
+
+    Each sensor file with companions gets a group_task, small files are packed into
+    batch_tasks and every remaining file gets its own stage chain. Chains end with
+    preprocessing, which hands the file to the removal batch of its offload.
+    """
+    file_groups, jobs = plan_groups(jobs)
+    batches, singles = plan_batches(jobs)
+    return group(
+        *(stage_task("group_task", [job.pk for job in file_group]) for file_group in file_groups),
+        *(stage_task("batch_task", [job.pk for job in batch]) for batch in batches),
+        *(chain(stage_task("copy_task", job.pk), stage_task("preprocess_task")) for job in singles),
+    )
+
+
+def encode_cursor(log: dict[str, Any]) -> str:
+    value = f"{log['created'].isoformat()},{log['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[dt.datetime, int]:
+    try:
+        created, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split(",")
+        return dt.datetime.fromisoformat(created), int(pk)
+    except ValueError as exc:
+        raise ValueError(f"Invalid cursor: {cursor}") from exc
+
+
+def list_activity_page(
+    project: Project,
+    status: str | None = None,
+    activity: str | None = None,
+    filename_prefix: str | None = None,
+    updated_since: dt.datetime | None = None,
+    cursor: str | None = None,
+    limit: int | None = None,
+    include_error_log: bool = False,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """One page of the activities of a project, newest first.
+
+    Pages are keyed on ``(created, id)`` rather than an offset, so that each page is a
+    range scan of the ``(project, created)`` index however deep the client pages.
+
+    Args:
+        project (Project): project to list
+        status (str | None, optional): only activities in this status
+        activity (str | None, optional): only activities at this stage
+        filename_prefix (str | None, optional): only source files starting with this prefix
+        updated_since (dt.datetime | None, optional): only activities written after
+        this time, less ``PHENOMATE_ACTIVITY_CHANGES_OVERLAP`` seconds
+        cursor (str | None, optional): cursor returned with the previous page
+        limit (int | None, optional): page size. Defaults to ``PHENOMATE_ACTIVITY_PAGE_SIZE``
+        when paging from a cursor; without limit nor cursor every activity is returned.
+        include_error_log (bool, optional): also return ``error_log``. Defaults to False.
+
+    Raises:
+        ValueError: the cursor is malformed
+
+    Returns:
+        tuple[list[dict[str, Any]], str | None]: (activities, cursor of the next page or
+        None on the last page)
+    """
+    if limit is None and cursor:
+        limit = getattr(settings, "PHENOMATE_ACTIVITY_PAGE_SIZE", 1000)
+    queryset = Activity.objects.filter(project=project)
+    if status:
+        queryset = queryset.filter(status=status)
+    if activity:
+        queryset = queryset.filter(activity=activity)
+    if filename_prefix:
+        queryset = queryset.filter(filename__startswith=filename_prefix)
+    if updated_since:
+        queryset = queryset.filter(updated__gte=changes_after(updated_since))
+    if cursor:
+        created, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+    fields = (*LIST_FIELDS, "error_log") if include_error_log else LIST_FIELDS
+    queryset = queryset.order_by("-created", "-pk").values(*fields)
+    if limit is None:
+        return list(queryset), None
+    limit = min(limit, MAX_PAGE_SIZE)
+    page = list(queryset[: limit + 1])
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
+def retry_delay(attempts: int) -> int:
+    """Seconds to wait before retry number ``attempts + 1`` of a file.
+
+    The first retry runs straight away, then the delay doubles from
+    ``PHENOMATE_RETRY_BACKOFF_BASE`` up to ``PHENOMATE_RETRY_BACKOFF_MAX`` seconds.
+    """
+    if attempts <= 0:
+        return 0
+    base = getattr(settings, "PHENOMATE_RETRY_BACKOFF_BASE", 10)
+    maximum = getattr(settings, "PHENOMATE_RETRY_BACKOFF_MAX", 3600)
+    return int(min(base * 2 ** (attempts - 1), maximum))
+
+
+def claim_retries(logs: list[Activity], eligible: Q) -> set[int]:
+    """Claim the activities still ``eligible`` for a retry with one update.
+
+    The claim increments their attempts counter and re-queues failed stages, so that a
+    concurrent retry no longer finds them eligible.
+
+    Returns:
+        set[int]: primary keys of the claimed activities
+    """
+    claimed_at = timezone.now()
+    queued = Value(Activity.StatusChoices.QUEUED)
+    failed = Q(status=Activity.StatusChoices.ERROR)
+    stage_statuses = {
+        status_field: Case(When(failed & Q(activity=stage), then=queued), default=F(status_field))
+        for stage, (status_field, _) in Activity.STAGE_FIELDS.items()
+    }
+    pks = [log.pk for log in logs]
+    Activity.objects.filter(eligible, pk__in=pks).update(
+        attempts=F("attempts") + 1,
+        updated=claimed_at,
+        status=Activity.StatusChoices.QUEUED,
+        error_log=Case(When(failed, then=Value("")), default=F("error_log")),
+        **stage_statuses,
+    )
+    # Rows written since the claim are left to the stale retry that follows
+    return set(Activity.objects.filter(pk__in=pks, updated=claimed_at).values_list("pk", flat=True))
+
+
+def retry_activities(queryset: QuerySet[Activity], stale_after: float | None = None) -> int:
+    """Re-queue the current stage of the selected activities and dispatch their pipelines.
+
+    Activities are claimed and dispatched ``PHENOMATE_DISCOVERY_BATCH_SIZE`` at a time, each
+    batch with one conditional update (see :func:`claim_retries`), so that concurrent
+    retries dispatch an activity once. Failed activities are retried straight away; queued
+    ones only once they have not been written for ``stale_after`` seconds, as their task
+    may still be queued or running. The stage tasks skip the stages that already completed.
+
+    Args:
+        queryset (QuerySet[Activity]): activities to retry
+        stale_after (float | None, optional): seconds, ``PHENOMATE_RETRY_STALE_AFTER`` by
+        default
+
+    Returns:
+        int: number of activities re-queued
+    """
+    batch_size = getattr(settings, "PHENOMATE_DISCOVERY_BATCH_SIZE", 500)
+    if stale_after is None:
+        stale_after = getattr(settings, "PHENOMATE_RETRY_STALE_AFTER", 900)
+    stale = timezone.now() - dt.timedelta(seconds=stale_after)
+    eligible = Q(status=Activity.StatusChoices.ERROR) | Q(
+        status=Activity.StatusChoices.QUEUED, updated__lt=stale
+    )
+    logs = queryset.filter(eligible).select_related("project").order_by("pk")
+    retried = 0
+    batch: list[Activity] = []
+    for log in logs.iterator(chunk_size=batch_size):
+        batch.append(log)
+        if len(batch) >= batch_size:
+            retried += requeue_batch(batch, eligible)
+            batch = []
+    if batch:
+        retried += requeue_batch(batch, eligible)
+    return retried
+
+
+def requeue_batch(batch: list[Activity], eligible: Q) -> int:
+    """Claim a batch of activities and dispatch the claimed ones.
+
+    Returns:
+        int: number of activities dispatched
+    """
+    claimed = claim_retries(batch, eligible)
+    jobs: list[Activity] = []
+    for log in batch:
+        if log.pk not in claimed:
+            # Retried concurrently, or written by its task since it was read
+            continue
+        log.attempts += 1
+        if log.status == Activity.StatusChoices.ERROR:
+            # Written by the claim already: recorded for the progress counters and the
+            # changes feed
+            log.error_log = ""
+            activity_writer.update(
+                log, "error_log", *log.set_stage_status(Activity.StatusChoices.QUEUED)
+            )
+        jobs.append(log)
+    if jobs:
+        dispatch_retries(jobs)
+    return len(jobs)
+
+
+def dispatch_retries(jobs: list[Activity]) -> None:
+    # The tasks read the rows back: write the new stage statuses first
+    activity_writer.flush()
+    by_delay: dict[int, list[Activity]] = {}
+    for job in jobs:
+        by_delay.setdefault(retry_delay(job.attempts - 1), []).append(job)
+    for delay, delayed_jobs in by_delay.items():
+        build_pipeline(delayed_jobs).apply_async(countdown=delay)
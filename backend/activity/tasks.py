@@ -1,127 +1,397 @@
-import shutil
+import contextlib
 import traceback
 from pathlib import Path
 from typing import cast
 
 from appm import ProjectManager
-from appm.exceptions import FileFormatMismatch
+from appm.exceptions import FileFormatMismatch, TemplateEngineException
+from django.conf import settings
+from django.utils import timezone
 from phenomate_core import get_preprocessor
 
-from backend.activity.models import Activity
-from celery import shared_task
+from backend.activity.backpressure import check_free_space, copy_throttle
+from backend.activity.copy_engine import (
+    PARTIAL_SUFFIX,
+    CopyEngine,
+    CopyInProgress,
+    CopyResult,
+    get_copy_engine,
+)
+from backend.activity.ingest_index import ingested_entry, record_ingested
+from backend.activity.models import Activity, IngestedFile, Offload
+from backend.activity.removal import remove_files
+from backend.activity.scheduler import preprocess_admission
+from backend.activity.service import discover_files
+from backend.activity.verify import ChecksumMismatch, new_digest, verify_copy, verify_enabled
+from backend.activity.writer import activity_writer
+from backend.project.service import load_project_manager
+from celery import Task, shared_task
 
 # from appm.utils import get_logger
 # shared_logger = get_logger('django')
 
 from celery.utils.log import get_task_logger
+
 shared_logger = get_task_logger(__name__)
 
+# Activity fields set by the copy stage
+COPY_FIELDS = ("target", "destination", "size", "throughput", "checksum")
+
+
+def schedule_removal(log: Activity) -> None:
+    """Hand a file that reached the remove stage to the next removal batch of its offload.
+
+    At most one ``remove_batch_task`` is waiting per offload; it removes every file of the
+    offload pending removal when it runs. Files without an offload are removed right away.
+    The file's transition must be written before calling this.
+    """
+    if log.offload_id is None:
+        remove_files([log])
+        activity_writer.flush()
+        return
+    claimed = Offload.objects.filter(pk=log.offload_id, remove_scheduled=False).update(
+        remove_scheduled=True
+    )
+    if claimed:
+        remove_batch_task.apply_async(
+            (log.offload_id,), countdown=getattr(settings, "PHENOMATE_REMOVE_BATCH_DELAY", 5)
+        )
+
+
 @shared_task
-def remove_task(log_pk: int) -> None:
-    log = Activity.objects.get(pk=log_pk)
-    src = Path(log.filename)
-    
-    shared_logger.info(f'Phenomate: remove_task(): src.suffix.lower(): {src.suffix.lower()}')
-    
-    ## If any of these result in True, then do not delete the file
-    CANBUS  = 'canbus' not in src.stem.lower()  # these are csv files, do not delete them 
-    RS3     = src.suffix.lower() != ".25b"      # has specialised processing in phenomate-core for .25o and .25p
-    LIDAR3D = src.suffix.lower() != ".pcap"     # has specialised processing in phenomate-core for .json
-    # The .bin file should not be deleted, has corresponding .csv file, 
-    # that should not be deleted, and a _GNSS.csv file that has specialised processing
-    IMU     = 'imu1' not in src.stem.lower()
-    shared_logger.info(f'Phenomate: remove_task() file: {src}: CANBUS: {CANBUS}; RS3: {RS3}; LIDAR3D: {LIDAR3D}; IMU: {IMU};')
-    
-    if LIDAR3D and RS3 and CANBUS and IMU :
-        src.unlink()  
-        
-    log.status = Activity.StatusChoices.COMPLETED
-    log.save()
+def remove_batch_task(offload_pk: int) -> None:
+    # Files reaching the remove stage from now on need another batch
+    Offload.objects.filter(pk=offload_pk).update(remove_scheduled=False)
+    batch_size = getattr(settings, "PHENOMATE_REMOVE_BATCH_SIZE", 500)
+    logs = list(
+        Activity.objects.select_related("project").filter(
+            offload_id=offload_pk,
+            activity=Activity.ActivityChoices.REMOVED,
+            status=Activity.StatusChoices.QUEUED,
+        )[:batch_size]
+    )
+    remove_files(logs)
+    activity_writer.flush()
+    if len(logs) == batch_size:
+        schedule_removal(logs[0])
 
 
 @shared_task
-def preprocess_task(log_pk: int) -> int:
-    log = Activity.objects.get(pk=log_pk)
+def remove_task(log_pk: int) -> None:
+    """Remove stage of a single file, for chains queued before removal was batched."""
+    remove_files([Activity.objects.select_related("project").get(pk=log_pk)])
+
+
+def match_components(log: Activity) -> dict[str, str | None]:
+    """Components (sensor, ...) appm matches in the name of the file copied by ``log``.
+
+    Raises:
+        ValueError: the file name has no sensor component
+    """
+    manager = load_project_manager(log.project.location)
+    components = manager.match(Path(log.destination).name)
+    if "sensor" not in components or components["sensor"] is None:
+        raise ValueError("Missing component information for preprocessing")
+    return components
+
+
+def preprocess_file(log: Activity) -> Activity:
+    if not log.stage_pending(Activity.ActivityChoices.PREPROCESSED):
+        return log
     try:
-        src = Path(log.filename)
+        src = Path(log.destination)
         dst = Path(log.target)
-        shared_logger.info(f'Phenomate: preprocess_task():project.location : {log.project.location}')
-        manager = ProjectManager.load_project(log.project.location)
-        name = src.name
-        components = manager.match(name)
-        if "sensor" not in components or components["sensor"] is None:
-            raise ValueError("Missing component information for preprocessing")
-            
+        shared_logger.info(
+            f"Phenomate: preprocess_task():project.location : {log.project.location}"
+        )
+        components = match_components(log)
+
         # Retrieve the correct phenomate-core preprocessing class from the class factory
         # The correct class is found by keyword found in the data file filename
         # e.g. sensor = one of: jai, rs3, oak, [hyperspec, dark, white], canbus
         processor_class = get_preprocessor(
             components["sensor"], cast("str", components.get("rest", ""))
         )
-        
+
         exten = components.get("rest", "")
-        
+
         # Instantiate a phenomate-core preprocessing object from the BasePreprocessor
         processor = processor_class(src, exten)
         processor.extract()
         processor.save(dst)
-        log.status = Activity.StatusChoices.COMPLETED
-        # Queue next task
-        next_log = Activity.objects.create(
-            activity=Activity.ActivityChoices.REMOVED,
-            project=log.project,
-            parent=log,
-            filename=log.filename,
-            status=Activity.StatusChoices.QUEUED,
-        )
-        # Save logs to db
-        next_log.save()
-        log.save()
-        return next_log.pk
+        # Queue next stage
+        activity_writer.update(log, *log.complete_stage())
+        return log
     except Exception:
-        log.status = Activity.StatusChoices.ERROR
         log.error_log = traceback.format_exc()
-        log.save()
+        activity_writer.update(
+            log, *log.set_stage_status(Activity.StatusChoices.ERROR), "error_log"
+        )
         raise
 
 
-@shared_task
-def copy_task(log_pk: int) -> int:
-    log = Activity.objects.get(pk=log_pk)
-    dst = Path(log.target)
+def preprocess_admitted(task: Task, log: Activity) -> Activity:
+    """Preprocess ``log`` once admitted by the scheduler, else retry ``task`` later."""
+    try:
+        sensor = cast("str", match_components(log)["sensor"])
+    except (TemplateEngineException, ValueError) as exc:
+        # Admitted as an unknown sensor: preprocess_file() records the error
+        shared_logger.warning(f"Phenomate: preprocess_task() cannot match {log.destination}: {exc}")
+        sensor = ""
+    with preprocess_admission(sensor, log.size) as admitted:
+        if not admitted:
+            # Leave the worker to jobs that fit now
+            raise task.retry(countdown=getattr(settings, "PHENOMATE_PREPROCESS_RETRY_DELAY", 10))
+        return preprocess_file(log)
+
+
+@shared_task(bind=True, max_retries=None)
+def preprocess_task(self: Task, log_pk: int) -> int:
+    log = Activity.objects.select_related("project").get(pk=log_pk)
+    if not log.stage_pending(Activity.ActivityChoices.PREPROCESSED):
+        if log.stage_pending(Activity.ActivityChoices.REMOVED):
+            schedule_removal(log)
+        return log.pk
+    log = preprocess_admitted(self, log)
+    # The removal batch reads this row back: write the transition first
+    activity_writer.flush()
+    if log.stage_pending(Activity.ActivityChoices.REMOVED):
+        schedule_removal(log)
+    return log.pk
+
+
+def resolve_destination(manager: ProjectManager, src: Path) -> Path:
+    """Work out and create the project directory appm places ``src`` in.
+
+    Mirrors ``ProjectManager.copy_file`` without the copy itself: the placement is derived
+    from the (Septentrio-normalised) file name and a ``.origin`` file recording the source
+    path is written next to the data so that phenomate-core can find companion files.
+
+    Raises:
+        FileFormatMismatch: the file name does not match the template
+    """
+    transformed_filename = manager.special_filename_processing(
+        src.name, r"septentrio", "Septentrio.bin"
+    )
+    dst_path = manager.location / manager.get_file_placement(transformed_filename)
+    dst_path.mkdir(parents=True, exist_ok=True)
+    origin = dst_path / (src.name + ".origin")
+    with origin.open("w", encoding="utf-8") as f:
+        f.write(str(src))
+    return dst_path
+
+
+def copy_with_checkpoints(engine: CopyEngine, log: Activity, src: Path, dst: Path) -> CopyResult:
+    """Copy ``src`` to ``dst``, resuming from the checkpoint stored on ``log`` for large files.
+
+    Files of at least ``PHENOMATE_RESUMABLE_MIN_SIZE`` bytes are copied through a partial
+    file and each checkpoint (offset and running hash) is saved on the Activity straight
+    away, so that a retried copy_task continues from the last verified offset.
+    """
+    if src.stat().st_size < getattr(settings, "PHENOMATE_RESUMABLE_MIN_SIZE", 512 * 1024 * 1024):
+        return engine.copy(src, dst, digest=new_digest() if verify_enabled() else None)
+
+    def save_checkpoint(offset: int, checkpoint_hash: str) -> None:
+        log.checkpoint_offset = offset
+        log.checkpoint_hash = checkpoint_hash
+        # Bumping updated keeps a long copy from being retried as stale
+        Activity.objects.filter(pk=log.pk).update(
+            checkpoint_offset=offset, checkpoint_hash=checkpoint_hash, updated=timezone.now()
+        )
+
+    if log.checkpoint_offset:
+        shared_logger.info(
+            f"Phenomate: copy_task() resuming {src} from offset {log.checkpoint_offset}"
+        )
+    return engine.copy_resumable(
+        src, dst, log.checkpoint_offset, log.checkpoint_hash, on_checkpoint=save_checkpoint
+    )
+
+
+def copy_or_reuse(engine: CopyEngine, log: Activity, src: Path, dst: Path) -> CopyResult:
+    """Copy ``src`` to ``dst`` unless ``dst`` already holds a finished copy of it.
+
+    A finished copy has the size and modification time of the source, as set by
+    ``shutil.copystat`` at the end of every copy; it is left from an attempt whose status
+    update was lost. The free space needed excludes what a resumed copy already wrote.
+    """
+    st = src.stat()
+    with contextlib.suppress(OSError):
+        dst_st = dst.stat()
+        if (dst_st.st_size, dst_st.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            shared_logger.info(f"Phenomate: copy_task() {dst} is already a copy of {src}")
+            return CopyResult(
+                bytes_copied=0, seconds=0.0, engine="existing", resumed_from=st.st_size
+            )
+    # A resumed copy only writes what its partial file does not hold yet
+    resumed = log.checkpoint_offset if dst.with_name(dst.name + PARTIAL_SUFFIX).exists() else 0
+    check_free_space(dst.parent, st.st_size - min(resumed, st.st_size))
+    return copy_with_checkpoints(engine, log, src, dst)
+
+
+def checked_copy(engine: CopyEngine, log: Activity, src: Path, dst: Path) -> CopyResult:
+    """:func:`copy_or_reuse`, then verify the copy when ``PHENOMATE_VERIFY_COPIES`` is on.
+
+    The content digest is stored in ``log.checksum``. A copy that does not match is deleted
+    so that a retry copies the file again.
+
+    Raises:
+        ChecksumMismatch: the copy does not have the content of the source
+    """
+    result = copy_or_reuse(engine, log, src, dst)
+    if verify_enabled():
+        try:
+            log.checksum = verify_copy(src, dst, result.digest)
+        except ChecksumMismatch:
+            dst.unlink(missing_ok=True)
+            raise
+    return result
+
+
+def copy_file(
+    log: Activity, engine: CopyEngine | None = None, ingested: list[IngestedFile] | None = None
+) -> Activity:
+    """Copy the source file of ``log`` into its project.
+
+    The copied file is added to the ingest index, or to ``ingested`` for the caller to
+    record with the other files of its task.
+    """
+    if not log.stage_pending(Activity.ActivityChoices.COPIED):
+        return log
+    # Not log.target: an earlier attempt may have set it to the placement directory
+    dst = Path(log.project.location)
     src = Path(log.filename)
     name = src.name
-    manager = ProjectManager.load_project(dst)
+    manager = load_project_manager(dst)
+    engine = engine or get_copy_engine(throttle=copy_throttle.consume)
     try:
         # If file can be parsed -> put to the correct location and initiate preprocessing
-        dst_path = manager.copy_file(src)
-        shared_logger.info(f'Phenomate: copy_task() dst_path : {dst_path}')
+        dst_path = resolve_destination(manager, src)
+        shared_logger.info(f"Phenomate: copy_task() dst_path : {dst_path}")
         file_path = dst_path / name
-        log.status = Activity.StatusChoices.COMPLETED
-        log.target = str(dst_path.absolute())
-        # Queue next task
-        next_log = Activity.objects.create(
-            activity=Activity.ActivityChoices.PREPROCESSED,
-            project=log.project,
-            parent=log,
-            filename=str(file_path.absolute()),
-            target=str(dst_path.absolute()),
-            status=Activity.StatusChoices.QUEUED,
+        result = checked_copy(engine, log, src, file_path)
+        shared_logger.info(
+            f"Phenomate: copy_task() copied {result.bytes_copied} bytes with {result.engine} "
+            f"at {result.throughput / 1e6:.1f} MB/s"
         )
-        # Save logs to db
-        next_log.save()
-        log.save()
-        return next_log.pk
+        index_copy(log, src, ingested)
+        log.target = str(dst_path.absolute())
+        log.destination = str(file_path.absolute())
+        log.size = result.size
+        log.throughput = result.throughput
+        # Queue next stage
+        activity_writer.update(log, *log.complete_stage(), *COPY_FIELDS)
+        return log
+    except CopyInProgress:
+        # A retry raced the task already copying the file, which records the outcome
+        shared_logger.info(f"Phenomate: copy_task() {src} is already being copied")
+        return log
     except FileFormatMismatch:
         # If file cannot be matched -> dumped at root dir
-        shutil.copy2(src, dst)
-        log.status = Activity.StatusChoices.COMPLETED
+        result = checked_copy(engine, log, src, dst / name)
+        index_copy(log, src, ingested)
         log.target = str(dst.absolute())
-        log.save()
+        log.destination = str((dst / name).absolute())
+        log.size = result.size
+        log.throughput = result.throughput
+        activity_writer.update(
+            log, *log.set_stage_status(Activity.StatusChoices.COMPLETED), *COPY_FIELDS
+        )
         raise
     except Exception:
         # Uncatched exception -> log error
-        log.status = Activity.StatusChoices.ERROR
         log.error_log = traceback.format_exc()
-        log.save()
+        activity_writer.update(
+            log, *log.set_stage_status(Activity.StatusChoices.ERROR), "error_log"
+        )
+        raise
+
+
+def index_copy(log: Activity, src: Path, ingested: list[IngestedFile] | None) -> None:
+    entry = ingested_entry(log.project, src, log.checksum)
+    if ingested is None:
+        record_ingested([entry])
+    else:
+        ingested.append(entry)
+
+
+@shared_task
+def copy_task(log_pk: int) -> int:
+    log = copy_file(Activity.objects.get(pk=log_pk))
+    # The next task of the chain reads this row back: write the transition first
+    activity_writer.flush()
+    return log.pk
+
+
+@shared_task
+def batch_task(log_pks: list[int]) -> None:
+    """Copy a batch of small files in one task, then queue their preprocessing.
+
+    Each file keeps its own Activity and stage statuses. A file whose copy fails is left in
+    the state recorded by the copy stage and the batch moves on to the next file. Copied
+    files are preprocessed by their own ``preprocess_task``, under preprocessing admission,
+    which hands them to the removal batch of their offload.
+    """
+    logs = Activity.objects.select_related("project").in_bulk(log_pks)
+    engine = get_copy_engine(throttle=copy_throttle.consume)
+    ingested: list[IngestedFile] = []
+    for log_pk in log_pks:
+        log = logs.get(log_pk)
+        if log is None:
+            continue
+        try:
+            copy_file(log, engine, ingested)
+        except FileFormatMismatch:
+            shared_logger.info(
+                f"Phenomate: batch_task() copied unmatched file to project root: {log.filename}"
+            )
+        except Exception:
+            shared_logger.exception(f"Phenomate: batch_task() failed to copy: {log.filename}")
+    record_ingested(ingested)
+    # The preprocessing tasks read these rows back: write the transitions first
+    activity_writer.flush()
+    for log in logs.values():
+        if log.stage_pending(Activity.ActivityChoices.PREPROCESSED):
+            preprocess_task.delay(log.pk)
+
+
+@shared_task
+def group_task(log_pks: list[int]) -> None:
+    """Copy a primary sensor file and its companion files, then queue their preprocessing.
+
+    Every file of the group is in the project before any of them is preprocessed by its
+    ``preprocess_task``.
+    """
+    logs = Activity.objects.select_related("project").in_bulk(log_pks)
+    group = [logs[log_pk] for log_pk in log_pks if log_pk in logs]
+    engine = get_copy_engine(throttle=copy_throttle.consume)
+    ingested: list[IngestedFile] = []
+    for log in group:
+        try:
+            copy_file(log, engine, ingested)
+        except FileFormatMismatch:
+            shared_logger.info(
+                f"Phenomate: group_task() copied unmatched file to project root: {log.filename}"
+            )
+        except Exception:
+            shared_logger.exception(f"Phenomate: group_task() failed to copy: {log.filename}")
+    record_ingested(ingested)
+    # The preprocessing tasks read these rows back: write the transitions first
+    activity_writer.flush()
+    for log in group:
+        if log.stage_pending(Activity.ActivityChoices.PREPROCESSED):
+            preprocess_task.delay(log.pk)
+
+
+@shared_task
+def discover_task(offload_pk: int) -> None:
+    offload = Offload.objects.select_related("project").get(pk=offload_pk)
+    try:
+        discover_files(offload)
+        offload.status = Offload.StatusChoices.DISCOVERED
+    except Exception:
+        offload.status = Offload.StatusChoices.ERROR
+        offload.error_log = traceback.format_exc()[-2048:]
         raise
+    finally:
+        offload.save(update_fields=["status", "error_log", "updated"])
@@ -1 +1,492 @@
-# Create your tests here.
+import datetime as dt
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from backend.activity.changes import remove_activities
+from backend.activity.copy_engine import (
+    PARTIAL_SUFFIX,
+    AutoEngine,
+    BufferedEngine,
+    CopyFileRangeEngine,
+    CopyNotSupported,
+    IncompleteCopy,
+)
+from backend.activity.grouping import companion_runs, find_groups
+from backend.activity.ingest_index import ingested_entry, record_ingested, split_ingested
+from backend.activity.models import Activity, Offload
+from backend.activity.service import list_activity_page, retry_activities
+from backend.activity.tasks import copy_or_reuse
+from backend.activity.writer import ActivityWriter, activity_writer
+from backend.project.models import Project
+
+
+class CopyEngineTests(SimpleTestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.src = self.root / "src.bin"
+        self.src.write_bytes(b"phenomate" * 1000)
+        self.dst = self.root / "dst.bin"
+
+    def test_copy_file_range_without_data_is_not_supported(self) -> None:
+        engine = CopyFileRangeEngine(buffer_size=4096)
+        with (
+            mock.patch("os.copy_file_range", return_value=0, create=True),
+            self.assertRaises(CopyNotSupported),
+        ):
+            engine.copy(self.src, self.dst)
+        self.assertFalse(self.dst.exists())
+        self.assertEqual(list(self.root.iterdir()), [self.src])
+
+    def test_auto_engine_falls_back_when_copy_file_range_copies_nothing(self) -> None:
+        engine = AutoEngine(buffer_size=4096)
+        with mock.patch("os.copy_file_range", return_value=0, create=True):
+            result = engine.copy(self.src, self.dst)
+        self.assertNotEqual(result.engine, CopyFileRangeEngine.name)
+        self.assertEqual(result.bytes_copied, self.src.stat().st_size)
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+
+    def test_short_copy_keeps_destination(self) -> None:
+        self.dst.write_bytes(b"previous copy")
+        engine = CopyFileRangeEngine(buffer_size=4096)
+        with (
+            mock.patch.object(CopyFileRangeEngine, "transfer", return_value=100),
+            self.assertRaises(IncompleteCopy),
+        ):
+            engine.copy(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), b"previous copy")
+        self.assertEqual(sorted(self.root.iterdir()), [self.dst, self.src])
+
+    @override_settings(PHENOMATE_COPY_CHECKPOINT_BYTES=4096)
+    def test_resumable_copy_resumes_from_the_last_checkpoint(self) -> None:
+        engine = BufferedEngine(buffer_size=1024)
+        transfer = engine.transfer
+        checkpoints: list[tuple[int, str]] = []
+
+        def first_segment_only(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+            return transfer(src_fd, dst_fd, offset, count) if offset == 0 else 0
+
+        with (
+            mock.patch.object(engine, "transfer", side_effect=first_segment_only),
+            self.assertRaises(IncompleteCopy),
+        ):
+            engine.copy_resumable(
+                self.src, self.dst, on_checkpoint=lambda *c: checkpoints.append(c)
+            )
+        self.assertEqual([offset for offset, _ in checkpoints], [4096])
+        partial = self.dst.with_name(self.dst.name + PARTIAL_SUFFIX)
+        self.assertEqual(partial.stat().st_size, 4096)
+
+        result = engine.copy_resumable(self.src, self.dst, *checkpoints[-1])
+        self.assertEqual((result.resumed_from, result.bytes_copied), (4096, 9000 - 4096))
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+        self.assertFalse(partial.exists())
+
+    @override_settings(PHENOMATE_COPY_CHECKPOINT_BYTES=4096)
+    def test_resumable_copy_restarts_when_the_partial_file_changed(self) -> None:
+        engine = BufferedEngine(buffer_size=1024)
+        partial = self.dst.with_name(self.dst.name + PARTIAL_SUFFIX)
+        partial.write_bytes(b"x" * 4096)
+        result = engine.copy_resumable(self.src, self.dst, 4096, "0" * 64)
+        self.assertEqual((result.resumed_from, result.bytes_copied), (0, 9000))
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+
+    @mock.patch("backend.activity.tasks.check_free_space")
+    def test_resumed_copy_only_needs_the_remaining_space(self, check_free_space: mock.Mock) -> None:
+        log = Activity(checkpoint_offset=4096)
+        engine = mock.Mock()
+        copy_or_reuse(engine, log, self.src, self.dst)
+        check_free_space.assert_called_with(self.root, 9000)
+        self.dst.with_name(self.dst.name + PARTIAL_SUFFIX).write_bytes(b"x" * 4096)
+        copy_or_reuse(engine, log, self.src, self.dst)
+        check_free_space.assert_called_with(self.root, 9000 - 4096)
+
+
+@mock.patch.object(ActivityWriter, "_ensure_flusher")
+class ActivityWriterTests(TestCase):
+    def setUp(self) -> None:
+        self.project = Project.objects.create(
+            year=2025, summary="writer", internal=True, location="/tmp/writer"
+        )
+        self.offload = Offload.objects.create(project=self.project)
+        self.saved = Activity.objects.create(
+            project=self.project, offload=self.offload, filename="/src/a.bin"
+        )
+
+    def test_failed_flush_keeps_pending_writes(self, _: mock.Mock) -> None:
+        writer = ActivityWriter()
+        writer.update(self.saved, *self.saved.complete_stage())
+        created = writer.create(
+            Activity(project=self.project, offload=self.offload, filename="/src/b.bin")
+        )
+        with (
+            mock.patch.object(Activity.objects, "bulk_update", side_effect=DatabaseError),
+            self.assertRaises(DatabaseError),
+        ):
+            writer.flush()
+        self.assertIsNone(created.pk)
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(Activity.objects.get(pk=self.saved.pk).copy_status, "QUEUED")
+        self.offload.refresh_from_db()
+        self.assertEqual(self.offload.copy_completed, 0)
+
+        writer.flush()
+        self.assertEqual(Activity.objects.count(), 2)
+        self.assertTrue(Activity.objects.filter(pk=created.pk).exists())
+        self.assertEqual(Activity.objects.get(pk=self.saved.pk).copy_status, "COMPLETED")
+        self.offload.refresh_from_db()
+        self.assertEqual(self.offload.copy_completed, 1)
+
+
+class CollapseChainsMigrationTests(TransactionTestCase):
+    migrate_from = [("activity", "0006_offload")]
+    migrate_to = [("activity", "0007_activity_stages")]
+
+    def migrate(self, targets: list[tuple[str, str]]) -> MigrationExecutor:
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor
+
+    def setUp(self) -> None:
+        self.apps = self.migrate(self.migrate_from).loader.project_state(self.migrate_from).apps
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_chain_is_collapsed_into_one_staged_row(self) -> None:
+        Project = self.apps.get_model("project", "Project")
+        OldActivity = self.apps.get_model("activity", "Activity")
+        project = Project.objects.create(
+            year=2025, summary="migration", internal=True, location="/proj"
+        )
+        copy = OldActivity.objects.create(
+            project=project,
+            activity="COPY",
+            filename="/src/a.bin",
+            target="/proj",
+            status="COMPLETED",
+        )
+        preproc = OldActivity.objects.create(
+            project=project,
+            parent=copy,
+            activity="PREPROC",
+            filename="/proj/raw/a.bin",
+            target="/proj/raw",
+            status="COMPLETED",
+        )
+        OldActivity.objects.create(
+            project=project,
+            parent=preproc,
+            activity="REMOVE",
+            filename="/proj/raw/a.bin",
+            status="ERROR",
+            error_log="busy",
+        )
+        # Its COPY row was deleted
+        orphan = OldActivity.objects.create(
+            project=project, activity="PREPROC", filename="/proj/raw/b.bin", status="QUEUED"
+        )
+
+        executor = self.migrate(self.migrate_to)
+        Activity = executor.loader.project_state(self.migrate_to).apps.get_model(
+            "activity", "Activity"
+        )
+        fields = (
+            "pk",
+            "activity",
+            "status",
+            "filename",
+            "destination",
+            "target",
+            "error_log",
+            "copy_status",
+            "preprocess_status",
+            "remove_status",
+        )
+        self.assertEqual(
+            list(Activity.objects.order_by("pk").values_list(*fields)),
+            [
+                (
+                    copy.pk,
+                    "REMOVE",
+                    "ERROR",
+                    "/src/a.bin",
+                    "/proj/raw/a.bin",
+                    "/proj/raw",
+                    "busy",
+                    "COMPLETED",
+                    "COMPLETED",
+                    "ERROR",
+                ),
+                (
+                    orphan.pk,
+                    "PREPROC",
+                    "QUEUED",
+                    "/proj/raw/b.bin",
+                    "/proj/raw/b.bin",
+                    "",
+                    "",
+                    "COMPLETED",
+                    "QUEUED",
+                    "",
+                ),
+            ],
+        )
+        self.assertIsNotNone(Activity.objects.get(pk=copy.pk).preprocessed_at)
+
+
+class ActivityListingETagTests(TestCase):
+    def setUp(self) -> None:
+        self.project = Project.objects.create(
+            year=2025, summary="etag", internal=True, location="/tmp/etag"
+        )
+        Activity.objects.bulk_create(
+            Activity(project=self.project, filename=f"/src/{name}.bin") for name in "abc"
+        )
+        self.url = f"/api/activity/{self.project.pk}"
+
+    def test_etag_depends_on_the_query(self) -> None:
+        first = self.client.get(self.url, {"limit": 2})
+        cursor = first["X-Next-Cursor"]
+        second = self.client.get(self.url, {"limit": 2, "cursor": cursor})
+        self.assertNotEqual(first["ETag"], second["ETag"])
+        # Parameter order does not matter
+        reordered = self.client.get(self.url, {"cursor": cursor, "limit": 2})
+        self.assertEqual(reordered["ETag"], second["ETag"])
+
+        cached = self.client.get(self.url, {"limit": 2}, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(cached.status_code, 304)
+        other_page = self.client.get(
+            self.url,
+            {"limit": 2, "cursor": cursor},
+            headers={"If-None-Match": first["ETag"]},
+        )
+        self.assertEqual(other_page.status_code, 200)
+        self.assertEqual(len(other_page.json()), 1)
+
+    def test_if_modified_since_alone_is_not_a_cache_hit(self) -> None:
+        first = self.client.get(self.url, {"limit": 2})
+        response = self.client.get(
+            self.url, {"limit": 2}, headers={"If-Modified-Since": first["Last-Modified"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class IngestIndexTests(TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.project = Project.objects.create(
+            year=2025, summary="ingest", internal=True, location="/tmp/ingest"
+        )
+
+    def write(self, name: str, content: bytes) -> Path:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        return path
+
+    def test_moved_file_matches_its_fingerprint(self) -> None:
+        src = self.write("drive1/plot3_jai1.bin", b"frame" * 100)
+        record_ingested([ingested_entry(self.project, src)])
+        # Same drive mounted elsewhere: same size, mtime and content
+        moved = self.root / "drive2/plot3_jai1.bin"
+        moved.parent.mkdir()
+        shutil.copy2(src, moved)
+        # Same size, different content
+        other = self.write("drive2/plot4_jai1.bin", b"FRAME" * 100)
+        os.utime(other, ns=(src.stat().st_atime_ns, src.stat().st_mtime_ns))
+        new = self.write("drive2/plot5_jai1.bin", b"frame")
+
+        pending, skipped = split_ingested(
+            self.project, {path: path.stat().st_size for path in (moved, other, new)}
+        )
+        self.assertEqual(skipped, [moved])
+        self.assertEqual(pending, [other, new])
+
+    def test_fingerprints_are_per_project(self) -> None:
+        src = self.write("plot3_jai1.bin", b"frame" * 100)
+        record_ingested([ingested_entry(self.project, src)])
+        other_project = Project.objects.create(
+            year=2025, summary="other", internal=True, location="/tmp/other"
+        )
+        self.assertEqual(split_ingested(other_project, {src: src.stat().st_size}), ([src], []))
+
+
+class ActivityPageTests(TestCase):
+    def setUp(self) -> None:
+        self.project = Project.objects.create(
+            year=2025, summary="pages", internal=True, location="/tmp/pages"
+        )
+        Activity.objects.bulk_create(
+            Activity(project=self.project, filename=f"/src/{index}.bin") for index in range(7)
+        )
+        # Rows created in the same instant are ordered by id
+        start = timezone.now()
+        for index, log in enumerate(Activity.objects.order_by("pk")):
+            Activity.objects.filter(pk=log.pk).update(
+                created=start + dt.timedelta(seconds=index // 3)
+            )
+
+    def test_cursor_pages_cover_every_activity_once(self) -> None:
+        expected = list(
+            Activity.objects.order_by("-created", "-pk").values_list("filename", flat=True)
+        )
+        pages: list[list[str]] = []
+        cursor = None
+        while True:
+            page, cursor = list_activity_page(self.project, cursor=cursor, limit=3)
+            pages.append([log["filename"] for log in page])
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([name for page in pages for name in page], expected)
+
+    def test_filters_apply_to_every_page(self) -> None:
+        Activity.objects.filter(filename__in=["/src/1.bin", "/src/4.bin"]).update(
+            status=Activity.StatusChoices.ERROR
+        )
+        page, cursor = list_activity_page(
+            self.project, status=Activity.StatusChoices.ERROR, limit=1
+        )
+        self.assertEqual([log["filename"] for log in page], ["/src/4.bin"])
+        page, cursor = list_activity_page(
+            self.project, status=Activity.StatusChoices.ERROR, cursor=cursor, limit=1
+        )
+        self.assertEqual([log["filename"] for log in page], ["/src/1.bin"])
+        self.assertIsNone(cursor)
+
+
+class ActivityChangesTests(TestCase):
+    def setUp(self) -> None:
+        self.project = Project.objects.create(
+            year=2025, summary="changes", internal=True, location="/tmp/changes"
+        )
+        self.old, self.fresh, self.removed = Activity.objects.bulk_create(
+            Activity(project=self.project, filename=f"/src/{name}.bin")
+            for name in ("old", "fresh", "removed")
+        )
+        self.since = timezone.now() - dt.timedelta(minutes=30)
+        Activity.objects.filter(pk=self.old.pk).update(updated=self.since - dt.timedelta(hours=1))
+
+    @override_settings(PHENOMATE_ACTIVITY_CHANGES_OVERLAP=0)
+    def test_changes_since_the_previous_poll(self) -> None:
+        remove_activities(Activity.objects.filter(pk=self.removed.pk))
+        response = self.client.get(
+            f"/api/activity/{self.project.pk}/changes",
+            {"updated_since": self.since.isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([log["id"] for log in body["activities"]], [self.fresh.pk])
+        self.assertEqual(body["deleted"], [self.removed.pk])
+        self.assertFalse(body["reset"])
+
+        # The feed is unchanged until the next write
+        cached = self.client.get(
+            f"/api/activity/{self.project.pk}/changes",
+            {"updated_since": self.since.isoformat()},
+            headers={"If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    def test_polls_older_than_the_tombstones_reload(self) -> None:
+        response = self.client.get(
+            f"/api/activity/{self.project.pk}/changes",
+            {"updated_since": (timezone.now() - dt.timedelta(days=30)).isoformat()},
+        )
+        body = response.json()
+        self.assertTrue(body["reset"])
+        self.assertEqual(body["activities"], [])
+
+
+@mock.patch.object(ActivityWriter, "_ensure_flusher")
+@mock.patch("backend.activity.service.build_pipeline")
+class RetryActivitiesTests(TestCase):
+    def setUp(self) -> None:
+        self.project = Project.objects.create(
+            year=2025, summary="retry", internal=True, location="/tmp/retry"
+        )
+        Status = Activity.StatusChoices
+        self.failed, self.stale, self.running, self.done = Activity.objects.bulk_create(
+            [
+                Activity(
+                    project=self.project,
+                    filename="/src/failed.bin",
+                    status=Status.ERROR,
+                    copy_status=Status.ERROR,
+                    error_log="Traceback",
+                ),
+                Activity(project=self.project, filename="/src/stale.bin"),
+                Activity(project=self.project, filename="/src/running.bin"),
+                Activity(
+                    project=self.project,
+                    filename="/src/done.bin",
+                    status=Status.COMPLETED,
+                    copy_status=Status.COMPLETED,
+                ),
+            ]
+        )
+        Activity.objects.filter(pk=self.stale.pk).update(
+            updated=timezone.now() - dt.timedelta(hours=1)
+        )
+        self.addCleanup(activity_writer.flush)
+
+    def test_claims_failed_and_stale_activities(
+        self, build_pipeline: mock.Mock, _: mock.Mock
+    ) -> None:
+        retried = retry_activities(Activity.objects.filter(project=self.project), stale_after=60)
+        self.assertEqual(retried, 2)
+        (jobs,), _ = build_pipeline.call_args
+        self.assertEqual({job.pk for job in jobs}, {self.failed.pk, self.stale.pk})
+
+        failed = Activity.objects.get(pk=self.failed.pk)
+        self.assertEqual(
+            (failed.status, failed.copy_status, failed.error_log, failed.attempts),
+            ("QUEUED", "QUEUED", "", 1),
+        )
+        self.assertEqual(Activity.objects.get(pk=self.stale.pk).attempts, 1)
+        self.assertEqual(Activity.objects.get(pk=self.running.pk).attempts, 0)
+        self.assertEqual(Activity.objects.get(pk=self.done.pk).status, "COMPLETED")
+
+    def test_claimed_activities_are_not_retried_twice(
+        self, build_pipeline: mock.Mock, _: mock.Mock
+    ) -> None:
+        queryset = Activity.objects.filter(project=self.project)
+        self.assertEqual(retry_activities(queryset, stale_after=60), 2)
+        self.assertEqual(retry_activities(queryset, stale_after=60), 0)
+        self.assertEqual(build_pipeline.call_count, 1)
+
+
+class CompanionGroupingTests(SimpleTestCase):
+    def test_imu_files_are_grouped_with_their_csv_files(self) -> None:
+        paths = [
+            Path("/drive/plot3/2025_imu.bin"),
+            Path("/drive/plot3/2025_jai1.bin"),
+            Path("/drive/plot3/2025_imu_GNSS.csv"),
+            Path("/drive/plot3/2025_imu.csv"),
+            # Same stem in another directory
+            Path("/drive/plot4/2025_imu.csv"),
+            Path("/drive/plot3/scan.pcap"),
+            Path("/drive/plot3/scan.json"),
+        ]
+        self.assertEqual(find_groups(paths), [[0, 2, 3], [5, 6]])
+        self.assertEqual(companion_runs(paths), [[0, 2, 3], [1], [4], [5, 6]])
+
+    def test_bin_files_of_other_sensors_have_no_companions(self) -> None:
+        paths = [Path("/drive/plot3/2025_jai1.bin"), Path("/drive/plot3/2025_jai1.csv")]
+        self.assertEqual(find_groups(paths), [])
+        self.assertEqual(companion_runs(paths), [[0], [1]])
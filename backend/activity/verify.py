@@ -0,0 +1,84 @@
+"""Checksum verification of copied files.
+
+With ``PHENOMATE_VERIFY_COPIES`` enabled the copy stage only completes once the copy has
+the content of the source file: the source digest is computed by the copy engine while it
+copies (see :meth:`CopyEngine.copy`) and the copy is read back and compared with it. Files
+copied through checkpoints, or reused from an earlier attempt, have no digest yet and both
+files are hashed, concurrently. Hashing runs on a thread pool of
+``PHENOMATE_VERIFY_WORKERS`` threads shared by the tasks of a worker process, with large
+sequential reads.
+
+The digest (blake2b, 32 bytes, the same as :func:`ingest_index.full_hash`) is stored on the
+Activity, where the remove stage uses it instead of reading the source again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from backend.activity.ingest_index import full_hash
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+class ChecksumMismatch(Exception):
+    """Raised when a copied file does not have the content of its source."""
+
+    def __init__(self, src: Path, dst: Path) -> None:
+        super().__init__(f"Checksum of {dst} does not match its source {src}")
+
+
+def verify_enabled() -> bool:
+    return getattr(settings, "PHENOMATE_VERIFY_COPIES", False)
+
+
+def new_digest() -> hashlib.blake2b:
+    """Digest to pass to the copy engine, comparable with :func:`full_hash`."""
+    return hashlib.blake2b(digest_size=32)
+
+
+def hash_pool() -> ThreadPoolExecutor:
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, "PHENOMATE_VERIFY_WORKERS", 4)
+            _pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="verify")
+        return _pool
+
+
+def file_digests(paths: list[Path]) -> list[str]:
+    """Hash files concurrently on the verification thread pool."""
+    return list(hash_pool().map(full_hash, paths))
+
+
+def verify_copy(src: Path, dst: Path, source_digest: str = "") -> str:
+    """Check that ``dst`` has the content of ``src``.
+
+    Args:
+        src (Path): source file
+        dst (Path): copy of the source file
+        source_digest (str, optional): digest of the source computed during the copy; the
+        source is hashed when it is empty
+
+    Raises:
+        ChecksumMismatch: the digests differ
+
+    Returns:
+        str: hex digest of the content
+    """
+    if source_digest:
+        (copy_digest,) = file_digests([dst])
+    else:
+        source_digest, copy_digest = file_digests([src, dst])
+    if copy_digest != source_digest:
+        raise ChecksumMismatch(src, dst)
+    return source_digest
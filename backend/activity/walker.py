@@ -0,0 +1,97 @@
+"""Single-pass, parallel source tree walker for offload discovery.
+
+Directories are listed with ``os.scandir`` on a thread pool and the file type and size of
+every entry come from the cached ``DirEntry`` data, so each file costs at most one stat
+call. Files are yielded as soon as their directory has been listed and at most
+``2 * max_workers`` directory listings are held in memory at any time.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+shared_logger = get_task_logger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class SourceFile:
+    path: Path
+    size: int
+
+
+def scan_directory(
+    directory: str, skip_suffixes: frozenset[str]
+) -> tuple[list[SourceFile], list[str]]:
+    """List one directory.
+
+    Args:
+        directory (str): directory to list
+        skip_suffixes (frozenset[str]): lower-case file suffixes to leave out
+
+    Returns:
+        tuple[list[SourceFile], list[str]]: (files, sub-directories)
+    """
+    files: list[SourceFile] = []
+    subdirs: list[str] = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        path = Path(entry.path)
+                        if path.suffix.lower() in skip_suffixes:
+                            shared_logger.debug(f"Phenomate: walk_files(): Skipping {path}")
+                            continue
+                        files.append(SourceFile(path, entry.stat().st_size))
+                except OSError:
+                    # Vanished/locked entries and WSL/NTFS oddities
+                    continue
+    except OSError as exc:
+        shared_logger.warning(f"Phenomate: walk_files(): Cannot list {directory}: {exc}")
+    return files, subdirs
+
+
+def walk_files(
+    roots: Iterable[Path],
+    skip_suffixes: Iterable[str] = (),
+    max_workers: int | None = None,
+) -> Iterator[SourceFile]:
+    """Lazily yield every regular file below ``roots``.
+
+    Symlinked directories are not followed. Files are yielded in no particular order.
+
+    Args:
+        roots (Iterable[Path]): directories to walk
+        skip_suffixes (Iterable[str], optional): file suffixes (e.g. ``".json"``) to leave out
+        max_workers (int | None, optional): listing threads. Defaults to the
+        ``PHENOMATE_WALK_WORKERS`` setting.
+
+    Yields:
+        SourceFile: file path and size
+    """
+    skip = frozenset(suffix.lower() for suffix in skip_suffixes)
+    max_workers = max_workers or getattr(settings, "PHENOMATE_WALK_WORKERS", 8)
+    pending: deque[str] = deque(str(root) for root in roots)
+    running: set[Future[tuple[list[SourceFile], list[str]]]] = set()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="walk") as pool:
+        while pending or running:
+            while pending and len(running) < 2 * max_workers:
+                running.add(pool.submit(scan_directory, pending.popleft(), skip))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.extend(subdirs)
+                yield from files
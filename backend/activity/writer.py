@@ -0,0 +1,196 @@
+"""Write-behind buffer for Activity state transitions.
+
+Pipeline stages hand their Activity inserts and updates to :data:`activity_writer` instead
+of saving each row straight away. Pending writes are coalesced (an Activity updated several
+times, or created and then updated, is written once) and flushed with ``bulk_create`` and
+``bulk_update``:
+
+- at least every ``PHENOMATE_ACTIVITY_FLUSH_INTERVAL`` seconds, by a background thread,
+- as soon as ``PHENOMATE_ACTIVITY_FLUSH_MAX_PENDING`` writes are waiting,
+- when the Celery worker (process) shuts down or the interpreter exits.
+
+The Offload progress counter changes recorded by the stage transitions of the buffered
+activities are summed and written with one ``F()`` update per offload on each flush.
+
+Tasks that hand an Activity over to the next task of a Celery chain flush before
+returning, so that the next stage reads the row back in its latest state.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.activity.changes import record_writes
+from backend.activity.models import Activity, Offload
+
+shared_logger = get_task_logger(__name__)
+
+
+class ActivityWriter:
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        # Unsaved activities, by object identity, in creation order
+        self._creates: dict[int, Activity] = {}
+        # Saved activities -> names of the fields to write
+        self._updates: dict[int, tuple[Activity, set[str]]] = {}
+        # Offload id -> progress counter changes
+        self._progress: dict[int, Counter[str]] = {}
+        self._oldest: float | None = None
+        self._flusher: threading.Thread | None = None
+        self._flusher_pid: int | None = None
+
+    @property
+    def max_latency(self) -> float:
+        return float(getattr(settings, "PHENOMATE_ACTIVITY_FLUSH_INTERVAL", 1.0))
+
+    @property
+    def max_pending(self) -> int:
+        return int(getattr(settings, "PHENOMATE_ACTIVITY_FLUSH_MAX_PENDING", 500))
+
+    def create(self, log: Activity) -> Activity:
+        """Queue the insert of an unsaved Activity."""
+        with self._lock:
+            self._creates[id(log)] = log
+            self._add_progress(log)
+            self._pending_added()
+        return log
+
+    def update(self, log: Activity, *fields: str) -> None:
+        """Queue a write of ``fields`` of ``log``.
+
+        Updating an Activity whose insert is still pending costs nothing: the insert
+        writes the latest values of the instance.
+        """
+        with self._lock:
+            self._add_progress(log)
+            if id(log) in self._creates:
+                return
+            if log.pk is None:
+                self._creates[id(log)] = log
+            else:
+                _, pending = self._updates.setdefault(id(log), (log, set()))
+                pending.update(fields)
+            self._pending_added()
+
+    def flush(self) -> None:
+        """Write every pending insert and update.
+
+        The pending writes are swapped out of the buffers and written in one transaction.
+        If writing fails the transaction is rolled back, the writes are put back in front of
+        any write buffered since, to be written by the next flush, and the error is raised.
+        """
+        with self._lock:
+            creates, self._creates = self._creates, {}
+            updates, self._updates = self._updates, {}
+            progress, self._progress = self._progress, {}
+            oldest, self._oldest = self._oldest, None
+            if not creates and not updates and not progress:
+                return
+            try:
+                with transaction.atomic():
+                    Activity.objects.bulk_create(list(creates.values()))
+                    self._bulk_update(list(updates.values()))
+                    self._update_progress(list(progress.items()))
+                    record_writes([*creates.values(), *(log for log, _ in updates.values())])
+            except Exception:
+                self._restore(creates, updates, progress, oldest)
+                raise
+
+    def _restore(
+        self,
+        creates: dict[int, Activity],
+        updates: dict[int, tuple[Activity, set[str]]],
+        progress: dict[int, Counter[str]],
+        oldest: float | None,
+    ) -> None:
+        # The inserts were rolled back along with the primary keys bulk_create assigned
+        for log in creates.values():
+            log.pk = None
+            log._state.adding = True
+        self._creates = {**creates, **self._creates}
+        for key, (log, fields) in self._updates.items():
+            if key in updates:
+                updates[key][1].update(fields)
+            else:
+                updates[key] = (log, fields)
+        self._updates = updates
+        for offload_id, counters in self._progress.items():
+            progress.setdefault(offload_id, Counter()).update(counters)
+        self._progress = progress
+        if oldest is not None:
+            self._oldest = min(oldest, self._oldest or oldest)
+
+    def _bulk_update(self, updates: list[tuple[Activity, set[str]]]) -> None:
+        # bulk_update writes the same columns for every row: group rows by field set
+        now = timezone.now()
+        groups: dict[frozenset[str], list[Activity]] = {}
+        for log, fields in updates:
+            log.updated = now
+            groups.setdefault(frozenset(fields | {"updated"}), []).append(log)
+        for fields, logs in groups.items():
+            Activity.objects.bulk_update(logs, sorted(fields))
+
+    def _add_progress(self, log: Activity) -> None:
+        progress = log.pop_progress()
+        if progress and log.offload_id is not None:
+            self._progress.setdefault(log.offload_id, Counter()).update(progress)
+
+    def _update_progress(self, progress: list[tuple[int, Counter[str]]]) -> None:
+        now = timezone.now()
+        for offload_id, counters in progress:
+            changes = {name: F(name) + delta for name, delta in counters.items() if delta}
+            if changes:
+                Offload.objects.filter(pk=offload_id).update(**changes, updated=now)
+
+    def _pending_added(self) -> None:
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._creates) + len(self._updates) >= self.max_pending:
+            self.flush()
+            return
+        self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        # Started lazily so that each forked worker process gets its own thread
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(
+            target=self._run_flusher, name="activity-writer", daemon=True
+        )
+        self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            time.sleep(self.max_latency / 2)
+            oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.max_latency / 2:
+                try:
+                    self.flush()
+                except Exception:
+                    # The writes are kept for the next flush: keep the thread alive
+                    shared_logger.exception("Phenomate: ActivityWriter.flush() failed")
+                close_old_connections()
+
+
+activity_writer = ActivityWriter()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_on_shutdown(**kwargs: object) -> None:
+    activity_writer.flush()
+
+
+atexit.register(activity_writer.flush)
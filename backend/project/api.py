@@ -18,6 +18,7 @@ from backend.project.dto import (
     ProjectPreviewSchema
 )
 from backend.project.models import Project
+from backend.project.service import load_project_manager
 # from backend.project.service import rm_project
 from backend.researcher.models import Researcher
 
@@ -50,7 +51,7 @@ def list_projects(request: HttpRequest) -> list[Project]:
 def get_project(request: HttpRequest, project_id: int) -> ProjectGetSchema:
     project = get_object_or_404(Project, pk=project_id)
     shared_logger.info(f'Phenomate: get_project(): project.location : {project.location}')
-    manager = ProjectManager.load_project(project.location)
+    manager = load_project_manager(project.location)
     shared_logger.info(f'Phenomate: get_project(): manager.root : {manager.root}')
     regex = {name: ext.js_regex for name, ext in manager.metadata.file.items()}
     return ProjectGetSchema(
@@ -1,8 +1,54 @@
 import shutil
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
+from appm import ProjectManager
+from django.conf import settings
+
 PROJECT_PATH = Path("project")
 
+# Process-local LRU of loaded projects: location -> (metadata.yaml mtime_ns, manager)
+_manager_cache: OrderedDict[str, tuple[int, ProjectManager]] = OrderedDict()
+_manager_cache_lock = threading.Lock()
+
 
 # def rm_project(location: str) -> None:
 #     shutil.rmtree(location)
+
+
+def load_project_manager(location: str | Path) -> ProjectManager:
+    """Load the ProjectManager of a project, reusing a cached instance when possible.
+
+    Instances are cached per worker process, keyed by project location, and reloaded when
+    the project's metadata.yaml modification time changes. The cache holds at most
+    ``PHENOMATE_PROJECT_CACHE_SIZE`` projects.
+
+    Args:
+        location (str | Path): project location
+
+    Returns:
+        ProjectManager: loaded project
+    """
+    key = str(Path(location).absolute())
+    try:
+        mtime = (Path(key) / ProjectManager.METADATA_NAME).stat().st_mtime_ns
+    except OSError:
+        # Missing/unreadable project - let appm raise its usual error
+        with _manager_cache_lock:
+            _manager_cache.pop(key, None)
+        return ProjectManager.load_project(location)
+
+    with _manager_cache_lock:
+        cached = _manager_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _manager_cache.move_to_end(key)
+            return cached[1]
+
+    manager = ProjectManager.load_project(location)
+    with _manager_cache_lock:
+        _manager_cache[key] = (mtime, manager)
+        _manager_cache.move_to_end(key)
+        while len(_manager_cache) > getattr(settings, "PHENOMATE_PROJECT_CACHE_SIZE", 32):
+            _manager_cache.popitem(last=False)
+    return manager
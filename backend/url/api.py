@@ -1,22 +1,188 @@
 from __future__ import annotations
 
+import datetime as dt
+from pathlib import Path
 from typing import TYPE_CHECKING
 
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from ninja import Router
 
-from backend.url.dto import DirFileItem
-from backend.url.service import list_dir
+from backend.url.dto import (
+    DirFileItem,
+    DirPrefetchForm,
+    DirSizeItem,
+    DirSizesForm,
+    DirTreeListing,
+    FileIndexForm,
+    FileIndexSchema,
+    IndexedFileSchema,
+    TreeJobForm,
+    TreeJobSchema,
+    TreeTotalsSchema,
+)
+from backend.url.file_index import index_status, search_index, start_index
+from backend.url.service import iter_items, list_dir_page, prefetch_tree, stream_items
+from backend.url.sizes import directory_sizes
+from backend.url.tree import get_tree_job, start_tree_job
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
+    from backend.url.models import FileIndexJob, TreeJob
+
 router = Router()
 
 
 @router.get("/", response=list[DirFileItem])
 def get_children_url(
     request: HttpRequest,
+    response: HttpResponse,
     src: str = "/",
     dirOnly: bool = False,
-) -> list[DirFileItem]:
-    return list_dir(src, dirOnly)
+    sort: str = "name",
+    descending: bool = False,
+    prefix: str = "",
+    cursor: str | None = None,
+    limit: int | None = None,
+    stream: bool = False,
+) -> list[DirFileItem] | StreamingHttpResponse:
+    """List a directory, optionally sorted, filtered by name prefix and paged.
+
+    With ``limit`` set, the cursor of the next page is returned in the ``X-Next-Cursor``
+    header. With ``stream`` the JSON array is sent as the items are built. Directories
+    only have a size when it is cached; the others are requested from ``POST /sizes``.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    entries, next_cursor = list_dir_page(src, dirOnly, sort, descending, prefix, cursor, limit)
+    if stream:
+        streamed = StreamingHttpResponse(stream_items(entries), content_type="application/json")
+        if next_cursor:
+            streamed["X-Next-Cursor"] = next_cursor
+        return streamed
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return list(iter_items(entries))
+
+
+@router.post("/prefetch", response=list[DirTreeListing])
+def prefetch_children_url(request: HttpRequest, form: DirPrefetchForm) -> list[DirTreeListing]:
+    """Nested listings of several directories, ``depth`` levels deep."""
+    return prefetch_tree(form.paths, form.depth, form.dirOnly)
+
+
+@router.post("/sizes", response=list[DirSizeItem])
+def get_directory_sizes(request: HttpRequest, form: DirSizesForm) -> list[DirSizeItem]:
+    """Sizes of directories (bytes of the files directly under each of them)."""
+    sizes = directory_sizes(form.paths)
+    return [DirSizeItem(id=path, size=size) for path, size in sizes.items()]
+
+
+def tree_job_data(job: TreeJob) -> TreeJobSchema:
+    return TreeJobSchema(
+        id=str(job.pk),
+        status=job.status,
+        files=job.total("files"),
+        bytes=job.total("bytes"),
+        directories=job.total("directories"),
+        pending=job.pending,
+        errors=job.errors,
+        elapsed=job.elapsed,
+        roots=[TreeTotalsSchema(id=root, **totals) for root, totals in job.totals.items()],
+    )
+
+
+@router.post("/tree", response=TreeJobSchema)
+def start_tree_totals(request: HttpRequest, form: TreeJobForm) -> TreeJobSchema:
+    """Queue computing the recursive size and file count of paths."""
+    if not form.paths:
+        raise ValueError("No paths given")
+    return tree_job_data(start_tree_job(form.paths))
+
+
+@router.get("/tree/{job_id}", response=TreeJobSchema)
+def get_tree_totals(request: HttpRequest, job_id: str) -> TreeJobSchema:
+    """Progress and (partial) totals of a tree aggregation job."""
+    job = get_tree_job(job_id)
+    if job is None:
+        raise Http404(f"No tree job {job_id}")
+    return tree_job_data(job)
+
+
+def file_index_data(root: str, job: FileIndexJob | None, scanned: float | None) -> FileIndexSchema:
+    data = FileIndexSchema(root=root)
+    if job is not None:
+        data = FileIndexSchema(
+            root=job.root,
+            status=job.status,
+            files=job.files,
+            directories=job.directories,
+            changed=job.changed,
+            errors=job.errors,
+        )
+    if scanned is not None:
+        data.scanned = dt.datetime.fromtimestamp(scanned, tz=dt.UTC)
+    return data
+
+
+@router.post("/index", response=FileIndexSchema)
+def index_source(request: HttpRequest, form: FileIndexForm) -> FileIndexSchema:
+    """Queue (re)indexing the files below a source root."""
+    job = start_index(form.root, form.full)
+    return file_index_data(job.root, job, index_status(job.root)[1])
+
+
+@router.get("/index", response=FileIndexSchema)
+def get_index_status(request: HttpRequest, root: str) -> FileIndexSchema:
+    """Progress of the indexing of a source root and time of its last complete scan."""
+    return file_index_data(root, *index_status(root))
+
+
+@router.get("/index/search", response=list[IndexedFileSchema])
+def search_source_index(
+    request: HttpRequest,
+    response: HttpResponse,
+    root: str,
+    glob: str = "",
+    contains: str = "",
+    sensor: str = "",
+    suffix: str = "",
+    modified_after: dt.datetime | None = None,
+    modified_before: dt.datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 1000,
+) -> list[IndexedFileSchema]:
+    """Files of an indexed source root matching every filter given, ordered by path.
+
+    ``glob`` matches the file name, or the path below the root when it contains a ``/``.
+    The cursor of the next page is returned in the ``X-Next-Cursor`` header; the ``id`` of
+    the files can be offloaded as they are.
+    """
+    max_limit = getattr(settings, "PHENOMATE_FILE_INDEX_MAX_PAGE", 10000)
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    files, next_cursor = search_index(
+        root,
+        glob=glob,
+        contains=contains,
+        sensor=sensor,
+        suffix=suffix,
+        modified_after=modified_after.timestamp() if modified_after else None,
+        modified_before=modified_before.timestamp() if modified_before else None,
+        cursor=cursor,
+        limit=limit,
+    )
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return [
+        IndexedFileSchema(
+            id=file.path,
+            name=Path(file.path).name,
+            size=file.size,
+            mtime=file.mtime,
+            suffix=file.suffix,
+            sensor=file.sensor,
+        )
+        for file in files
+    ]
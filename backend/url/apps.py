@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class UrlConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "backend.url"
@@ -1,27 +1,30 @@
 from __future__ import annotations
 
+import datetime as dt
+import os
 from typing import TYPE_CHECKING
 
 from ninja import Schema
 
-import os
-from pathlib import Path
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from backend.url.service import DirEntryInfo
 
 
 # def get_size(p: Path) -> int:
-    # try:
-        # if p.is_file():
-            # return p.stat().st_size
-        # if p.is_dir():
-            # return sum([child.stat().st_size for child in p.iterdir() if child.is_file()])
-        # return 0
-    # except PermissionError:
-        # return 0
+# try:
+# if p.is_file():
+# return p.stat().st_size
+# if p.is_dir():
+# return sum([child.stat().st_size for child in p.iterdir() if child.is_file()])
+# return 0
+# except PermissionError:
+# return 0
 
 
 def get_directory_size_scandir(p: Path) -> int:
-    """
-    Returns the total size (in bytes) of regular files directly under directory p.
+    """Returns the total size (in bytes) of regular files directly under directory p.
     Robust against WSL/Docker quirks by avoiding symlink following and catching per-file errors.
     """
     total = 0
@@ -54,7 +57,7 @@ def get_directory_size_scandir(p: Path) -> int:
 
 
 def get_size(p: Path) -> int:
-    return (get_directory_size_scandir(p))
+    return get_directory_size_scandir(p)
 
 
 class DirFileItem(Schema):
@@ -62,7 +65,9 @@ class DirFileItem(Schema):
     name: str
     isDir: bool
     isHidden: bool
-    size: int | float
+    # None for a directory whose size is not known yet (see POST /api/urls/sizes)
+    size: int | float | None
+    mtime: float | None = None
 
     @classmethod
     def from_path(cls, path: Path) -> DirFileItem | None:
@@ -82,3 +87,101 @@ class DirFileItem(Schema):
             )
         except PermissionError:
             return None
+
+    @classmethod
+    def from_entry(cls, entry: DirEntryInfo, size: int | None = None) -> DirFileItem:
+        """Item of an entry listed by ``scan_entries``, without stat-ing it again.
+
+        Args:
+            entry (DirEntryInfo): listed entry
+            size (int | None, optional): size of a directory entry, if known
+        """
+        return DirFileItem(
+            id=entry.path,
+            name=entry.name,
+            isDir=entry.is_dir,
+            isHidden=entry.name.startswith("."),
+            size=size if entry.is_dir else entry.size,
+            mtime=entry.mtime,
+        )
+
+
+class DirTreeItem(DirFileItem):
+    # Listing of a directory within the requested depth, None beyond it
+    children: list[DirTreeItem] | None = None
+
+
+class DirTreeListing(Schema):
+    id: str
+    items: list[DirTreeItem]
+    # Why the path could not be listed
+    error: str | None = None
+
+
+class DirPrefetchForm(Schema):
+    paths: list[str]
+    depth: int = 1
+    dirOnly: bool = False
+
+
+class DirSizesForm(Schema):
+    paths: list[str]
+
+
+class DirSizeItem(Schema):
+    id: str
+    # None if the path is not an accessible directory
+    size: int | None
+
+
+class TreeJobForm(Schema):
+    paths: list[str]
+
+
+class TreeTotalsSchema(Schema):
+    id: str
+    files: int
+    bytes: int
+    directories: int
+
+
+class TreeJobSchema(Schema):
+    id: str
+    # RUNNING, DONE or ERROR; totals are partial while RUNNING
+    status: str
+    files: int
+    bytes: int
+    directories: int
+    # Directories waiting to be listed
+    pending: int
+    errors: int
+    elapsed: float
+    roots: list[TreeTotalsSchema]
+
+
+class FileIndexForm(Schema):
+    root: str
+    # List every directory again instead of only the ones whose mtime changed
+    full: bool = False
+
+
+class FileIndexSchema(Schema):
+    root: str
+    # RUNNING, DONE or ERROR; None if the root was never indexed
+    status: str | None = None
+    files: int = 0
+    directories: int = 0
+    # Directories listed again by the last scan
+    changed: int = 0
+    errors: int = 0
+    # Start time of the last complete scan
+    scanned: dt.datetime | None = None
+
+
+class IndexedFileSchema(Schema):
+    id: str
+    name: str
+    size: int
+    mtime: float
+    suffix: str
+    sensor: str
@@ -0,0 +1,373 @@
+"""Persisted index of the files of source drives.
+
+Operators look for files such as "all ``*_jai1.bin`` from plot 3" across a drive. Instead of
+browsing ``list_dir`` folder by folder, a source root is snapshotted into an SQLite file in
+``PHENOMATE_FILE_INDEX_DIR`` (kept across restarts) holding, for every regular file, its path relative to the root,
+size, mtime, suffix and sensor token (the last ``_``-separated part of the file stem, e.g.
+``jai1``), and queried with glob, substring, sensor, suffix and time range filters.
+
+Indexing runs in a Celery task, which lists directories with ``os.scandir`` on a thread
+pool and writes its progress to the :class:`~backend.url.models.FileIndexJob` of the root.
+A rescan is incremental: the mtime of every directory is stored and directories whose
+mtime did not change are not listed again (a file rewritten in place without changing its
+directory is only picked up by a full rescan). Queries open the index read-only and keep
+working on the previous snapshot while a rescan runs.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.url.models import FileIndexJob, JobStatusChoices
+from celery import signature
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+shared_logger = get_task_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL NOT NULL
+);
+CREATE INDEX dirs_parent ON dirs (parent);
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    suffix TEXT NOT NULL,
+    sensor TEXT NOT NULL
+);
+CREATE INDEX files_dir ON files (dir);
+CREATE INDEX files_sensor ON files (sensor, mtime);
+CREATE INDEX files_suffix ON files (suffix, mtime);
+CREATE INDEX files_mtime ON files (mtime);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# Seconds between two writes of the counters of a running scan, and time after which a
+# scan that stopped writing them is assumed dead
+PROGRESS_INTERVAL = 1.0
+STALE_AFTER = dt.timedelta(minutes=10)
+
+
+@dataclass(frozen=True, slots=True)
+class IndexedFile:
+    path: str
+    size: int
+    mtime: float
+    suffix: str
+    sensor: str
+
+
+def sensor_token(stem: str) -> str:
+    return stem.rsplit("_", 1)[-1].lower()
+
+
+def index_dir() -> Path:
+    return Path(
+        getattr(settings, "PHENOMATE_FILE_INDEX_DIR", "") or settings.BASE_DIR / "file-index"
+    ).absolute()
+
+
+def index_path(root: str) -> Path:
+    """Index file of a source root."""
+    digest = hashlib.blake2b(root.encode(), digest_size=16).hexdigest()
+    return index_dir() / f"{digest}.sqlite3"
+
+
+def create_index(path: Path) -> None:
+    """Create an empty index with its schema, atomically so readers never see it half made."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    tmp = Path(name)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            # Readers keep reading the last snapshot while a rescan writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+@contextlib.contextmanager
+def connect(root: str, readonly: bool = False) -> Iterator[sqlite3.Connection]:
+    """Open the index of a source root.
+
+    The index is created by :func:`run_index`; read-only connections expect it to exist.
+    """
+    path = index_path(root)
+    if readonly:
+        conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, timeout=30)
+    else:
+        if not path.exists():
+            create_index(path)
+        conn = sqlite3.connect(path, timeout=30)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def scan_dir(
+    root: str, rel: str, known_mtime: float | None
+) -> tuple[str, float, list[IndexedFile] | None, list[str] | None]:
+    """List a directory of the index, unless its mtime is ``known_mtime``.
+
+    Returns:
+        tuple: (relative path, mtime, files, relative subdirectories); files and
+        subdirectories are None when the directory is unchanged
+    """
+    directory = os.path.join(root, rel) if rel else root  # noqa: PTH118
+    mtime = os.stat(directory).st_mtime  # noqa: PTH116
+    if mtime == known_mtime:
+        return rel, mtime, None, None
+    files: list[IndexedFile] = []
+    subdirs: list[str] = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            path = f"{rel}/{entry.name}" if rel else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    stem, suffix = os.path.splitext(entry.name)  # noqa: PTH122
+                    files.append(
+                        IndexedFile(
+                            path, st.st_size, st.st_mtime, suffix.lower(), sensor_token(stem)
+                        )
+                    )
+            except OSError:
+                # Vanished/locked entries and WSL/NTFS oddities
+                continue
+    return rel, mtime, files, subdirs
+
+
+def run_index(job: FileIndexJob) -> None:
+    """Scan the root of ``job``, writing its counters at most every ``PROGRESS_INTERVAL``."""
+    try:
+        with connect(job.root) as conn:
+            _scan(job, conn)
+            job.files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('scanned', ?)",
+                (str(job.started.timestamp()),),
+            )
+            conn.commit()
+        job.status = JobStatusChoices.DONE
+    except Exception:
+        shared_logger.exception(f"Phenomate: run_index(): Failed to index {job.root}")
+        job.status = JobStatusChoices.ERROR
+    finally:
+        job.finished = timezone.now()
+        job.save()
+
+
+def _scan(job: FileIndexJob, conn: sqlite3.Connection) -> None:
+    previous: dict[str, float] = dict(conn.execute("SELECT path, mtime FROM dirs"))
+    # A full rescan lists every directory again
+    known = {} if job.full else previous
+    seen: set[str] = set()
+    workers = getattr(settings, "PHENOMATE_URL_TREE_WORKERS", 8)
+    queue = [""]
+    running: set[Future[tuple[str, float, list[IndexedFile] | None, list[str] | None]]] = set()
+    saved = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="index") as pool:
+        while queue or running:
+            while queue and len(running) < 2 * workers:
+                rel = queue.pop()
+                running.add(pool.submit(scan_dir, job.root, rel, known.get(rel)))
+            if time.monotonic() - saved >= PROGRESS_INTERVAL:
+                job.save(update_fields=["files", "directories", "changed", "errors", "updated"])
+                saved = time.monotonic()
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    rel, mtime, files, subdirs = future.result()
+                except OSError:
+                    job.errors += 1
+                    continue
+                seen.add(rel)
+                job.directories += 1
+                if files is None or subdirs is None:
+                    queue.extend(
+                        path
+                        for (path,) in conn.execute(
+                            "SELECT path FROM dirs WHERE parent = ?", (rel,)
+                        )
+                    )
+                    continue
+                job.changed += 1
+                job.files += len(files)
+                conn.execute("DELETE FROM files WHERE dir = ?", (rel,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (
+                            f.path,
+                            rel,
+                            f.path.rpartition("/")[2],
+                            f.size,
+                            f.mtime,
+                            f.suffix,
+                            f.sensor,
+                        )
+                        for f in files
+                    ),
+                )
+                parent = rel.rpartition("/")[0] if rel else None
+                conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (rel, parent, mtime))
+                queue.extend(subdirs)
+    # Directories that disappeared since the last scan
+    for path in previous.keys() - seen:
+        conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+        conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+
+
+def start_index(root: str, full: bool = False) -> FileIndexJob:
+    """Queue the (re)indexing of a source root, unless it is being indexed.
+
+    A running scan whose progress was not written for ``STALE_AFTER`` is assumed to have
+    died with its worker and is started again.
+
+    Raises:
+        ValueError: ``root`` is not a directory
+    """
+    root = os.path.abspath(root)  # noqa: PTH100
+    if not os.path.isdir(root):  # noqa: PTH112
+        raise ValueError(f"Path {root} is not a directory.")
+    job, created = FileIndexJob.objects.get_or_create(root=root, defaults={"full": full})
+    if not created:
+        now = timezone.now()
+        # Claimed with one conditional update, so that concurrent requests queue one scan
+        claimed = (
+            FileIndexJob.objects.filter(pk=job.pk)
+            .filter(~Q(status=JobStatusChoices.RUNNING) | Q(updated__lt=now - STALE_AFTER))
+            .update(
+                status=JobStatusChoices.RUNNING,
+                full=full,
+                files=0,
+                directories=0,
+                changed=0,
+                errors=0,
+                started=now,
+                finished=None,
+                updated=now,
+            )
+        )
+        job.refresh_from_db()
+        if not claimed:
+            return job
+    signature("backend.url.tasks.index_task", args=(root,)).delay()
+    return job
+
+
+def index_status(root: str) -> tuple[FileIndexJob | None, float | None]:
+    """Last indexing job of a root, and the time of its last complete scan."""
+    root = os.path.abspath(root)  # noqa: PTH100
+    job = FileIndexJob.objects.filter(root=root).first()
+    scanned = None
+    if index_path(root).exists():
+        with connect(root, readonly=True) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'scanned'").fetchone()
+            scanned = float(row[0]) if row else None
+    return job, scanned
+
+
+def search_index(
+    root: str,
+    glob: str = "",
+    contains: str = "",
+    sensor: str = "",
+    suffix: str = "",
+    modified_after: float | None = None,
+    modified_before: float | None = None,
+    cursor: str | None = None,
+    limit: int = 1000,
+) -> tuple[list[IndexedFile], str | None]:
+    """Query the index of a source root.
+
+    Args:
+        root (str): indexed source root
+        glob (str, optional): glob on the file name, or on the path relative to the root
+        when it contains a ``/`` (case sensitive, ``*``, ``?`` and ``[...]``; ``*`` also
+        matches ``/``)
+        contains (str, optional): case-insensitive substring of the relative path
+        sensor (str, optional): sensor token, e.g. ``jai1``
+        suffix (str, optional): file suffix, e.g. ``.bin``
+        modified_after (float | None, optional): lower bound of the mtime (timestamp)
+        modified_before (float | None, optional): upper bound of the mtime (timestamp)
+        cursor (str | None, optional): relative path of the last file of the previous page
+        limit (int, optional): page size
+
+    Raises:
+        ValueError: the root has not been indexed
+
+    Returns:
+        tuple[list[IndexedFile], str | None]: (files with absolute paths, ordered by
+        path, cursor of the next page if any)
+    """
+    root = os.path.abspath(root)  # noqa: PTH100
+    if not index_path(root).exists():
+        raise ValueError(f"Path {root} has not been indexed")
+    clauses: list[str] = []
+    params: list[object] = []
+    if glob:
+        clauses.append("path GLOB ?" if "/" in glob else "name GLOB ?")
+        params.append(glob.lstrip("/"))
+    if contains:
+        clauses.append("instr(lower(path), ?) > 0")
+        params.append(contains.lower())
+    if sensor:
+        clauses.append("sensor = ?")
+        params.append(sensor.lower())
+    if suffix:
+        clauses.append("suffix = ?")
+        params.append(suffix.lower() if suffix.startswith(".") else f".{suffix.lower()}")
+    if modified_after is not None:
+        clauses.append("mtime >= ?")
+        params.append(modified_after)
+    if modified_before is not None:
+        clauses.append("mtime < ?")
+        params.append(modified_before)
+    if cursor:
+        clauses.append("path > ?")
+        params.append(cursor)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with connect(root, readonly=True) as conn:
+        rows = conn.execute(
+            f"SELECT path, size, mtime, suffix, sensor FROM files {where} ORDER BY path LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    files = [
+        IndexedFile(os.path.join(root, path), size, mtime, suffix, sensor)  # noqa: PTH118
+        for path, size, mtime, suffix, sensor in rows[:limit]
+    ]
+    return files, next_cursor
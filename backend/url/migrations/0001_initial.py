@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:23
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="FileIndexJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("root", models.CharField(max_length=2048, unique=True)),
+                ("full", models.BooleanField(default=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("RUNNING", "Running"), ("DONE", "Done"), ("ERROR", "Error")],
+                        default="RUNNING",
+                    ),
+                ),
+                ("files", models.IntegerField(default=0)),
+                ("directories", models.IntegerField(default=0)),
+                ("changed", models.IntegerField(default=0)),
+                ("errors", models.IntegerField(default=0)),
+                ("started", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TreeJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("roots", models.JSONField(default=list)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("RUNNING", "Running"), ("DONE", "Done"), ("ERROR", "Error")],
+                        default="RUNNING",
+                    ),
+                ),
+                ("totals", models.JSONField(default=dict)),
+                ("pending", models.IntegerField(default=0)),
+                ("errors", models.IntegerField(default=0)),
+                ("started", models.DateTimeField(auto_now_add=True)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class JobStatusChoices(models.TextChoices):
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    ERROR = "ERROR"
+
+
+class TreeJob(models.Model):
+    """Aggregation of the recursive totals of a set of paths (see :mod:`backend.url.tree`).
+
+    ``status`` is ``RUNNING`` until every directory is listed, then ``DONE``; the totals
+    grow as directories are listed. Directories that cannot be listed count in ``errors``.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    roots = models.JSONField(default=list)
+    status = models.CharField(choices=JobStatusChoices, default=JobStatusChoices.RUNNING)
+    # Root -> {"files": ..., "bytes": ..., "directories": ...}
+    totals = models.JSONField(default=dict)
+    # Directories waiting to be listed
+    pending = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"tree_job_{self.pk}_{self.status}"
+
+    def total(self, key: str) -> int:
+        return sum(totals[key] for totals in self.totals.values())
+
+    @property
+    def elapsed(self) -> float:
+        return ((self.finished or timezone.now()) - self.started).total_seconds()
+
+
+class FileIndexJob(models.Model):
+    """Last (re)scan of the index of a source root (see :mod:`backend.url.file_index`)."""
+
+    root = models.CharField(max_length=2048, unique=True)
+    # List every directory again instead of only the ones whose mtime changed
+    full = models.BooleanField(default=False)
+    status = models.CharField(choices=JobStatusChoices, default=JobStatusChoices.RUNNING)
+    files = models.IntegerField(default=0)
+    directories = models.IntegerField(default=0)
+    # Directories listed again by the scan
+    changed = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    started = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"file_index_{self.root}_{self.status}"
@@ -1,22 +1,284 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-from backend.url.dto import DirFileItem
+from django.conf import settings
 
+from backend.url.dto import DirFileItem, DirTreeItem, DirTreeListing
+from backend.url.sizes import cached_size
 
-def list_dir(src: str, dirOnly: bool = False) -> list[DirFileItem]:
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+SORT_KEYS = ("name", "size", "mtime")
+# Directory listings kept for paging through large directories
+LISTING_CACHE_SIZE = 32
+
+_listings: OrderedDict[tuple[str, bool], tuple[int, float, list[DirEntryInfo]]] = OrderedDict()
+_listings_lock = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class DirEntryInfo:
+    """Directory entry as listed by ``os.scandir``, with its stat data."""
+
+    name: str
+    path: str
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+def scan_entries(psrc: Path, dirOnly: bool = False) -> list[DirEntryInfo]:
+    """List the visible entries of a directory with one ``scandir`` pass.
+
+    Hidden entries, entries that vanish or cannot be accessed are left out; with
+    ``dirOnly`` regular files are left out without being stat-ed.
+    """
+    entries: list[DirEntryInfo] = []
+    base = psrc.absolute()
+    with os.scandir(psrc) as it:
+        for entry in it:
+            # Skip hidden files and directories
+            if entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                if dirOnly and not is_dir:
+                    continue
+                st = entry.stat()
+            except OSError:
+                # Skip files/directories we don't have permission to access
+                continue
+            entries.append(
+                DirEntryInfo(
+                    name=entry.name,
+                    path=str(base / entry.name),
+                    is_dir=is_dir,
+                    size=0 if is_dir else st.st_size,
+                    mtime=st.st_mtime,
+                )
+            )
+    return entries
+
+
+def cached_entries(psrc: Path, dirOnly: bool = False) -> list[DirEntryInfo]:
+    """:func:`scan_entries`, reused while the directory mtime is unchanged.
+
+    Listings are kept for at most ``PHENOMATE_URL_LISTING_TTL`` seconds, as the size of a
+    file can change without changing the mtime of its directory.
+    """
+    key = (str(psrc.absolute()), dirOnly)
+    mtime_ns = psrc.stat().st_mtime_ns
+    ttl = getattr(settings, "PHENOMATE_URL_LISTING_TTL", 30.0)
+    with _listings_lock:
+        cached = _listings.get(key)
+        if cached is not None and cached[0] == mtime_ns and time.monotonic() - cached[1] < ttl:
+            _listings.move_to_end(key)
+            return cached[2]
+    entries = scan_entries(psrc, dirOnly)
+    with _listings_lock:
+        _listings[key] = (mtime_ns, time.monotonic(), entries)
+        _listings.move_to_end(key)
+        while len(_listings) > LISTING_CACHE_SIZE:
+            _listings.popitem(last=False)
+    return entries
+
+
+def sort_key(entry: DirEntryInfo, sort: str) -> list[Any]:
+    """Sort key of an entry, unique within a directory so that cursors are stable.
+
+    Directories sort with size 0 when sorting by size: their size is only computed for
+    the entries returned.
+    """
+    if sort == "size":
+        return [entry.size, entry.name]
+    if sort == "mtime":
+        return [entry.mtime, entry.name]
+    return [entry.name.casefold(), entry.name]
+
+
+def encode_cursor(key: list[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as exc:
+        raise ValueError(f"Invalid cursor: {cursor}") from exc
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return key
+
+
+def check_dir(src: str) -> Path:
     psrc = Path(src)
     if not psrc.exists():
         raise ValueError(f"Path {src} does not exist")
     if not psrc.is_dir():
         raise ValueError(f"Path {src} is not a directory.")
-    result: list[DirFileItem] = []
-    for child in psrc.iterdir():
+    return psrc
+
+
+def list_dir_page(
+    src: str,
+    dirOnly: bool = False,
+    sort: str = "name",
+    descending: bool = False,
+    prefix: str = "",
+    cursor: str | None = None,
+    limit: int | None = None,
+) -> tuple[list[DirEntryInfo], str | None]:
+    """Sorted page of the entries of a directory.
+
+    Entries are ordered by ``sort`` then name and paged with a keyset cursor, so that pages
+    stay consistent while entries are added to or removed from the directory.
+
+    Args:
+        src (str): directory to list
+        dirOnly (bool, optional): only list directories
+        sort (str, optional): one of :data:`SORT_KEYS`
+        descending (bool, optional): reverse the order
+        prefix (str, optional): only list entries whose name starts with it (case
+        insensitive)
+        cursor (str | None, optional): cursor returned with the previous page
+        limit (int | None, optional): page size, None for every entry after the cursor
+
+    Raises:
+        ValueError: the path is not a directory, or the sort or cursor is invalid
+
+    Returns:
+        tuple[list[DirEntryInfo], str | None]: (entries, cursor of the next page if any)
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Invalid sort: {sort}, expected one of {', '.join(SORT_KEYS)}")
+    entries: Iterable[DirEntryInfo] = cached_entries(check_dir(src), dirOnly)
+    if prefix:
+        folded = prefix.casefold()
+        entries = (entry for entry in entries if entry.name.casefold().startswith(folded))
+    keyed = sorted(
+        ((sort_key(entry, sort), entry) for entry in entries),
+        key=lambda item: item[0],
+        reverse=descending,
+    )
+    if cursor:
+        after = decode_cursor(cursor)
         try:
-            if not dirOnly or (dirOnly and child.is_dir()):
-                item = DirFileItem.from_path(child)
-                if item:
-                    result.append(item)
-        except PermissionError:
-            # Skip files/directories we don't have permission to access
-            continue
+            keyed = [item for item in keyed if (item[0] < after if descending else item[0] > after)]
+        except TypeError as exc:
+            raise ValueError(f"Cursor {cursor} does not match sort {sort}") from exc
+    if limit is None or len(keyed) <= limit:
+        return [entry for _, entry in keyed], None
+    page = keyed[:limit]
+    return [entry for _, entry in page], encode_cursor(page[-1][0])
+
+
+def iter_items(entries: Iterable[DirEntryInfo]) -> Iterator[DirFileItem]:
+    """Items of listed entries.
+
+    Directories only get a size when the size cache holds a valid one: listings never
+    wait for directory sizes, which clients request separately (see
+    :func:`backend.url.sizes.directory_sizes`).
+    """
+    for entry in entries:
+        size = cached_size(entry.path, entry.mtime) if entry.is_dir else None
+        yield DirFileItem.from_entry(entry, size)
+
+
+def stream_items(entries: Iterable[DirEntryInfo]) -> Iterator[str]:
+    """Encode items as a JSON array, one item at a time."""
+    yield "["
+    for index, item in enumerate(iter_items(entries)):
+        yield ("," if index else "") + item.model_dump_json()
+    yield "]"
+
+
+def list_dir(src: str, dirOnly: bool = False) -> list[DirFileItem]:
+    entries, _ = list_dir_page(src, dirOnly)
+    return list(iter_items(entries))
+
+
+def _list_or_error(path: str, dirOnly: bool) -> list[DirEntryInfo] | str:
+    try:
+        return sorted(cached_entries(check_dir(path), dirOnly), key=lambda e: sort_key(e, "name"))
+    except (ValueError, OSError) as exc:
+        return str(exc)
+
+
+def prefetch_tree(paths: list[str], depth: int = 1, dirOnly: bool = False) -> list[DirTreeListing]:
+    """Nested listings of several directories, ``depth`` levels deep, in one call.
+
+    Each level is listed concurrently and every directory is listed once, sharing the
+    listing cache with :func:`list_dir_page`. With ``dirOnly`` regular files are never
+    stat-ed and directories have no size; otherwise the size of a listed directory is
+    summed from its listing, without listing it again.
+
+    Args:
+        paths (list[str]): directories to list
+        depth (int, optional): levels to list below each path, 1 for its direct entries
+        dirOnly (bool, optional): only list directories
+
+    Raises:
+        ValueError: depth is out of range
+
+    Returns:
+        list[DirTreeListing]: one listing per path, with the error of paths that could
+        not be listed
+    """
+    max_depth = getattr(settings, "PHENOMATE_URL_PREFETCH_MAX_DEPTH", 4)
+    if not 1 <= depth <= max_depth:
+        raise ValueError(f"depth must be between 1 and {max_depth}")
+    listings: dict[str, list[DirEntryInfo] | str] = {}
+    level = list(dict.fromkeys(paths))
+    workers = getattr(settings, "PHENOMATE_URL_TREE_WORKERS", 8)
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="prefetch") as pool:
+        for remaining in range(depth, 0, -1):
+            results = list(pool.map(_list_or_error, level, [dirOnly] * len(level)))
+            listings.update(zip(level, results, strict=True))
+            level = [
+                entry.path
+                for result in results
+                if remaining > 1 and isinstance(result, list)
+                for entry in result
+                if entry.is_dir and entry.path not in listings
+            ]
+
+    def build(entries: list[DirEntryInfo]) -> list[DirTreeItem]:
+        items = []
+        for entry in entries:
+            listing = listings.get(entry.path) if entry.is_dir else None
+            children = listing if isinstance(listing, list) else None
+            size = None
+            if entry.is_dir and not dirOnly:
+                # The size of a listed directory is the bytes of the files in its listing
+                size = (
+                    sum(child.size for child in children if not child.is_dir)
+                    if children is not None
+                    else cached_size(entry.path, entry.mtime)
+                )
+            items.append(
+                DirTreeItem(
+                    **DirFileItem.from_entry(entry, size).model_dump(),
+                    children=build(children) if children is not None else None,
+                )
+            )
+        return items
+
+    result: list[DirTreeListing] = []
+    for path in paths:
+        listing = listings[path]
+        if isinstance(listing, str):
+            result.append(DirTreeListing(id=path, items=[], error=listing))
+        else:
+            result.append(DirTreeListing(id=path, items=build(listing)))
     return result
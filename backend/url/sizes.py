@@ -0,0 +1,76 @@
+"""Cache of directory sizes for the file browser.
+
+The size of a directory (the bytes of the regular files directly under it) takes a scandir
+of the directory, which is slow over the ``/hostfs`` bind mount. Listings therefore only
+include sizes already cached; the others are computed on a thread pool for a batch request
+(``POST /api/urls/sizes``) and cached. A cached size is valid while the mtime of its directory is unchanged, i.e. until a
+file is added, removed or renamed in it; a file growing in place is not noticed.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+from backend.url.dto import get_directory_size_scandir
+
+_sizes: OrderedDict[str, tuple[float, int]] = OrderedDict()
+_sizes_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+
+
+def size_pool() -> ThreadPoolExecutor:
+    global _pool  # noqa: PLW0603
+    with _sizes_lock:
+        if _pool is None:
+            workers = getattr(settings, "PHENOMATE_URL_SIZE_WORKERS", 8)
+            _pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="dirsize")
+        return _pool
+
+
+def cached_size(path: str, mtime: float) -> int | None:
+    """Cached size of the directory ``path`` if it has not changed since it was computed."""
+    with _sizes_lock:
+        cached = _sizes.get(path)
+        if cached is None or cached[0] != mtime:
+            return None
+        _sizes.move_to_end(path)
+        return cached[1]
+
+
+def store_size(path: str, mtime: float, size: int) -> None:
+    limit = getattr(settings, "PHENOMATE_URL_SIZE_CACHE", 10000)
+    with _sizes_lock:
+        _sizes[path] = (mtime, size)
+        _sizes.move_to_end(path)
+        while len(_sizes) > limit:
+            _sizes.popitem(last=False)
+
+
+def directory_size(path: str) -> int | None:
+    """Size of a directory, from the cache when it is still valid.
+
+    Returns:
+        int | None: bytes of the regular files directly under ``path``, None if it is not
+        an accessible directory
+    """
+    try:
+        mtime = os.stat(path).st_mtime  # noqa: PTH116
+    except OSError:
+        return None
+    size = cached_size(path, mtime)
+    if size is None:
+        size = get_directory_size_scandir(Path(path))
+        store_size(path, mtime, size)
+    return size
+
+
+def directory_sizes(paths: list[str]) -> dict[str, int | None]:
+    """Sizes of several directories, the uncached ones computed concurrently."""
+    unique = list(dict.fromkeys(paths))
+    return dict(zip(unique, size_pool().map(directory_size, unique), strict=True))
@@ -0,0 +1,14 @@
+from backend.url.file_index import run_index
+from backend.url.models import FileIndexJob, TreeJob
+from backend.url.tree import aggregate_tree
+from celery import shared_task
+
+
+@shared_task
+def tree_task(job_id: str) -> None:
+    aggregate_tree(TreeJob.objects.get(pk=job_id))
+
+
+@shared_task
+def index_task(root: str) -> None:
+    run_index(FileIndexJob.objects.get(root=root))
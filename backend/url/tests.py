@@ -0,0 +1,166 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from backend.url.file_index import connect, index_status, run_index, search_index, start_index
+from backend.url.models import FileIndexJob, TreeJob
+from backend.url.service import list_dir_page
+from backend.url.tree import aggregate_tree, get_tree_job, start_tree_job
+
+
+class DirPageTests(TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        for name, size in (("b_jai1.bin", 30), ("A_imu.bin", 10), ("c_jai1.bin", 20)):
+            (self.root / name).write_bytes(b"x" * size)
+        (self.root / "Bays").mkdir()
+
+    def names(self, **kwargs) -> list[str]:
+        entries, _ = list_dir_page(str(self.root), **kwargs)
+        return [entry.name for entry in entries]
+
+    def test_sort_and_prefix(self) -> None:
+        self.assertEqual(self.names(), ["A_imu.bin", "b_jai1.bin", "Bays", "c_jai1.bin"])
+        self.assertEqual(
+            self.names(sort="size", descending=True),
+            ["b_jai1.bin", "c_jai1.bin", "A_imu.bin", "Bays"],
+        )
+        self.assertEqual(self.names(prefix="B"), ["b_jai1.bin", "Bays"])
+        self.assertEqual(self.names(dirOnly=True), ["Bays"])
+        with self.assertRaises(ValueError):
+            list_dir_page(str(self.root), sort="owner")
+
+    def test_cursor_paging(self) -> None:
+        pages, cursor = [], None
+        while True:
+            entries, cursor = list_dir_page(str(self.root), sort="size", cursor=cursor, limit=3)
+            pages.append([entry.name for entry in entries])
+            if cursor is None:
+                break
+        self.assertEqual(pages, [["Bays", "A_imu.bin", "c_jai1.bin"], ["b_jai1.bin"]])
+
+    def test_cursor_survives_new_entries(self) -> None:
+        entries, cursor = list_dir_page(str(self.root), limit=2)
+        self.assertEqual([entry.name for entry in entries], ["A_imu.bin", "b_jai1.bin"])
+        (self.root / "a0.bin").write_bytes(b"")
+        entries, cursor = list_dir_page(str(self.root), cursor=cursor, limit=2)
+        self.assertEqual([entry.name for entry in entries], ["Bays", "c_jai1.bin"])
+        self.assertIsNone(cursor)
+
+    def test_cursor_must_match_sort(self) -> None:
+        _, cursor = list_dir_page(str(self.root), sort="size", limit=1)
+        with self.assertRaises(ValueError):
+            list_dir_page(str(self.root), cursor=cursor, limit=1)
+
+
+class TreeJobTests(TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / "plot3/raw").mkdir(parents=True)
+        (self.root / "plot4").mkdir()
+        (self.root / "plot3/a_jai1.bin").write_bytes(b"x" * 100)
+        (self.root / "plot3/raw/b_jai1.bin").write_bytes(b"x" * 10)
+        (self.root / "plot4/c_imu.bin").write_bytes(b"x" * 1)
+
+    @mock.patch("backend.url.tree.signature")
+    def test_nested_paths_are_counted_once(self, signature: mock.Mock) -> None:
+        job = start_tree_job([str(self.root / "plot3/raw"), str(self.root), str(self.root)])
+        self.assertEqual(job.roots, [str(self.root)])
+        signature.assert_called_once_with("backend.url.tasks.tree_task", args=(str(job.pk),))
+
+        aggregate_tree(get_tree_job(str(job.pk)))
+        job = get_tree_job(str(job.pk))
+        self.assertEqual(job.status, "DONE")
+        self.assertEqual(job.totals, {str(self.root): {"files": 3, "bytes": 111, "directories": 4}})
+        self.assertIsNotNone(job.finished)
+
+    def test_roots_are_totalled_apart(self) -> None:
+        roots = [str(self.root / "plot3"), str(self.root / "plot4/c_imu.bin")]
+        job = TreeJob.objects.create(roots=roots)
+        aggregate_tree(job)
+        job.refresh_from_db()
+        self.assertEqual(
+            [job.totals[root] for root in roots],
+            [
+                {"files": 2, "bytes": 110, "directories": 2},
+                {"files": 1, "bytes": 1, "directories": 0},
+            ],
+        )
+        self.assertEqual((job.total("files"), job.total("bytes")), (3, 111))
+
+    def test_unknown_jobs(self) -> None:
+        self.assertIsNone(get_tree_job("not-a-job"))
+        self.assertIsNone(get_tree_job("4dbb3dc0-974a-47f1-b2d1-8faa2222b707"))
+
+
+class FileIndexTests(TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name, "src")
+        (self.root / "plot3/raw").mkdir(parents=True)
+        (self.root / "plot3/a_jai1.bin").write_bytes(b"x" * 3)
+        (self.root / "plot3/raw/b_jai1.bin").write_bytes(b"x" * 2)
+        (self.root / "plot3/raw/b_imu.CSV").write_bytes(b"x")
+        settings = override_settings(PHENOMATE_FILE_INDEX_DIR=str(Path(tmp.name, "index")))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch("backend.url.file_index.signature")
+        self.signature = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def index(self, full: bool = False) -> FileIndexJob:
+        job = start_index(str(self.root), full=full)
+        run_index(job)
+        job.refresh_from_db()
+        return job
+
+    def paths(self, **kwargs) -> list[str]:
+        files, _ = search_index(str(self.root), **kwargs)
+        return [str(Path(file.path).relative_to(self.root)) for file in files]
+
+    def test_search(self) -> None:
+        job = self.index()
+        self.assertEqual((job.status, job.files, job.directories), ("DONE", 3, 3))
+        self.assertEqual(self.paths(sensor="JAI1"), ["plot3/a_jai1.bin", "plot3/raw/b_jai1.bin"])
+        self.assertEqual(self.paths(suffix="csv"), ["plot3/raw/b_imu.CSV"])
+        self.assertEqual(self.paths(glob="b_*"), ["plot3/raw/b_imu.CSV", "plot3/raw/b_jai1.bin"])
+        self.assertEqual(
+            self.paths(glob="plot3/*.bin"), ["plot3/a_jai1.bin", "plot3/raw/b_jai1.bin"]
+        )
+        self.assertEqual(self.paths(contains="RAW/B_J"), ["plot3/raw/b_jai1.bin"])
+
+        files, cursor = search_index(str(self.root), limit=2)
+        self.assertEqual(len(files), 2)
+        self.assertEqual(self.paths(cursor=cursor), ["plot3/raw/b_jai1.bin"])
+
+    def test_rescan_relists_changed_directories(self) -> None:
+        self.index()
+        (self.root / "plot3/raw/b_jai1.bin").unlink()
+        (self.root / "plot4").mkdir()
+        (self.root / "plot4/c_jai1.bin").write_bytes(b"")
+        job = self.index()
+        self.assertEqual((job.files, job.changed), (3, 3))
+        self.assertEqual(self.paths(sensor="jai1"), ["plot3/a_jai1.bin", "plot4/c_jai1.bin"])
+        self.assertEqual(self.index(full=True).changed, 4)
+
+    def test_running_index_is_not_queued_again(self) -> None:
+        job = start_index(str(self.root))
+        self.assertEqual(start_index(str(self.root)).pk, job.pk)
+        self.signature.assert_called_once_with("backend.url.tasks.index_task", args=(job.root,))
+
+    def test_search_is_read_only(self) -> None:
+        with self.assertRaises(ValueError):
+            search_index(str(self.root))
+        self.assertEqual(index_status(str(self.root)), (None, None))
+        self.index()
+        with connect(str(self.root), readonly=True) as conn, self.assertRaises(sqlite3.Error):
+            conn.execute("DELETE FROM files")
+        self.assertEqual(len(self.paths()), 3)
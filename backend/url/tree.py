@@ -0,0 +1,168 @@
+"""Background aggregation of the recursive size and file count of source trees.
+
+Before an offload the file browser asks for the total bytes and files below the selected
+paths. A :class:`~backend.url.models.TreeJob` is walked by a Celery task, which lists
+directories with ``os.scandir`` on a thread pool like the offload walker does and writes
+the totals to the job row as it goes, so that they can be polled while it runs.
+
+Every directory listed is kept as a :class:`DirectoryNode` (its direct files, bytes and
+subdirectories) for as long as its mtime does not change, so walking a tree again only
+stats its directories and lists the ones that changed: re-selecting a subtree costs one
+stat per directory. The cache lives in the worker process.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from backend.url.models import JobStatusChoices, TreeJob
+from celery import signature
+
+shared_logger = get_task_logger(__name__)
+
+# Finished jobs are deleted after a day
+JOB_TTL = dt.timedelta(days=1)
+# Seconds between two writes of the totals of a running job
+PROGRESS_INTERVAL = 1.0
+
+_nodes: OrderedDict[str, DirectoryNode] = OrderedDict()
+_nodes_lock = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class DirectoryNode:
+    """Regular files and subdirectories directly under a directory."""
+
+    mtime: float
+    files: int
+    bytes: int
+    subdirs: tuple[str, ...]
+
+
+def scan_node(path: str) -> DirectoryNode | None:
+    """Direct content of a directory, from the cache while its mtime is unchanged.
+
+    Returns:
+        DirectoryNode | None: None if ``path`` cannot be listed
+    """
+    try:
+        mtime = os.stat(path).st_mtime  # noqa: PTH116
+    except OSError:
+        return None
+    with _nodes_lock:
+        node = _nodes.get(path)
+        if node is not None and node.mtime == mtime:
+            _nodes.move_to_end(path)
+            return node
+    files = size = 0
+    subdirs: list[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    # Vanished/locked entries and WSL/NTFS oddities
+                    continue
+    except OSError as exc:
+        shared_logger.warning(f"Phenomate: scan_node(): Cannot list {path}: {exc}")
+        return None
+    node = DirectoryNode(mtime=mtime, files=files, bytes=size, subdirs=tuple(subdirs))
+    limit = getattr(settings, "PHENOMATE_URL_TREE_CACHE", 200000)
+    with _nodes_lock:
+        _nodes[path] = node
+        _nodes.move_to_end(path)
+        while len(_nodes) > limit:
+            _nodes.popitem(last=False)
+    return node
+
+
+def empty_totals() -> dict[str, int]:
+    return {"files": 0, "bytes": 0, "directories": 0}
+
+
+def aggregate_tree(job: TreeJob) -> None:
+    """Walk the roots of ``job``, writing its totals at most every ``PROGRESS_INTERVAL``."""
+    workers = getattr(settings, "PHENOMATE_URL_TREE_WORKERS", 8)
+    # (directory, root it belongs to)
+    queue: deque[tuple[str, str]] = deque()
+    for root in job.roots:
+        totals = job.totals[root] = empty_totals()
+        try:
+            if os.path.isdir(root):  # noqa: PTH112
+                queue.append((root, root))
+            else:
+                totals["files"] = 1
+                totals["bytes"] = os.stat(root).st_size  # noqa: PTH116
+        except OSError:
+            job.errors += 1
+    running: dict[Future[DirectoryNode | None], str] = {}
+    saved = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tree") as pool:
+            while queue or running:
+                while queue and len(running) < 2 * workers:
+                    directory, root = queue.popleft()
+                    running[pool.submit(scan_node, directory)] = root
+                job.pending = len(queue) + len(running)
+                if time.monotonic() - saved >= PROGRESS_INTERVAL:
+                    job.save(update_fields=["totals", "pending", "errors", "updated"])
+                    saved = time.monotonic()
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root = running.pop(future)
+                    node = future.result()
+                    if node is None:
+                        job.errors += 1
+                        continue
+                    totals = job.totals[root]
+                    totals["files"] += node.files
+                    totals["bytes"] += node.bytes
+                    totals["directories"] += 1
+                    queue.extend((subdir, root) for subdir in node.subdirs)
+        job.status = JobStatusChoices.DONE
+    except Exception:
+        shared_logger.exception(f"Phenomate: aggregate_tree(): Failed to aggregate {job.roots}")
+        job.status = JobStatusChoices.ERROR
+    finally:
+        job.pending = 0
+        job.finished = timezone.now()
+        job.save()
+
+
+def start_tree_job(paths: list[str]) -> TreeJob:
+    """Queue the aggregation of the recursive totals of ``paths``.
+
+    Nested and duplicate paths are counted once, under their outermost selected path.
+    """
+    roots = sorted({os.path.abspath(path) for path in paths}, key=len)  # noqa: PTH100
+    kept: list[str] = []
+    for root in roots:
+        if not any(root == top or root.startswith(top.rstrip(os.sep) + os.sep) for top in kept):
+            kept.append(root)
+    TreeJob.objects.filter(started__lt=timezone.now() - JOB_TTL).delete()
+    job = TreeJob.objects.create(roots=kept, totals={root: empty_totals() for root in kept})
+    signature("backend.url.tasks.tree_task", args=(str(job.pk),)).delay()
+    return job
+
+
+def get_tree_job(job_id: str) -> TreeJob | None:
+    try:
+        return TreeJob.objects.get(pk=job_id)
+    except (TreeJob.DoesNotExist, ValidationError):
+        return None
@@ -1,5 +1,5 @@
 /* eslint-disable @typescript-eslint/no-unnecessary-condition */
-import React, { useCallback, useEffect, useRef, useState } from 'react'
+import React, { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 import {
   ChonkyActions,
   FileHelper,
@@ -243,12 +243,31 @@ export const BaseVFS = ({
       },
     },
   })
+
+  // Listings only carry cached directory sizes: fetch the missing ones separately
+  const missingSizes = (queryResult.data ?? [])
+    .filter(item => item.isDir && item.size == null)
+    .map(item => item.id)
+  const sizesResult = $api.useQuery(
+    'post',
+    '/api/urls/sizes',
+    { body: { paths: missingSizes } },
+    { enabled: missingSizes.length > 0 },
+  )
+  const files = useMemo(() => {
+    if (!queryResult.data) return undefined
+    const sizes = new Map(sizesResult.data?.map(item => [item.id, item.size]))
+    return queryResult.data.map(item => ({
+      ...item,
+      size: item.size ?? sizes.get(item.id) ?? undefined,
+    }))
+  }, [queryResult.data, sizesResult.data])
   
   // Select button disable state logic
   const [disabled, setDisabled] = useState<boolean>(true)
   const setDisabledState = handleDisabledState(multiple, setDisabled)
   const onClickHandler = handleSelect(
-    queryResult.data,
+    files,
     fileBrowserRef,
     addSelectedFiles,
     name_local_storage
@@ -275,7 +294,7 @@ export const BaseVFS = ({
             queryResult.isError
               ? []
               : queryResult.isSuccess
-                ? queryResult.data
+                ? files
                 : [null]
           }
           folderChain={folderChain}
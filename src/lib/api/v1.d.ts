@@ -101,7 +101,14 @@ export interface paths {
             path?: never;
             cookie?: never;
         };
-        /** Get Children Url */
+        /**
+         * Get Children Url
+         * @description List a directory, optionally sorted, filtered by name prefix and paged.
+         *
+         * With ``limit`` set, the cursor of the next page is returned in the ``X-Next-Cursor``
+         * header. With ``stream`` the JSON array is sent as the items are built. Directories
+         * only have a size when it is cached; the others are requested from ``POST /sizes``.
+         */
         get: operations["backend_url_api_get_children_url"];
         put?: never;
         post?: never;
@@ -111,6 +118,134 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/api/urls/prefetch": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        get?: never;
+        put?: never;
+        /**
+         * Prefetch Children Url
+         * @description Nested listings of several directories, ``depth`` levels deep.
+         */
+        post: operations["backend_url_api_prefetch_children_url"];
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/urls/sizes": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        get?: never;
+        put?: never;
+        /**
+         * Get Directory Sizes
+         * @description Sizes of directories (bytes of the files directly under each of them).
+         */
+        post: operations["backend_url_api_get_directory_sizes"];
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/urls/tree": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        get?: never;
+        put?: never;
+        /**
+         * Start Tree Totals
+         * @description Start computing the recursive size and file count of paths in the background.
+         */
+        post: operations["backend_url_api_start_tree_totals"];
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/urls/tree/{job_id}": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * Get Tree Totals
+         * @description Progress and (partial) totals of a tree aggregation job.
+         */
+        get: operations["backend_url_api_get_tree_totals"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/urls/index": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * Get Index Status
+         * @description Progress of the indexing of a source root and time of its last complete scan.
+         */
+        get: operations["backend_url_api_get_index_status"];
+        put?: never;
+        /**
+         * Index Source
+         * @description Start (re)indexing the files below a source root in the background.
+         */
+        post: operations["backend_url_api_index_source"];
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/urls/index/search": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * Search Source Index
+         * @description Files of an indexed source root matching every filter given, ordered by path.
+         *
+         * ``glob`` matches the file name, or the path below the root when it contains a ``/``.
+         * The cursor of the next page is returned in the ``X-Next-Cursor`` header; the ``id`` of
+         * the files can be offloaded as they are.
+         */
+        get: operations["backend_url_api_search_source_index"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/api/researcher/": {
         parameters: {
             query?: never;
@@ -152,7 +287,7 @@ export interface paths {
             path?: never;
             cookie?: never;
         };
-        /** List all activities associated with a project */
+        /** List the activities associated with a project, newest first */
         get: operations["backend_activity_api_list_activities"];
         put?: never;
         post?: never;
@@ -162,6 +297,40 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/api/activity/{project_id}/changes": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /** List the activities of a project written or deleted since the previous poll */
+        get: operations["backend_activity_api_list_activity_changes"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/activity/{project_id}/events": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /** Stream the activity state transitions of a project as Server-Sent Events */
+        get: operations["backend_activity_api_stream_activity_events"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/api/activity/activity/{activity_id}": {
         parameters: {
             query?: never;
@@ -197,6 +366,58 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/api/activity/offload/job/{offload_id}": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /** Get the discovery status of an offload */
+        get: operations["backend_activity_api_get_offload"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/activity/offload/job/{offload_id}/progress": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /** Get the file, byte and stage counters of an offload, with throughput and ETA */
+        get: operations["backend_activity_api_get_offload_progress"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/api/activity/copy/throttle": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /** Get the copy bandwidth limit of each copy worker process */
+        get: operations["backend_activity_api_get_copy_throttle"];
+        /** Set the copy bandwidth limit of each copy worker process (0: no limit) */
+        put: operations["backend_activity_api_set_copy_throttle"];
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/api/activity/retry/{activity_id}": {
         parameters: {
             query?: never;
@@ -214,6 +435,23 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/api/activity/project/{project_id}/retry": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        get?: never;
+        put?: never;
+        /** Restart the FAILED/QUEUED jobs of a project matching a filter */
+        post: operations["backend_activity_api_retry_project_activities"];
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/api/activity/": {
         parameters: {
             query?: never;
@@ -386,7 +624,156 @@ export interface components {
             /** Ishidden */
             isHidden: boolean;
             /** Size */
+            size: number | null;
+            /** Mtime */
+            mtime?: number | null;
+        };
+        /** DirTreeItem */
+        DirTreeItem: {
+            /** Id */
+            id: string;
+            /** Name */
+            name: string;
+            /** Isdir */
+            isDir: boolean;
+            /** Ishidden */
+            isHidden: boolean;
+            /** Size */
+            size: number | null;
+            /** Mtime */
+            mtime?: number | null;
+            /** Children */
+            children?: components["schemas"]["DirTreeItem"][] | null;
+        };
+        /** DirTreeListing */
+        DirTreeListing: {
+            /** Id */
+            id: string;
+            /** Items */
+            items: components["schemas"]["DirTreeItem"][];
+            /** Error */
+            error?: string | null;
+        };
+        /** DirPrefetchForm */
+        DirPrefetchForm: {
+            /** Paths */
+            paths: string[];
+            /**
+             * Depth
+             * @default 1
+             */
+            depth: number;
+            /**
+             * Dironly
+             * @default false
+             */
+            dirOnly: boolean;
+        };
+        /** DirSizeItem */
+        DirSizeItem: {
+            /** Id */
+            id: string;
+            /** Size */
+            size: number | null;
+        };
+        /** DirSizesForm */
+        DirSizesForm: {
+            /** Paths */
+            paths: string[];
+        };
+        /** TreeJobSchema */
+        TreeJobSchema: {
+            /** Id */
+            id: string;
+            /** Status */
+            status: string;
+            /** Files */
+            files: number;
+            /** Bytes */
+            bytes: number;
+            /** Directories */
+            directories: number;
+            /** Pending */
+            pending: number;
+            /** Errors */
+            errors: number;
+            /** Elapsed */
+            elapsed: number;
+            /** Roots */
+            roots: components["schemas"]["TreeTotalsSchema"][];
+        };
+        /** TreeTotalsSchema */
+        TreeTotalsSchema: {
+            /** Id */
+            id: string;
+            /** Files */
+            files: number;
+            /** Bytes */
+            bytes: number;
+            /** Directories */
+            directories: number;
+        };
+        /** TreeJobForm */
+        TreeJobForm: {
+            /** Paths */
+            paths: string[];
+        };
+        /** FileIndexSchema */
+        FileIndexSchema: {
+            /** Root */
+            root: string;
+            /** Status */
+            status?: string | null;
+            /**
+             * Files
+             * @default 0
+             */
+            files: number;
+            /**
+             * Directories
+             * @default 0
+             */
+            directories: number;
+            /**
+             * Changed
+             * @default 0
+             */
+            changed: number;
+            /**
+             * Errors
+             * @default 0
+             */
+            errors: number;
+            /**
+             * Scanned
+             * Format: date-time
+             */
+            scanned?: string | null;
+        };
+        /** FileIndexForm */
+        FileIndexForm: {
+            /** Root */
+            root: string;
+            /**
+             * Full
+             * @default false
+             */
+            full: boolean;
+        };
+        /** IndexedFileSchema */
+        IndexedFileSchema: {
+            /** Id */
+            id: string;
+            /** Name */
+            name: string;
+            /** Size */
             size: number;
+            /** Mtime */
+            mtime: number;
+            /** Suffix */
+            suffix: string;
+            /** Sensor */
+            sensor: string;
         };
         /** ResearcherSchema */
         ResearcherSchema: {
@@ -403,6 +790,11 @@ export interface components {
          * @enum {string}
          */
         ActivityChoices: "COPY" | "PREPROC" | "REMOVE";
+        /**
+         * StatusChoices
+         * @enum {string}
+         */
+        StatusChoices: "QUEUED" | "ERROR" | "COMPLETED" | "SKIPPED";
         /** ActivitySchema */
         ActivitySchema: {
             /** Id */
@@ -414,7 +806,38 @@ export interface components {
             target: string | null;
             status: components["schemas"]["StatusChoices"];
             /** Error Log */
-            error_log: string | null;
+            error_log?: string | null;
+            /** Size */
+            size: number;
+            /** Throughput */
+            throughput: number | null;
+            /**
+             * Checksum
+             * @default ""
+             */
+            checksum: string;
+            /** Destination */
+            destination: string;
+            copy_status: components["schemas"]["StatusChoices"];
+            /**
+             * Copied At
+             * Format: date-time
+             */
+            copied_at: string | null;
+            /** Preprocess Status */
+            preprocess_status: string;
+            /**
+             * Preprocessed At
+             * Format: date-time
+             */
+            preprocessed_at: string | null;
+            /** Remove Status */
+            remove_status: string;
+            /**
+             * Removed At
+             * Format: date-time
+             */
+            removed_at: string | null;
             /**
              * Created
              * Format: date-time
@@ -426,16 +849,122 @@ export interface components {
              */
             updated: string;
         };
-        /**
-         * StatusChoices
-         * @enum {string}
-         */
-        StatusChoices: "QUEUED" | "ERROR" | "COMPLETED";
-        /** OffloadActivityForm */
-        OffloadActivityForm: {
+        /** ActivityChangesSchema */
+        ActivityChangesSchema: {
+            /** Activities */
+            activities: components["schemas"]["ActivitySchema"][];
+            /** Deleted */
+            deleted: number[];
+            /** Reset */
+            reset: boolean;
+            /** Version */
+            version: number;
+            /**
+             * Modified
+             * Format: date-time
+             */
+            modified: string;
+        };
+        /** OffloadSchema */
+        OffloadSchema: {
+            /** Id */
+            id: number;
+            /** Project Id */
+            project_id: number;
+            /** Sources */
+            sources: string[];
+            status: components["schemas"]["StatusChoices"];
+            /** Files Found */
+            files_found: number;
+            /** Error Log */
+            error_log: string | null;
+            /**
+             * Created
+             * Format: date-time
+             */
+            created: string;
+            /**
+             * Updated
+             * Format: date-time
+             */
+            updated: string;
+        };
+        /** OffloadActivityForm */
+        OffloadActivityForm: {
             /** Src Files */
             src_files: string[];
         };
+        /** OffloadProgressSchema */
+        OffloadProgressSchema: {
+            /** Id */
+            id: number;
+            status: components["schemas"]["StatusChoices"];
+            /** Total Files */
+            total_files: number;
+            /** Total Bytes */
+            total_bytes: number;
+            /** Files Skipped */
+            files_skipped: number;
+            /** Bytes Copied */
+            bytes_copied: number;
+            /** Copy Queued */
+            copy_queued: number;
+            /** Copy Completed */
+            copy_completed: number;
+            /** Copy Errors */
+            copy_errors: number;
+            /** Preprocess Queued */
+            preprocess_queued: number;
+            /** Preprocess Completed */
+            preprocess_completed: number;
+            /** Preprocess Errors */
+            preprocess_errors: number;
+            /** Remove Queued */
+            remove_queued: number;
+            /** Remove Completed */
+            remove_completed: number;
+            /** Remove Errors */
+            remove_errors: number;
+            /** Throughput */
+            throughput: number | null;
+            /** Eta */
+            eta: number | null;
+            /**
+             * Created
+             * Format: date-time
+             */
+            created: string;
+            /**
+             * Updated
+             * Format: date-time
+             */
+            updated: string;
+        };
+        /** CopyThrottleSchema */
+        CopyThrottleSchema: {
+            /** Bytes Per Second */
+            bytes_per_second: number;
+        };
+        /** RetryActivitiesSchema */
+        RetryActivitiesSchema: {
+            /** Retried */
+            retried: number;
+        };
+        /** RetryActivitiesForm */
+        RetryActivitiesForm: {
+            /**
+             * Status
+             * @default ["ERROR"]
+             */
+            status: components["schemas"]["StatusChoices"][];
+            activity?: components["schemas"]["ActivityChoices"] | null;
+            /** Filename Prefix */
+            filename_prefix?: string | null;
+            /** Offload Id */
+            offload_id?: number | null;
+            /** Ids */
+            ids?: number[] | null;
+        };
     };
     responses: never;
     parameters: never;
@@ -606,6 +1135,12 @@ export interface operations {
             query?: {
                 src?: string;
                 dirOnly?: boolean;
+                sort?: string;
+                descending?: boolean;
+                prefix?: string;
+                cursor?: string | null;
+                limit?: number | null;
+                stream?: boolean;
             };
             header?: never;
             path?: never;
@@ -624,6 +1159,176 @@ export interface operations {
             };
         };
     };
+    backend_url_api_prefetch_children_url: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["DirPrefetchForm"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["DirTreeListing"][];
+                };
+            };
+        };
+    };
+    backend_url_api_get_directory_sizes: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["DirSizesForm"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["DirSizeItem"][];
+                };
+            };
+        };
+    };
+    backend_url_api_start_tree_totals: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["TreeJobForm"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["TreeJobSchema"];
+                };
+            };
+        };
+    };
+    backend_url_api_get_tree_totals: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path: {
+                job_id: string;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["TreeJobSchema"];
+                };
+            };
+        };
+    };
+    backend_url_api_get_index_status: {
+        parameters: {
+            query: {
+                root: string;
+            };
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["FileIndexSchema"];
+                };
+            };
+        };
+    };
+    backend_url_api_index_source: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["FileIndexForm"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["FileIndexSchema"];
+                };
+            };
+        };
+    };
+    backend_url_api_search_source_index: {
+        parameters: {
+            query: {
+                root: string;
+                glob?: string;
+                contains?: string;
+                sensor?: string;
+                suffix?: string;
+                modified_after?: string | null;
+                modified_before?: string | null;
+                cursor?: string | null;
+                limit?: number;
+            };
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["IndexedFileSchema"][];
+                };
+            };
+        };
+    };
     backend_researcher_api_list_researchers: {
         parameters: {
             query?: never;
@@ -666,7 +1371,16 @@ export interface operations {
     };
     backend_activity_api_list_activities: {
         parameters: {
-            query?: never;
+            query?: {
+                status?: components["schemas"]["StatusChoices"] | null;
+                activity?: components["schemas"]["ActivityChoices"] | null;
+                filename_prefix?: string | null;
+                updated_since?: string | null;
+                /** @description X-Next-Cursor header of the previous page */
+                cursor?: string | null;
+                limit?: number | null;
+                include_error_log?: boolean;
+            };
             header?: never;
             path: {
                 project_id: string;
@@ -686,6 +1400,57 @@ export interface operations {
             };
         };
     };
+    backend_activity_api_list_activity_changes: {
+        parameters: {
+            query: {
+                updated_since: string;
+                /** @description X-Next-Cursor header of the previous page */
+                cursor?: string | null;
+                limit?: number | null;
+                include_error_log?: boolean;
+            };
+            header?: never;
+            path: {
+                project_id: string;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["ActivityChangesSchema"];
+                };
+            };
+        };
+    };
+    backend_activity_api_stream_activity_events: {
+        parameters: {
+            query?: {
+                /** @description Resume token (Last-Event-ID header) */
+                last_event_id?: number | null;
+            };
+            header?: never;
+            path: {
+                project_id: number;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content?: never;
+            };
+        };
+    };
     backend_activity_api_get_activity: {
         parameters: {
             query?: never;
@@ -748,7 +1513,97 @@ export interface operations {
                 headers: {
                     [name: string]: unknown;
                 };
-                content?: never;
+                content: {
+                    "application/json": components["schemas"]["OffloadSchema"];
+                };
+            };
+        };
+    };
+    backend_activity_api_get_offload: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path: {
+                offload_id: number;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["OffloadSchema"];
+                };
+            };
+        };
+    };
+    backend_activity_api_get_offload_progress: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path: {
+                offload_id: number;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["OffloadProgressSchema"];
+                };
+            };
+        };
+    };
+    backend_activity_api_get_copy_throttle: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["CopyThrottleSchema"];
+                };
+            };
+        };
+    };
+    backend_activity_api_set_copy_throttle: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["CopyThrottleSchema"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["CopyThrottleSchema"];
+                };
             };
         };
     };
@@ -772,6 +1627,32 @@ export interface operations {
             };
         };
     };
+    backend_activity_api_retry_project_activities: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path: {
+                project_id: number;
+            };
+            cookie?: never;
+        };
+        requestBody: {
+            content: {
+                "application/json": components["schemas"]["RetryActivitiesForm"];
+            };
+        };
+        responses: {
+            /** @description OK */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["RetryActivitiesSchema"];
+                };
+            };
+        };
+    };
     backend_activity_api_delete_activities: {
         parameters: {
             query?: never;